@@ -34,6 +34,11 @@ const mysekai_guildId = process.env.MYSEKAI_GUILD_ID
 const mysekai_titleChannelId = process.env.MYSEKAI_TITLE_CHANNEL
 // OCR APIエンドポイント
 const OCR_API_URL = 'http://python-result-calc:53744/ocr';
+// /ocr/batch に1リクエストでまとめる画像数（サーバーの MAX_BATCH_IMAGES 以下にする）
+// サーバーは1リクエストの画像を順に処理するため、多すぎると gunicorn のタイムアウトを超える
+const OCR_BATCH_MAX_IMAGES = 3;
+// バッチが長引いたら打ち切って画像ごとの /ocr に切り替えるまでの時間（gunicorn の timeout 120秒より短く）
+const OCR_BATCH_TIMEOUT_MS = 60000;
 
 const mentionDeveloper = process.env.MENTION_USER_USUALLY_YOU
 
@@ -541,17 +546,69 @@ async function fetchOCRResult(attachmentUrl, options = {}) {
 }
 
 /**
- * 複数画像に対して並列OCR処理を実行
+ * 複数画像をまとめて /ocr/batch に送る（モデル・パラメータ準備を1回で共有）
+ * 戻り値は画像ごとの /ocr と同じ形式のレスポンス配列
+ */
+async function fetchOCRBatchResult(attachmentUrls, options = {}) {
+  const { isDebug = false } = options;
+  const buffers = await Promise.all(attachmentUrls.map(async url => {
+    const response = await fetch(url);
+    return Buffer.from(await response.arrayBuffer());
+  }));
+
+  const form = new FormData();
+  buffers.forEach((buffer, i) => {
+    form.append('images', buffer, { filename: `image${i}.png`, contentType: 'image/png' });
+  });
+  form.append('debug', isDebug ? '1' : '0');
+
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), OCR_BATCH_TIMEOUT_MS);
+  let ocrRes;
+  let body;
+  try {
+    ocrRes = await fetch(`${OCR_API_URL}/batch`, {
+      method: 'POST',
+      body: form,
+      headers: form.getHeaders(),
+      signal: controller.signal
+    });
+    body = await ocrRes.json();
+  } finally {
+    clearTimeout(timer);
+  }
+  if (!ocrRes.ok || !Array.isArray(body.images)) {
+    throw new Error(body.error || `batch OCR failed (status ${ocrRes.status})`);
+  }
+  return body.images.map(result => (result.error ? { ...result, results: [] } : result));
+}
+
+/**
+ * 複数画像に対してOCR処理を実行
+ * 2枚以上は OCR_BATCH_MAX_IMAGES 枚ずつ /ocr/batch にまとめ、失敗したグループは画像ごとの並列処理に戻す
  */
 async function processMultipleOCR(attachmentUrls, options = {}) {
-  const promises = attachmentUrls.map(url => 
-    fetchOCRResult(url, options).catch(err => ({
-      error: 'API通信エラー',
-      details: err.message,
-      results: []
-    }))
-  );
-  return Promise.all(promises);
+  const groups = [];
+  for (let i = 0; i < attachmentUrls.length; i += OCR_BATCH_MAX_IMAGES) {
+    groups.push(attachmentUrls.slice(i, i + OCR_BATCH_MAX_IMAGES));
+  }
+  const groupResults = await Promise.all(groups.map(async group => {
+    if (group.length >= 2) {
+      try {
+        return await fetchOCRBatchResult(group, options);
+      } catch (err) {
+        console.warn('バッチOCRに失敗したため個別処理に切り替えます:', err.message);
+      }
+    }
+    return Promise.all(group.map(url =>
+      fetchOCRResult(url, options).catch(err => ({
+        error: 'API通信エラー',
+        details: err.message,
+        results: []
+      }))
+    ));
+  }));
+  return groupResults.flat();
 }
 
 /**
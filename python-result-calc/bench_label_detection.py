@@ -0,0 +1,173 @@
+"""
+PERFECT / MISS ラベル検出のベンチマーク（テンプレートマッチング vs Tesseract）。
+
+    python bench_label_detection.py --build-templates 5
+    python bench_label_detection.py --corpus /app/data/warmup
+
+Tesseract のみの経路で検出した位置を正解とみなし、テンプレートマッチング経路の
+レイテンシ、確信度ありで採用された割合、正解ラベルに対する再現率を JSON で出力する。
+--build-templates N を付けると、先頭 N 枚の Tesseract 検出結果から参照テンプレートを作る。
+テンプレートの切り出し元になった画像（ファイル名で判定）は評価から除く。
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import result_calc
+from label_detection import (
+    TEMPLATE_DIR,
+    LabelDetector,
+    TemplateLabelMatcher,
+    _iou,
+    save_templates,
+)
+
+
+def list_images(corpus):
+    files = []
+    for ext in ["*.png", "*.PNG", "*.jpg", "*.JPG", "*.jpeg", "*.JPEG"]:
+        files.extend(glob.glob(os.path.join(corpus, ext)))
+    return sorted(files)
+
+
+def latency_summary(values):
+    if not values:
+        return {"mean_ms": None, "p95_ms": None}
+    arr = np.array(values) * 1000
+    return {
+        "mean_ms": round(float(arr.mean()), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+    }
+
+
+def template_sources(template_dir):
+    """テンプレート（{label}_{元画像名}_{i}.png）の切り出し元の画像名の集合。"""
+    sources = set()
+    for path in glob.glob(os.path.join(template_dir, "*.png")):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        label, _, rest = stem.partition("_")
+        prefix, _, index = rest.rpartition("_")
+        if label in ("perfect", "miss") and prefix and index.isdigit():
+            sources.add(prefix)
+    return sources
+
+
+def recall(reference, found):
+    if not reference:
+        return None
+    hits = sum(1 for ref in reference if any(_iou(ref, f) >= 0.5 for f in found))
+    return hits / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default="/app/data/warmup")
+    parser.add_argument("--templates", default=TEMPLATE_DIR)
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--build-templates", type=int, default=0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    files = list_images(args.corpus)
+    if args.limit:
+        files = files[: args.limit]
+
+    images = []
+    for path in files:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            images.append((path, result_calc.normalize_result_image(img)))
+
+    # 正解（Tesseract のみの経路）
+    reference = []
+    tesseract_times = []
+    tesseract_calls = []
+    for path, img in images:
+        detector = LabelDetector(use_templates=False)
+        start = time.perf_counter()
+        perfects, misses = result_calc.find_perfect_miss_positions(img, detector)
+        tesseract_times.append(time.perf_counter() - start)
+        tesseract_calls.append(detector.finish())
+        reference.append((perfects, misses))
+
+    if args.build_templates:
+        built = 0
+        for (path, img), (perfects, misses) in zip(images, reference):
+            if built >= args.build_templates:
+                break
+            if perfects and len(perfects) == len(misses):
+                prefix = os.path.splitext(os.path.basename(path))[0]
+                save_templates(img, perfects, misses, args.templates, prefix=prefix)
+                built += 1
+        print(f"built templates from {built} images into {args.templates}")
+
+    matcher = TemplateLabelMatcher(template_dir=args.templates)
+    if not matcher.available():
+        print(f"no templates in {args.templates}; run with --build-templates")
+        return
+
+    # テンプレートを作った画像で評価すると再現率が高く出るので除く
+    sources = template_sources(args.templates)
+    evaluation = [
+        (image, ref)
+        for image, ref in zip(images, reference)
+        if os.path.splitext(os.path.basename(image[0]))[0] not in sources
+    ]
+    if not evaluation:
+        print("every image was used to build templates; nothing left to evaluate")
+        return
+
+    template_times = []
+    pipeline_times = []
+    accepted = 0
+    recalls = []
+    for (path, img), (ref_perfects, ref_misses) in evaluation:
+        start = time.perf_counter()
+        perfects, misses, confident = matcher.detect(img)
+        template_times.append(time.perf_counter() - start)
+        if confident:
+            accepted += 1
+            r = recall(ref_perfects + ref_misses, perfects + misses)
+            if r is not None:
+                recalls.append(r)
+
+        detector = LabelDetector(matcher=matcher, use_templates=True)
+        start = time.perf_counter()
+        result_calc.find_perfect_miss_positions(img, detector)
+        pipeline_times.append(time.perf_counter() - start)
+        detector.finish()
+
+    report = {
+        "images": len(images),
+        "held_out_template_sources": len(images) - len(evaluation),
+        "evaluated": len(evaluation),
+        "tesseract_only": {
+            **latency_summary(tesseract_times),
+            "mean_tesseract_calls": (
+                round(float(np.mean(tesseract_calls)), 2) if tesseract_calls else None
+            ),
+        },
+        "template_match": {
+            **latency_summary(template_times),
+            "accept_rate": round(accepted / len(evaluation), 3),
+            "recall_when_accepted": (
+                round(float(np.mean(recalls)), 3) if recalls else None
+            ),
+        },
+        "template_then_tesseract": latency_summary(pipeline_times),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
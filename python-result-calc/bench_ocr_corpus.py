@@ -0,0 +1,375 @@
+"""
+ウォームアップ画像（ファイル名が正解の判定数）を使った /ocr の回帰ベンチマーク。
+
+    python bench_ocr_corpus.py --corpus /app/data/warmup --output report.json
+    python bench_ocr_corpus.py --engines record --fixtures fixtures.json
+    python bench_ocr_corpus.py --engines replay --fixtures fixtures.json \\
+        --baseline report_prev.json
+
+画像ごとに /ocr と同じ処理（アップロードのデコードから JSON 応答まで）を実行し、
+正解率、1 枚あたりのレイテンシ（平均 / p95）、ピーク RSS、Tesseract / EasyOCR の
+呼び出し回数を JSON で出力する。正解はファイル名 perfect-great-good-bad-miss の
+5 値で、いずれかのプレイヤーの判定数が一致すれば正解とする。
+
+--engines record は実際の OCR エンジンの出力を入力画像のハッシュごとに --fixtures へ
+保存し、--engines replay はその記録から応答する（EasyOCR のモデルも Tesseract も
+ネットワークも不要）。前処理が変わって記録にない画像が来た場合は空の結果を返し、
+replay_misses として数える。--baseline を付けると前回のレポートとの差分も出力する。
+
+前処理のパラメータは候補パラメータの DB から選ばれるため、record では実行前の DB
+（--param-db、省略時は本番の DB）の内容を --fixtures に一緒に保存し、replay では
+それを一時 DB に復元して使う（チューナーによる DB の更新で結果が変わらないように）。
+record / replay の間は元の DB ではなく一時ディレクトリのコピーに読み書きする。
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+JUDGEMENTS = ("perfect", "great", "good", "bad", "miss")
+
+
+def image_digest(images):
+    h = hashlib.blake2b(digest_size=16)
+    for img in images:
+        arr = np.ascontiguousarray(img)
+        h.update(repr((arr.shape, arr.dtype.str)).encode())
+        h.update(arr.data)
+    return h.hexdigest()
+
+
+def to_jsonable(obj):
+    if isinstance(obj, dict):
+        return {k: to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return obj
+
+
+class EngineCalls:
+    """OCR エンジンの呼び出し回数と、record / replay 用の記録を持つ。"""
+
+    def __init__(self, mode, fixtures=None):
+        self.mode = mode
+        self.fixtures = fixtures if fixtures is not None else {}
+        self.counts = {}
+        self.replay_misses = 0
+
+    def count(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def call(self, key, run):
+        if self.mode == "replay":
+            if key in self.fixtures:
+                return self.fixtures[key]
+            self.replay_misses += 1
+            return None
+        result = run()
+        if self.mode == "record":
+            self.fixtures[key] = to_jsonable(result)
+        return result
+
+
+class CountingReader:
+    """EasyOCR Reader の代わりに置き、呼び出しを数えて record / replay する。"""
+
+    def __init__(self, calls, langs, reader=None):
+        self.calls = calls
+        self.langs = list(langs)
+        self.reader = reader
+
+    def _key(self, method, images, detail):
+        return (
+            f"easyocr:{method}:{'+'.join(self.langs)}:{detail}:{image_digest(images)}"
+        )
+
+    def readtext(self, image, detail=1, **kwargs):
+        self.calls.count("easyocr_readtext")
+        result = self.calls.call(
+            self._key("readtext", [image], detail),
+            lambda: self.reader.readtext(image, detail=detail, **kwargs),
+        )
+        return result if result is not None else []
+
+    def readtext_batched(self, images, detail=1, **kwargs):
+        self.calls.count("easyocr_readtext_batched")
+        result = self.calls.call(
+            self._key("readtext_batched", images, detail),
+            lambda: self.reader.readtext_batched(images, detail=detail, **kwargs),
+        )
+        return result if result is not None else [[] for _ in images]
+
+
+def install_engines(calls):
+    """
+    result_calc を import する前に呼ぶ。replay では easyocr / pytesseract を
+    読み込まずに済むよう、ダミーのモジュールを差し込む。
+    """
+    if calls.mode == "replay":
+        easyocr = types.ModuleType("easyocr")
+        easyocr.Reader = lambda langs, gpu=False: CountingReader(calls, langs)
+        sys.modules["easyocr"] = easyocr
+        if importlib.util.find_spec("pytesseract") is None:
+            stub = types.ModuleType("pytesseract")
+            stub.Output = types.SimpleNamespace(DICT="dict")
+            sys.modules["pytesseract"] = stub
+
+    import pytesseract
+
+    import ocr_models
+
+    image_to_data = getattr(pytesseract, "image_to_data", None)
+
+    def counting_image_to_data(img, *args, **kwargs):
+        calls.count("tesseract_image_to_data")
+        result = calls.call(
+            f"tesseract:image_to_data:{image_digest([img])}",
+            lambda: image_to_data(img, *args, **kwargs),
+        )
+        return result if result is not None else {"text": []}
+
+    pytesseract.image_to_data = counting_image_to_data
+
+    if calls.mode != "replay":
+        registry_load = ocr_models.registry._load
+
+        def counting_load(key):
+            return CountingReader(calls, key[0], registry_load(key))
+
+        ocr_models.registry._load = counting_load
+
+
+def dump_param_db(path):
+    """候補パラメータの DB を SQL 文のリストにする（fixtures に保存する用）。"""
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return list(source.iterdump())
+    finally:
+        source.close()
+
+
+def restore_param_db(statements, path):
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript("\n".join(statements))
+    finally:
+        conn.close()
+
+
+def peak_rss_mb():
+    try:
+        import resource
+
+        # Linux では KB 単位
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except Exception:
+        return None
+
+
+def latency_summary(values):
+    if not values:
+        return {"mean_ms": None, "p95_ms": None, "max_ms": None}
+    arr = np.array(values) * 1000
+    return {
+        "mean_ms": round(float(arr.mean()), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "max_ms": round(float(arr.max()), 2),
+    }
+
+
+def player_counts(result):
+    if "error" in result or not all(k in result for k in JUDGEMENTS):
+        return None
+    return [result[k] for k in JUDGEMENTS]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """数値の項目について baseline からの差分（今回 - 前回）を返す。"""
+    delta = {}
+    for section in ("summary", "latency", "calls"):
+        current, previous = report.get(section, {}), baseline.get(section, {})
+        for key, value in current.items():
+            old = previous.get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                delta[f"{section}.{key}"] = round(value - old, 4)
+    return {"baseline_revision": baseline.get("revision"), "delta": delta}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default="/app/data/warmup")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument(
+        "--engines", choices=["real", "record", "replay"], default="real"
+    )
+    parser.add_argument("--fixtures", default="")
+    parser.add_argument(
+        "--param-db",
+        default="",
+        help="候補パラメータの SQLite（省略時は本番と同じ。replay では fixtures の記録）",
+    )
+    parser.add_argument("--output", default="")
+    parser.add_argument("--baseline", default="")
+    args = parser.parse_args()
+    if args.engines != "real" and not args.fixtures:
+        parser.error("--engines record / replay には --fixtures が必要です")
+
+    fixtures = {}
+    recorded_param_db = None
+    if args.engines == "replay":
+        with open(args.fixtures, encoding="utf-8") as f:
+            fixtures = json.load(f)
+        recorded_param_db = fixtures.get("param_db")
+        fixtures = fixtures.get("calls", {})
+        if recorded_param_db is None and not args.param_db:
+            parser.error(
+                "--fixtures に候補パラメータの記録がありません。"
+                "記録時と同じ DB を --param-db で指定してください"
+            )
+
+    # /metrics や負荷情報の書き出しで本番の共有ディレクトリを汚さない
+    scratch = tempfile.mkdtemp(prefix="bench_ocr_corpus_")
+    os.environ.setdefault("OCR_METRICS_DIR", os.path.join(scratch, "metrics"))
+    os.environ.setdefault("OCR_LOAD_DIR", os.path.join(scratch, "ocr_load"))
+
+    calls = EngineCalls(args.engines, fixtures)
+    install_engines(calls)
+    rss_before_import = peak_rss_mb()
+
+    import result_calc
+    from param_store import PARAM_DB_PATH
+    from param_store import store as param_store
+    from warmup_corpus import list_corpus_files, parse_expected
+
+    param_db_path = args.param_db
+    param_db_statements = None
+    if args.engines == "record" or (args.engines == "replay" and args.param_db):
+        param_db_statements = dump_param_db(args.param_db or PARAM_DB_PATH)
+    elif args.engines == "replay":
+        param_db_statements = recorded_param_db
+    if param_db_statements is not None:
+        param_db_path = os.path.join(scratch, "params.sqlite")
+        restore_param_db(param_db_statements, param_db_path)
+    if param_db_path:
+        param_store.db_path = param_db_path
+        param_store.invalidate()
+
+    files = list_corpus_files(args.corpus)
+    if args.limit:
+        files = files[: args.limit]
+
+    client = result_calc.app.test_client()
+    latencies = []
+    images = []
+    counts = {"images": 0, "correct": 0, "no_players": 0, "errors": 0, "skipped": 0}
+    for path in files:
+        name = os.path.basename(path)
+        try:
+            expected = parse_expected(path)
+        except ValueError:
+            counts["skipped"] += 1
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        before = dict(calls.counts)
+        start = time.perf_counter()
+        response = client.post(
+            "/ocr",
+            data={"image": (io.BytesIO(data), name)},
+            content_type="multipart/form-data",
+        )
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        counts["images"] += 1
+
+        body = response.get_json(silent=True) or {}
+        results = body.get("results", [])
+        recognized = [c for c in map(player_counts, results) if c is not None]
+        correct = expected in recognized
+        counts["correct"] += int(correct)
+        counts["no_players"] += int(not results)
+        counts["errors"] += int(response.status_code != 200)
+        images.append(
+            {
+                "file": name,
+                "expected": expected,
+                "recognized": recognized,
+                "correct": correct,
+                "status": response.status_code,
+                "latency_ms": round(elapsed * 1000, 2),
+                "calls": {
+                    k: v - before.get(k, 0)
+                    for k, v in calls.counts.items()
+                    if v != before.get(k, 0)
+                },
+            }
+        )
+
+    report = {
+        "revision": git_revision(),
+        "engines": args.engines,
+        "corpus": args.corpus,
+        "summary": {
+            **counts,
+            "accuracy": round(counts["correct"] / counts["images"], 4)
+            if counts["images"]
+            else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_before_import_mb": rss_before_import,
+        },
+        "latency": latency_summary(latencies),
+        "calls": {**calls.counts, "replay_misses": calls.replay_misses},
+        "images": images,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    if args.engines == "record":
+        with open(args.fixtures, "w", encoding="utf-8") as f:
+            data = {"param_db": param_db_statements, "calls": calls.fixtures}
+            json.dump(data, f, ensure_ascii=False)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    summary = {k: report[k] for k in ("revision", "summary", "latency", "calls")}
+    if "comparison" in report:
+        summary["comparison"] = report["comparison"]
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+gunicorn の起動時間とワーカーごとのメモリを、プリロードあり/なしで比較するベンチマーク。
+
+    python bench_preload_memory.py --workers 2
+
+各モードで gunicorn を起動し、全ワーカーが /models に応答してから
+ワーカーごとの RSS / PSS / USS を /proc から読み取って JSON で出力する。
+RSS は共有ページも数えるため、プリロードの効果は PSS と USS に表れる。
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_memory_kb(pid):
+    """smaps_rollup から RSS / PSS / USS (Private_*) を KB で返す。"""
+    mem = {"rss": 0, "pss": 0, "uss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 2:
+                    continue
+                key, val = parts[0], parts[1]
+                if key == "Rss:":
+                    mem["rss"] = int(val)
+                elif key == "Pss:":
+                    mem["pss"] = int(val)
+                elif key in ("Private_Clean:", "Private_Dirty:"):
+                    mem["uss"] += int(val)
+    except OSError:
+        pass
+    return mem
+
+
+def child_pids(ppid):
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == ppid:
+                pids.append(int(name))
+        except (OSError, IndexError, ValueError):
+            continue
+    return sorted(pids)
+
+
+def wait_ready(port, workers, master_pid, timeout):
+    deadline = time.time() + timeout
+    url = f"http://127.0.0.1:{port}/models"
+    while time.time() < deadline:
+        if len(child_pids(master_pid)) >= workers:
+            try:
+                with urllib.request.urlopen(url, timeout=5) as res:
+                    if res.status == 200:
+                        return True
+            except Exception:
+                pass
+        time.sleep(0.5)
+    return False
+
+
+def run_mode(preload, args):
+    env = dict(os.environ)
+    env["GUNICORN_WORKERS"] = str(args.workers)
+    env["GUNICORN_PRELOAD"] = "1" if preload else "0"
+    env["OCR_EAGER_LOAD"] = "0" if preload else "1"
+    cmd = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "-b",
+        f"127.0.0.1:{args.port}",
+        "--config",
+        "./gunicorn_conf.py",
+        "result_calc:app",
+    ]
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ready = wait_ready(args.port, args.workers, proc.pid, args.timeout)
+        startup_seconds = time.perf_counter() - start
+        # ワーカー側の遅延ロードや GC が落ち着くまで少し待つ
+        time.sleep(args.settle)
+        master = read_memory_kb(proc.pid)
+        workers = [
+            {"pid": pid, **read_memory_kb(pid)} for pid in child_pids(proc.pid)
+        ]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    n = len(workers) or 1
+    return {
+        "preload": preload,
+        "ready": ready,
+        "startup_seconds": round(startup_seconds, 2),
+        "master_kb": master,
+        "workers_kb": workers,
+        "avg_worker_rss_mb": round(sum(w["rss"] for w in workers) / n / 1024, 1),
+        "avg_worker_pss_mb": round(sum(w["pss"] for w in workers) / n / 1024, 1),
+        "avg_worker_uss_mb": round(sum(w["uss"] for w in workers) / n / 1024, 1),
+        "total_pss_mb": round(
+            (master["pss"] + sum(w["pss"] for w in workers)) / 1024, 1
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=53799)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--settle", type=float, default=5)
+    args = parser.parse_args()
+
+    report = [run_mode(False, args), run_mode(True, args)]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+判定数切り抜きの前処理マイクロベンチマーク（従来の 1 件ずつ処理 vs CropPreprocessor）。
+
+    python bench_preprocess.py --image crop.png --params 10 --repeat 50
+
+--image を省略すると合成画像を使う。両方の出力が一致することも確認する。
+resize_ratio には小数 1 桁の値のほか、丸めていない値と、丸めると同じになる近い値も混ぜる。
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from ocr_preprocess import CropPreprocessor
+
+
+def legacy_preprocess(image, threshold, blur_ksize, contrast, resize_ratio):
+    """変更前の preprocess_image_for_ocr と同じ処理（比較用）。"""
+    img = image.copy()
+    if resize_ratio != 1.0:
+        img = cv2.resize(
+            img, None, fx=resize_ratio, fy=resize_ratio, interpolation=cv2.INTER_LINEAR
+        )
+    hsv_image = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    lower_bg1 = np.array([100, 20, 90])
+    upper_bg1 = np.array([140, 50, 140])
+    lower_bg2 = np.array([130, 20, 70])
+    upper_bg2 = np.array([180, 50, 120])
+    mask_bg1 = cv2.inRange(hsv_image, lower_bg1, upper_bg1)
+    mask_bg2 = cv2.inRange(hsv_image, lower_bg2, upper_bg2)
+    combined_mask = cv2.bitwise_or(mask_bg1, mask_bg2)
+    result = cv2.bitwise_and(img, img, mask=cv2.bitwise_not(combined_mask))
+    result[combined_mask != 0] = [255, 255, 255]
+    gray_result = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
+    gray_result = cv2.convertScaleAbs(gray_result, alpha=contrast, beta=0)
+    _, thresh = cv2.threshold(gray_result, threshold, 255, cv2.THRESH_BINARY_INV)
+    if blur_ksize > 1:
+        return cv2.GaussianBlur(thresh, (blur_ksize, blur_ksize), 0)
+    return thresh
+
+
+def synthetic_crop(seed=0):
+    rng = np.random.default_rng(seed)
+    img = np.empty((260, 240, 3), dtype=np.uint8)
+    img[:] = (150, 110, 120)  # 背景色に近い紫
+    noise = rng.integers(0, 40, size=img.shape, dtype=np.uint8)
+    img = cv2.add(img, noise)
+    for i, text in enumerate(["1234", "56", "7", "0", "3"]):
+        cv2.putText(
+            img, text, (20, 45 + i * 48), cv2.FONT_HERSHEY_SIMPLEX, 1.3, (40, 40, 40), 3
+        )
+    return img
+
+
+def random_params(n, seed=0):
+    rng = np.random.default_rng(seed)
+    ratios = [0.8, 1.0, 1.2]
+    params = []
+    for i in range(n):
+        kind = i % 4
+        if kind < 2:
+            ratio = ratios[i % len(ratios)]
+        elif kind == 2:
+            ratio = float(rng.uniform(0.7, 1.3))
+        else:
+            # 小数 4 桁に丸めると直前の比率と同じになる値
+            ratio = params[-1]["resize_ratio"] + float(rng.uniform(-4e-5, 4e-5))
+        params.append(
+            {
+                "threshold": int(rng.integers(100, 220)),
+                "blur_ksize": int(rng.choice([1, 3, 5, 7, 9])),
+                "contrast": round(float(rng.uniform(0.6, 2.0)), 1),
+                "resize_ratio": ratio,
+            }
+        )
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", default="")
+    parser.add_argument("--params", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    crop = cv2.imread(args.image, cv2.IMREAD_COLOR) if args.image else None
+    if crop is None:
+        crop = synthetic_crop()
+    param_list = random_params(args.params)
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        legacy = [legacy_preprocess(crop, **p) for p in param_list]
+    legacy_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        engine = CropPreprocessor(crop).variants(param_list)
+    engine_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+    mismatched = sum(not np.array_equal(a, b) for a, b in zip(legacy, engine))
+    print(
+        json.dumps(
+            {
+                "crop_shape": list(crop.shape),
+                "param_sets": len(param_list),
+                "legacy_ms_per_crop": round(legacy_ms, 3),
+                "engine_ms_per_crop": round(engine_ms, 3),
+                "speedup": round(legacy_ms / engine_ms, 2) if engine_ms else None,
+                "identical_output": mismatched == 0,
+                "mismatched_outputs": mismatched,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
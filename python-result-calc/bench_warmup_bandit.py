@@ -0,0 +1,134 @@
+"""
+ウォームアップのパラメータ選択のベンチマーク（従来のリスト走査 vs WarmupBandit）。
+
+    python bench_warmup_bandit.py --sizes 1000 5000 20000 50000 --repeat 20
+
+合成した warmup_params の行数ごとに、1 画像あたりの選択時間を JSON で出力する。
+従来方式は画像ごとに全行を展開・走査していたので、その処理を 1 回分として測る。
+WarmupBandit は 1 ラウンドに 1 回の構築と、画像ごとの選択を分けて測る。
+"""
+
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+from warmup_bandit import WarmupBandit
+
+
+def synthetic_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        contrast = int(rng.integers(6, 21))
+        resize = int(rng.integers(6, 17))
+        total = int(rng.integers(1, 40))
+        success = int(rng.binomial(total, rng.uniform(0, 1)))
+        rows.append(
+            (
+                i + 1,
+                int(rng.integers(100, 220)),
+                int(rng.choice([1, 3, 5, 7, 9])),
+                (contrast % 10) * 10 + contrast // 10,
+                (resize % 10) * 10 + resize // 10,
+                int(rng.choice([0, 3, 5, 7, 9])),
+                int(rng.integers(0, 2)),
+                success,
+                total,
+            )
+        )
+    return rows
+
+
+def legacy_select(rows, rand_val):
+    """変更前の warmup_and_check_all_images と同じ選択処理（比較用）。"""
+    expanded_rows = []
+    for row in rows:
+        _, th, bl, c, r, gb, uc, success_count, total_count = row
+        if total_count == 0:
+            continue
+        success_rate = (success_count / total_count) * (
+            success_count / (success_count + 5)
+        )
+        expanded_rows.append(row)
+        if total_count >= 10 and success_rate > 0.6:
+            for dc in [-5, 0, 5]:
+                for dr in [-5, 0, 5]:
+                    if dc != 0 or dr != 0:
+                        expanded_rows.append(
+                            (row[0], th, bl, c + dc, r + dr, gb, uc) + row[7:]
+                        )
+    rows = expanded_rows
+    if rand_val < 0.2 and rows:
+        total_trials = sum(row[-1] for row in rows) or 1
+        best_score = -float("inf")
+        best_rows = []
+        for row in rows:
+            success_count, total_count = row[7], row[8]
+            if total_count == 0 or (success_count == 0 and total_count > 10):
+                continue
+            average = success_count / total_count
+            weight = success_count / (success_count + 5)
+            ucb_score = (
+                average * weight
+                + 1.0 / (1 + total_count)
+                + math.sqrt(2 * math.log(total_trials) / total_count)
+            )
+            if ucb_score > best_score:
+                best_score = ucb_score
+                best_rows = [row]
+            elif ucb_score == best_score:
+                best_rows.append(row)
+        return best_rows[np.random.randint(len(best_rows))] if best_rows else None
+    if rand_val < 0.6 and rows:
+        top_100 = sorted(rows, key=lambda r: r[8])[:100]
+        return top_100[np.random.randint(len(top_100))]
+    return None
+
+
+def per_call_ms(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round((time.perf_counter() - start) * 1000 / repeat, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 50000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    report = []
+    for n in args.sizes:
+        rows = synthetic_rows(n)
+        bandit = WarmupBandit.from_rows(rows)
+        report.append(
+            {
+                "rows": n,
+                "expanded_arms": bandit.expanded,
+                "legacy_ucb_ms": per_call_ms(
+                    lambda: legacy_select(rows, 0.1), args.repeat
+                ),
+                "legacy_low_count_ms": per_call_ms(
+                    lambda: legacy_select(rows, 0.3), args.repeat
+                ),
+                "bandit_build_ms": per_call_ms(
+                    lambda: WarmupBandit.from_rows(rows), args.repeat
+                ),
+                "bandit_ucb_ms": per_call_ms(bandit.select_ucb, args.repeat),
+                "bandit_thompson_ms": per_call_ms(bandit.select_thompson, args.repeat),
+                "bandit_low_count_ms": per_call_ms(
+                    bandit.select_least_tried, args.repeat
+                ),
+            }
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
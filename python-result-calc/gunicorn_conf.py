@@ -1,3 +1,4 @@
+import gc
 import os
 
 # Gunicorn configuration module. Values may be overridden via environment variables.
@@ -11,11 +12,22 @@ def _int_env(name, default):
 def _str_env(name, default):
     return os.environ.get(name, default)
 
+def _bool_env(name, default):
+    return _str_env(name, '1' if default else '0').lower() in ('1', 'true', 'yes', 'on')
+
 # Worker/process settings
 workers = _int_env('GUNICORN_WORKERS', 2)
 threads = _int_env('GUNICORN_THREADS', 4)
 worker_class = _str_env('GUNICORN_WORKER_CLASS', 'gthread')
 
+# Preload mode: import result_calc and load the OCR models in the master before
+# forking, so workers share the model weight pages copy-on-write.
+preload_app = _bool_env('GUNICORN_PRELOAD', False)
+
+# Without preload, load the models eagerly in each worker right after fork
+# (mainly for the startup/memory benchmark baseline; otherwise they load lazily).
+eager_worker_models = _bool_env('OCR_EAGER_LOAD', False)
+
 # Timeout settings (seconds)
 timeout = _int_env('GUNICORN_TIMEOUT', 120)
 graceful_timeout = _int_env('GUNICORN_GRACEFUL_TIMEOUT', 30)
@@ -25,19 +37,58 @@ loglevel = _str_env('GUNICORN_LOGLEVEL', 'info')
 
 # Bind address is provided on the gunicorn CLI; this file mainly exposes tuning params.
 
-def post_fork(server, worker):
-    """Called just after a worker has been forked."""
+def when_ready(server):
+    """Called in the master after the app is loaded, before workers are spawned."""
+    if not preload_app:
+        return
     try:
-        # Import here to avoid circular imports at config parse time.
         import result_calc
-        server.log.info("Initializing warmup DB and starting warmup thread in worker")
         try:
             result_calc.init_warmup_db()
         except Exception:
-            server.log.warning("init_warmup_db failed in post_fork")
+            server.log.warning("init_warmup_db failed in master")
+        stats = result_calc.preload_models()
+        server.log.info(f"Preloaded OCR models in master: {stats}")
+        # Move everything allocated so far into the permanent generation so the
+        # cyclic GC in workers does not touch (and un-share) those pages.
+        gc.freeze()
+    except Exception as e:
+        server.log.warning(f"Could not preload OCR models in master: {e}")
+
+def post_fork(server, worker):
+    """Called just after a worker has been forked."""
+    try:
+        # Import here to avoid circular imports at config parse time.
+        import result_calc
+        if not preload_app:
+            server.log.info("Initializing warmup DB in worker")
+            try:
+                result_calc.init_warmup_db()
+            except Exception:
+                server.log.warning("init_warmup_db failed in post_fork")
+            if eager_worker_models:
+                try:
+                    result_calc.preload_models()
+                except Exception:
+                    server.log.warning("preload_models failed in post_fork")
+        if not result_calc.warmup_runs_in_workers():
+            # The tuner process (python -m result_calc tune) owns warmup; workers
+            # only read the top parameters it publishes to the parameter store.
+            return
+        server.log.info("Starting warmup thread in worker")
         try:
             result_calc.start_warmup_thread()
         except Exception:
             server.log.warning("start_warmup_thread failed in post_fork")
     except Exception as e:
         server.log.warning(f"Could not start warmup in worker: {e}")
+
+def worker_exit(server, worker):
+    """Called in the worker just before it exits."""
+    try:
+        # Metrics are flushed in batches; write out whatever is still pending so
+        # the counts are folded into the retired totals once this pid is gone.
+        from ocr_metrics import registry
+        registry.publish()
+    except Exception as e:
+        server.log.warning(f"Could not flush metrics on worker exit: {e}")
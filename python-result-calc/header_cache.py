@@ -0,0 +1,188 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from ocr_metrics import header_cache_total
+
+# 0 でキャッシュ無効
+HEADER_CACHE_SIZE = int(os.environ.get("HEADER_CACHE_SIZE", "256"))
+# 同じ画像とみなす、帯ごとのハミング距離の上限（64 ビット中）
+HEADER_CACHE_MAX_DISTANCE = int(os.environ.get("HEADER_CACHE_MAX_DISTANCE", "4"))
+# ヘッダーを縦に分割する帯の数。画像全体ではなく帯ごとにハッシュを取って比較する
+HASH_STRIPS = 8
+HASH_SIZE = 32
+HASH_LOW_FREQ = 8
+# 難易度のラベル・レベルの数字の領域で同じとみなすハミング距離の上限。難易度のラベルは
+# 小さい文字なので拡大縮小で数ビット変わる（別の難易度なら 20 ビット前後変わる）。
+# レベルの数字は 1 桁違いでも数ビットしか変わらないので完全一致を求める
+REGION_MAX_DISTANCE = (10, 0)
+
+
+def perceptual_hash(image, strips=HASH_STRIPS):
+    """
+    曲情報ブロックの pHash。縦の帯ごとにグレースケール 32x32 へ縮小して DCT を取り、
+    低周波 8x8 を中央値で 2 値化した 64 ビットを uint64 の配列（帯の数）で返す。
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    w = gray.shape[1]
+    bounds = np.linspace(0, w, strips + 1).astype(int)
+    hashes = np.zeros(strips, dtype=np.uint64)
+    weights = np.uint64(1) << np.arange(64, dtype=np.uint64)
+    for i in range(strips):
+        strip = gray[:, bounds[i] : max(bounds[i + 1], bounds[i] + 1)]
+        small = cv2.resize(
+            strip, (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA
+        ).astype(np.float32)
+        low = cv2.dct(small)[:HASH_LOW_FREQ, :HASH_LOW_FREQ].ravel()
+        # 直流成分は明るさだけで決まるので中央値の計算から外す
+        bits = low > np.median(low[1:])
+        hashes[i] = np.bitwise_or.reduce(weights[bits]) if bits.any() else 0
+    return hashes
+
+
+def crop_fraction(image, box):
+    """画像サイズに対する割合 (x0, y0, x1, y1) で表した領域を切り出す。"""
+    h, w = image.shape[:2]
+    x0, y0 = int(box[0] * w), int(box[1] * h)
+    x1, y1 = max(round(box[2] * w), x0 + 1), max(round(box[3] * h), y0 + 1)
+    return image[y0:y1, x0:x1]
+
+
+def region_hash(image, boxes):
+    """
+    難易度のラベル・レベルの数字の領域ごとの pHash（1 帯）を並べた uint64 の配列。
+    切り出せない領域があれば None。
+    """
+    hashes = np.zeros(len(boxes), dtype=np.uint64)
+    for i, box in enumerate(boxes):
+        region = crop_fraction(image, box)
+        if region.size == 0:
+            return None
+        hashes[i] = perceptual_hash(region, strips=1)[0]
+    return hashes
+
+
+def _popcount(values):
+    return np.unpackbits(values.view(np.uint8).reshape(*values.shape, 8), axis=-1).sum(
+        axis=-1
+    )
+
+
+class HeaderCache:
+    """
+    曲情報ブロックの認識結果 (難易度, レベル, 曲名の OCR 文字列) を pHash で引く LRU。
+    イベント中は同じ曲・難易度のスクリーンショットが続くため、EasyOCR の 2 パス
+    （日本語モデルを含む）を省ける。すべての帯の距離が max_distance 以下で、
+    さらに難易度のラベルとレベルの数字の領域のハッシュがそれぞれ region_max_distance
+    以内で一致すれば同じヘッダーとみなす（難易度やレベルだけ違うヘッダーは全体の
+    ハッシュでは数ビットしか変わらないため）。
+    曲名の照合先が変わるので musics.json が更新されたら
+    (catalog_version() が変わったら) 全件捨てる。
+    """
+
+    def __init__(
+        self,
+        catalog_version,
+        max_entries=HEADER_CACHE_SIZE,
+        max_distance=HEADER_CACHE_MAX_DISTANCE,
+        region_max_distance=REGION_MAX_DISTANCE,
+    ):
+        self.catalog_version = catalog_version
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.region_max_distance = np.array(region_max_distance)
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _check_version(self):
+        version = self.catalog_version()
+        if version != self._version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+                logging.info("[HeaderCache] musics.json が更新されたため破棄します")
+            self._entries.clear()
+            self._version = version
+
+    def _find(self, key, image):
+        """
+        全体のハッシュが近いエントリを距離の小さい順に調べ、難易度・レベルの領域の
+        ハッシュも近い最初のものを返す。エントリのキーは (全体, 領域) のハッシュ。
+        """
+        if not self._entries or self.max_distance < 0:
+            return None
+        keys = list(self._entries)
+        stored = np.frombuffer(b"".join(k[0] for k in keys), dtype=np.uint64)
+        stored = stored.reshape(len(keys), -1)
+        query = np.frombuffer(key, dtype=np.uint64)
+        distances = _popcount(stored ^ query)
+        matches = np.flatnonzero((distances <= self.max_distance).all(axis=1))
+        order = matches[np.argsort(distances[matches].sum(axis=1), kind="stable")]
+        for i in order:
+            entry_key = keys[int(i)]
+            _, boxes = self._entries[entry_key]
+            digest = region_hash(image, boxes)
+            if digest is None:
+                continue
+            stored_digest = np.frombuffer(entry_key[1], dtype=np.uint64)
+            if (_popcount(digest ^ stored_digest) <= self.region_max_distance).all():
+                return entry_key
+        return None
+
+    def get(self, image):
+        """キャッシュにあれば (キー, 結果)、なければ (キー, None) を返す。"""
+        if not self.enabled or image.size == 0:
+            return None, None
+        key = perceptual_hash(image).tobytes()
+        with self._lock:
+            self._check_version()
+            found = self._find(key, image)
+            if found is None:
+                self._stats["misses"] += 1
+                result = None
+            else:
+                self._entries.move_to_end(found)
+                self._stats["hits"] += 1
+                result = self._entries[found][0]
+        header_cache_total.inc(result="miss" if result is None else "hit")
+        return key, result
+
+    def put(self, key, image, result, boxes):
+        """
+        boxes は (難易度のラベル, レベルの数字) の領域（image のサイズに対する割合
+        (x0, y0, x1, y1)）。None なら照合できないのでキャッシュしない。
+        """
+        if key is None or boxes is None:
+            return
+        digest = region_hash(image, boxes)
+        if digest is None:
+            return
+        with self._lock:
+            self._check_version()
+            entry_key = (key, digest.tobytes())
+            self._entries[entry_key] = (result, boxes)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 3) if total else None
+        return stats
@@ -0,0 +1,316 @@
+import glob
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytesseract
+
+from ocr_metrics import label_events_total
+
+TEMPLATE_DIR = os.environ.get("LABEL_TEMPLATE_DIR", "/app/data/label_templates")
+TEMPLATES_ENABLED = os.environ.get("LABEL_TEMPLATES", "1").lower() in ("1", "true")
+
+# テンプレートは横幅 TEMPLATE_WORK_WIDTH に縮小した画像上で切り出し・照合する
+TEMPLATE_WORK_WIDTH = 900
+LABELS = ("perfect", "miss")
+
+# プロセス全体の累計（/ocr やウォームアップをまたいで集計）
+_stats_lock = threading.Lock()
+_stats = {
+    "detections": 0,
+    "tesseract_calls": 0,
+    "cache_hits": 0,
+    "template_hits": 0,
+    "template_misses": 0,
+}
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _add_stats(**deltas):
+    with _stats_lock:
+        for key, val in deltas.items():
+            _stats[key] += val
+    for key, val in deltas.items():
+        label_events_total.inc(val, event=key)
+
+
+def parse_layout(details):
+    """
+    pytesseract.image_to_data の結果 1 回分から PERFECT / MISS の位置を取り出す。
+    「ALL PERFECT」は同じ行で直前の単語が ALL の PERFECT（または 1 語に連結されたもの）
+    として除外する。
+    """
+    texts = details["text"]
+    perfect_positions = []
+    miss_positions = []
+
+    def line_of(i):
+        return tuple(
+            details[k][i] if k in details else None
+            for k in ("block_num", "par_num", "line_num")
+        )
+
+    for i, word in enumerate(texts):
+        word_up = word.upper()
+        box = (
+            details["left"][i],
+            details["top"][i],
+            details["width"][i],
+            details["height"][i],
+        )
+        if "PERFECT" in word_up:
+            is_all_perfect = "ALL" in word_up or (
+                i > 0 and "ALL" in texts[i - 1].upper() and line_of(i - 1) == line_of(i)
+            )
+            if not is_all_perfect:
+                perfect_positions.append(box)
+        if "MISS" in word_up:
+            miss_positions.append(box)
+    return perfect_positions, miss_positions
+
+
+def _to_gray(img):
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def _covered(box, regions, min_ratio=0.5):
+    """box の面積の min_ratio 以上が regions のどれかと重なっているか。"""
+    x, y, w, h = box
+    area = w * h
+    for rx, ry, rw, rh in regions:
+        ix = max(0, min(x + w, rx + rw) - max(x, rx))
+        iy = max(0, min(y + h, ry + rh) - max(y, ry))
+        if area and ix * iy >= min_ratio * area:
+            return True
+    return False
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+class TemplateLabelMatcher:
+    """
+    PERFECT / MISS のラベル画像（ゲーム UI の固定グリフ）をマルチスケールの
+    テンプレートマッチングで探す。参照画像は template_dir の perfect*.png / miss*.png。
+    全ラベルが高い一致度で見つかり PERFECT と MISS が対になったときだけ
+    confident とし、それ以外は呼び出し側で Tesseract にフォールバックする。
+    """
+
+    def __init__(
+        self,
+        template_dir=TEMPLATE_DIR,
+        scales=(0.85, 0.92, 1.0, 1.08, 1.16),
+        match_threshold=0.7,
+        accept_threshold=0.8,
+        max_candidates=200,
+    ):
+        self.template_dir = template_dir
+        self.scales = scales
+        self.match_threshold = match_threshold
+        self.accept_threshold = accept_threshold
+        self.max_candidates = max_candidates
+        self._templates = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        templates = {label: [] for label in LABELS}
+        for label in LABELS:
+            for path in sorted(
+                glob.glob(os.path.join(self.template_dir, f"{label}*.png"))
+            ):
+                tpl = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+                if tpl is None or tpl.size == 0:
+                    logging.warning(f"[Template] 読み込み失敗: {path}")
+                    continue
+                # スケールごとのテンプレートは読み込み時に作っておく
+                for scale in self.scales:
+                    scaled = tpl
+                    if scale != 1.0:
+                        scaled = cv2.resize(
+                            tpl, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+                        )
+                    templates[label].append(scaled)
+        with self._lock:
+            self._templates = templates
+        return templates
+
+    def available(self):
+        if self._templates is None:
+            self.load()
+        return all(self._templates[label] for label in LABELS)
+
+    def _match_label(self, gray, label):
+        candidates = []
+        h_img, w_img = gray.shape[:2]
+        for tpl in self._templates[label]:
+            th, tw = tpl.shape[:2]
+            if th > h_img or tw > w_img:
+                continue
+            res = cv2.matchTemplate(gray, tpl, cv2.TM_CCOEFF_NORMED)
+            ys, xs = np.where(res >= self.match_threshold)
+            if len(xs) == 0:
+                continue
+            scores = res[ys, xs]
+            if len(scores) > self.max_candidates:
+                top = np.argpartition(scores, -self.max_candidates)[
+                    -self.max_candidates :
+                ]
+                ys, xs, scores = ys[top], xs[top], scores[top]
+            candidates.extend(
+                (float(sc), (int(x), int(y), tw, th))
+                for sc, x, y in zip(scores, xs, ys)
+            )
+        # 一致度の高い順に重なりを除去（NMS）
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        kept = []
+        for score, box in candidates:
+            if all(_iou(box, k[1]) < 0.3 for k in kept):
+                kept.append((score, box))
+        return kept
+
+    def detect(self, img):
+        """
+        (perfect_positions, miss_positions, confident) を返す。座標は入力画像基準で、
+        左から順（プレイヤー順）に並べる。
+        """
+        if not self.available():
+            return [], [], False
+        gray = _to_gray(img)
+        factor = TEMPLATE_WORK_WIDTH / gray.shape[1]
+        if factor != 1.0:
+            gray = cv2.resize(
+                gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA
+            )
+        perfects = self._match_label(gray, "perfect")
+        misses = self._match_label(gray, "miss")
+
+        def to_input_coords(box):
+            return tuple(int(round(v / factor)) for v in box)
+
+        perfects.sort(key=lambda c: c[1][0])
+        misses.sort(key=lambda c: c[1][0])
+        confident = (
+            len(perfects) > 0
+            and len(perfects) == len(misses)
+            and min(c[0] for c in perfects + misses) >= self.accept_threshold
+            and all(
+                m[1][1] > p[1][1] and abs(m[1][0] - p[1][0]) < p[1][2]
+                for p, m in zip(perfects, misses)
+            )
+        )
+        return (
+            [to_input_coords(c[1]) for c in perfects],
+            [to_input_coords(c[1]) for c in misses],
+            confident,
+        )
+
+
+def save_templates(img, perfect_positions, miss_positions, out_dir, prefix="ref"):
+    """検出済みのラベル位置から参照テンプレートを切り出して保存する。"""
+    os.makedirs(out_dir, exist_ok=True)
+    gray = _to_gray(img)
+    factor = TEMPLATE_WORK_WIDTH / gray.shape[1]
+    gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    saved = []
+    for label, positions in (("perfect", perfect_positions), ("miss", miss_positions)):
+        for i, (x, y, w, h) in enumerate(positions):
+            x0, y0 = int(x * factor), int(y * factor)
+            x1, y1 = int((x + w) * factor), int((y + h) * factor)
+            crop = gray[y0:y1, x0:x1]
+            if crop.size == 0:
+                continue
+            path = os.path.join(out_dir, f"{label}_{prefix}_{i}.png")
+            cv2.imwrite(path, crop)
+            saved.append(path)
+    return saved
+
+
+template_matcher = TemplateLabelMatcher()
+
+
+class LabelDetector:
+    """
+    1 枚の画像分の PERFECT / MISS 検出を受け持つ。
+    Tesseract のレイアウト解析は前処理の種類（variant）ごとに 1 回だけ行う。
+    見つけたラベルを黒塗りして探し直す代わりに exclude() で位置を登録し、
+    2 回目以降は解析済みの結果からその位置と重なる単語を除いて返す。
+    """
+
+    def __init__(self, matcher=None, use_templates=TEMPLATES_ENABLED):
+        self.tesseract_calls = 0
+        self.cache_hits = 0
+        self.template_hit = None
+        self.matcher = matcher if matcher is not None else template_matcher
+        self.use_templates = use_templates
+        self._layouts = {}
+        self._excluded = []
+
+    def match_templates(self, img):
+        """
+        テンプレートマッチングで確信度高く見つかれば (perfects, misses) を、
+        そうでなければ None を返す（Tesseract で検出し直す）。
+        """
+        if not self.use_templates:
+            return None
+        try:
+            if not self.matcher.available():
+                return None
+            perfects, misses, confident = self.matcher.detect(img)
+        except Exception as e:
+            logging.warning(f"[Template] マッチング失敗: {e}")
+            return None
+        self.template_hit = confident
+        if confident:
+            _add_stats(template_hits=1)
+            return perfects, misses
+        _add_stats(template_misses=1)
+        return None
+
+    def detect(self, variant, make_image):
+        """
+        variant の前処理をした画像（make_image() で作る）の PERFECT / MISS の位置。
+        解析済みの variant なら画像を作らずに前回の結果を使う。
+        """
+        layout = self._layouts.get(variant)
+        if layout is None:
+            details = pytesseract.image_to_data(
+                make_image(), output_type=pytesseract.Output.DICT
+            )
+            self.tesseract_calls += 1
+            _add_stats(tesseract_calls=1)
+            layout = parse_layout(details)
+            self._layouts[variant] = layout
+        else:
+            self.cache_hits += 1
+            _add_stats(cache_hits=1)
+        perfect_positions, miss_positions = layout
+        return (
+            [box for box in perfect_positions if not _covered(box, self._excluded)],
+            [box for box in miss_positions if not _covered(box, self._excluded)],
+        )
+
+    def exclude(self, positions):
+        """見つけたラベルの位置を、以降の detect() の結果から除く（黒塗りの代わり）。"""
+        self._excluded.extend(positions)
+
+    def finish(self):
+        """検出 1 件分の集計を確定し、このリクエストでの Tesseract 呼び出し回数を返す。"""
+        _add_stats(detections=1)
+        self._layouts.clear()
+        self._excluded.clear()
+        return self.tesseract_calls
@@ -0,0 +1,404 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+# 各プロセスのメトリクスを書き出すディレクトリ。/metrics は全ファイルを合算して返す
+# （gunicorn の各ワーカーと tuner プロセスの値をまとめるため）
+METRICS_DIR = os.environ.get("OCR_METRICS_DIR", "/app/data/metrics")
+# この期間更新のないファイルは終了したプロセスのものとみなす（同じホストのプロセスは
+# pid が存在しなければすぐに終了とみなす）。終了したプロセスの値は RETIRED_FILE に
+# 足し込んでから削除するので、合算した counter が減ることはない
+METRICS_RETENTION = 24 * 3600
+RETIRED_FILE = "retired.json"
+# リクエストごとではなく、この件数ごと・この秒数ごとにまとめて書き出す
+METRICS_FLUSH_REQUESTS = int(os.environ.get("OCR_METRICS_FLUSH_REQUESTS", "20"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("OCR_METRICS_FLUSH_INTERVAL", "10"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(k), v] for k, v in self._values.items()]
+        return {
+            "type": "counter",
+            "help": self.help,
+            "labels": list(self.labelnames),
+            "values": values,
+        }
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            values = [
+                [list(k), list(counts), total, count]
+                for k, (counts, total, count) in self._values.items()
+            ]
+        return {
+            "type": "histogram",
+            "help": self.help,
+            "labels": list(self.labelnames),
+            "buckets": list(self.buckets),
+            "values": values,
+        }
+
+
+def _merge(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                merged[name] = {**metric, "values": {}}
+                target = merged[name]
+            if metric.get("buckets") != target.get("buckets"):
+                continue
+            for value in metric["values"]:
+                key = tuple(value[0])
+                if metric["type"] == "counter":
+                    target["values"][key] = target["values"].get(key, 0) + value[1]
+                else:
+                    entry = target["values"].setdefault(
+                        key, [[0] * len(metric["buckets"]), 0.0, 0]
+                    )
+                    entry[0] = [a + b for a, b in zip(entry[0], value[1])]
+                    entry[1] += value[2]
+                    entry[2] += value[3]
+    return merged
+
+
+def _to_snapshot(merged):
+    """_merge() の結果をスナップショット（ファイルに書き出す形式）に戻す。"""
+    snapshot = {}
+    for name, metric in merged.items():
+        if metric["type"] == "counter":
+            values = [[list(k), v] for k, v in metric["values"].items()]
+        else:
+            values = [
+                [list(k), list(counts), total, count]
+                for k, (counts, total, count) in metric["values"].items()
+            ]
+        snapshot[name] = {**metric, "values": values}
+    return snapshot
+
+
+def _process_gone(name):
+    """<ホスト名>-<pid>.json が同じホストの終了したプロセスのものか。"""
+    host, _, pid = name[: -len(".json")].rpartition("-")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(snapshots):
+    """スナップショット（プロセスごと）を合算し、Prometheus のテキスト形式にする。"""
+    lines = []
+    for name, metric in sorted(_merge(snapshots).items()):
+        labelnames = metric["labels"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric["values"].items()):
+            if metric["type"] == "counter":
+                labels = _format_labels(labelnames, key)
+                lines.append(f"{name}{labels} {_format_value(value)}")
+                continue
+            counts, total, count = value
+            for bound, bucket_count in zip(metric["buckets"], counts):
+                labels = _format_labels(labelnames, key, [("le", bound)])
+                lines.append(f"{name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(labelnames, key, [("le", "+Inf")])
+            lines.append(f"{name}_bucket{labels} {count}")
+            labels = _format_labels(labelnames, key)
+            lines.append(f"{name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{name}_count{labels} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRegistry:
+    """
+    プロセス内のメトリクスをまとめ、METRICS_DIR/<ホスト名>-<pid>.json に書き出す。
+    collect() は全プロセス分のファイルと終了したプロセスの累計（RETIRED_FILE）を
+    合算した Prometheus テキストを返す。
+    """
+
+    def __init__(
+        self,
+        metrics_dir=METRICS_DIR,
+        flush_requests=METRICS_FLUSH_REQUESTS,
+        flush_interval=METRICS_FLUSH_INTERVAL,
+    ):
+        self.metrics_dir = metrics_dir
+        self.flush_requests = flush_requests
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._publish_failed = False
+        self._published_pid = None
+        self._pending = 0
+        self._flusher = None
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.setdefault(metric.name, metric)
+            return self._metrics[metric.name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def _file_path(self):
+        return os.path.join(
+            self.metrics_dir, f"{socket.gethostname()}-{os.getpid()}.json"
+        )
+
+    def _retire(self, paths):
+        """
+        終了したプロセスのファイルを RETIRED_FILE に足し込んで削除する。
+        複数のワーカーが同時に collect() しても二重に足さないようファイルロックを取る。
+        """
+        retired_path = os.path.join(self.metrics_dir, RETIRED_FILE)
+        with open(os.path.join(self.metrics_dir, ".retire.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = []
+            for path in paths:
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except FileNotFoundError:
+                    # 他のワーカーが先に足し込んだ
+                    continue
+                except (OSError, ValueError):
+                    # 読めないファイルは足し込めないので捨てる
+                    pass
+                os.remove(path)
+            if not snapshots:
+                return
+            try:
+                with open(retired_path) as f:
+                    snapshots.insert(0, json.load(f))
+            except FileNotFoundError:
+                pass
+            tmp_path = f"{retired_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(_to_snapshot(_merge(snapshots)), f)
+            os.replace(tmp_path, retired_path)
+
+    def publish(self):
+        path = self._file_path()
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            with self._publish_lock:
+                if self._published_pid != os.getpid():
+                    # 同じ名前のファイルは以前の同じ pid のプロセスのもの（コンテナの
+                    # 再起動など）なので、上書きする前に累計へ移す
+                    if os.path.exists(path):
+                        self._retire([path])
+                    self._published_pid = os.getpid()
+                with self._lock:
+                    self._pending = 0
+                with open(tmp_path, "w") as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            if not self._publish_failed:
+                logging.warning(f"[Metrics] メトリクスの書き出し失敗: {e}")
+                self._publish_failed = True
+            return False
+
+    def request_done(self):
+        """
+        リクエスト 1 件ごとに呼ぶ。flush_requests 件たまったらすぐに、それ以外は
+        バックグラウンドのスレッドが flush_interval 秒ごとに書き出す。
+        """
+        with self._lock:
+            self._pending += 1
+            flush_now = self._pending >= self.flush_requests
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+        if flush_now:
+            self.publish()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._pending:
+                self.publish()
+
+    def collect(self):
+        if not self.publish():
+            # 共有ディレクトリが使えない場合はこのプロセスの値だけ返す
+            return render([self.snapshot()])
+        now = time.time()
+        paths, gone = [], []
+        for name in os.listdir(self.metrics_dir):
+            if not name.endswith(".json") or name == RETIRED_FILE:
+                continue
+            path = os.path.join(self.metrics_dir, name)
+            try:
+                stale = now - os.path.getmtime(path) > METRICS_RETENTION
+            except OSError:
+                continue
+            if stale or _process_gone(name):
+                gone.append(path)
+            else:
+                paths.append(path)
+        if gone:
+            try:
+                self._retire(gone)
+            except OSError as e:
+                logging.warning(f"[Metrics] 終了したプロセスの集計に失敗: {e}")
+        snapshots = []
+        for path in [os.path.join(self.metrics_dir, RETIRED_FILE), *paths]:
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return render(snapshots)
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "ocr_stage_seconds",
+    "Time spent in each processing stage.",
+    ("scope", "stage"),
+)
+requests_total = registry.counter(
+    "ocr_requests_total", "OCR requests handled.", ("endpoint",)
+)
+images_total = registry.counter("ocr_images_total", "Screenshots processed by /ocr.")
+players_total = registry.counter(
+    "ocr_players_total", "Player score regions recognized.", ("result",)
+)
+player_attempts = registry.histogram(
+    "ocr_player_attempts",
+    "Candidate parameter sets tried per player.",
+    buckets=ATTEMPT_BUCKETS,
+)
+label_events_total = registry.counter(
+    "ocr_label_detection_events_total",
+    "PERFECT/MISS label detection events (tesseract_calls, cache_hits, ...).",
+    ("event",),
+)
+warmup_trials_total = registry.counter(
+    "warmup_trials_total", "Warmup parameter trials.", ("result",)
+)
+warmup_corpus_total = registry.counter(
+    "warmup_corpus_cache_total", "Warmup corpus cache lookups.", ("result",)
+)
+header_cache_total = registry.counter(
+    "ocr_header_cache_total", "Song header cache lookups.", ("result",)
+)
+
+
+class StageTimer:
+    """
+    段階ごとの所要時間を ocr_stage_seconds に記録し、同じ段階名の合計を
+    ミリ秒で保持する（debug=1 のレスポンスに付ける内訳用）。
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.timings = {}
+
+    def record(self, name, elapsed):
+        stage_seconds.observe(elapsed, scope=self.scope, stage=name)
+        self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def breakdown(self):
+        return {name: round(sec * 1000, 1) for name, sec in self.timings.items()}
+
+
+def timed(scope, stage):
+    """1 回分の段階を計測するだけのとき用（内訳は不要な場合）。"""
+    return StageTimer(scope).stage(stage)
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+
+import easyocr
+
+
+def get_rss_bytes():
+    """現在プロセスの常駐メモリ (RSS) をバイト数で返す。取得できなければ 0。"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        try:
+            import resource
+
+            # Linux では KB 単位（最大 RSS なので参考値）
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return 0
+
+
+class OCRModelRegistry:
+    """
+    EasyOCR Reader をプロセス内で共有するためのレジストリ。
+    (言語セット, GPU フラグ) をキーに遅延生成し、以後は同じインスタンスを返す。
+    """
+
+    def __init__(self, retries=3, retry_wait=5):
+        self._readers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._retries = retries
+        self._retry_wait = retry_wait
+
+    @staticmethod
+    def make_key(langs, gpu=False):
+        return (tuple(langs), bool(gpu))
+
+    def get(self, langs, gpu=False):
+        key = self.make_key(langs, gpu)
+        reader = self._readers.get(key)
+        if reader is not None:
+            return reader
+
+        # キーごとのロックで同じモデルの二重ロードを防ぐ（別キーは並行にロード可）
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            reader = self._readers.get(key)
+            if reader is None:
+                reader = self._load(key)
+                self._readers[key] = reader
+        return reader
+
+    def _load(self, key):
+        langs, gpu = key
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+        last_error = None
+        for _ in range(self._retries):
+            try:
+                reader = easyocr.Reader(list(langs), gpu=gpu)
+                break
+            except Exception as e:
+                last_error = e
+                logging.warning(f"[OCRModels] {langs} 初期化失敗、再試行します: {e}")
+                time.sleep(self._retry_wait)
+        else:
+            raise RuntimeError(
+                f"EasyOCR initialization failed after multiple attempts: {last_error}"
+            )
+        load_seconds = time.perf_counter() - start
+        rss_delta = max(0, get_rss_bytes() - rss_before)
+        self._stats[key] = {
+            "langs": list(langs),
+            "gpu": gpu,
+            "load_seconds": round(load_seconds, 3),
+            "rss_delta_mb": round(rss_delta / (1024 * 1024), 1),
+            "loaded_at": time.time(),
+        }
+        logging.info(
+            f"[OCRModels] {list(langs)} (gpu={gpu}) ロード完了: "
+            f"{load_seconds:.2f}s, RSS +{rss_delta / (1024 * 1024):.1f}MB"
+        )
+        return reader
+
+    def is_loaded(self, langs, gpu=False):
+        return self.make_key(langs, gpu) in self._readers
+
+    def stats(self):
+        """ロード済みモデルごとのロード時間と RSS 増分、およびプロセス全体の RSS。"""
+        return {
+            "models": [dict(s) for s in self._stats.values()],
+            "process_rss_mb": round(get_rss_bytes() / (1024 * 1024), 1),
+        }
+
+
+registry = OCRModelRegistry()
@@ -0,0 +1,163 @@
+import functools
+import threading
+
+import cv2
+import numpy as np
+
+# 判定数の背景色（HSV）。この範囲は白で塗りつぶしてから二値化する
+BG_RANGES = (
+    (np.array([100, 20, 90], dtype=np.uint8), np.array([140, 50, 140], dtype=np.uint8)),
+    (np.array([130, 20, 70], dtype=np.uint8), np.array([180, 50, 120], dtype=np.uint8)),
+)
+
+_GRAY_LEVELS = np.arange(256, dtype=np.float32)
+
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+
+# CLAHE オブジェクトは内部バッファを持つためスレッドごとに 1 つ作って使い回す
+_clahe_local = threading.local()
+
+
+def get_clahe():
+    clahe = getattr(_clahe_local, "clahe", None)
+    if clahe is None:
+        clahe = cv2.createCLAHE(
+            clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID
+        )
+        _clahe_local.clahe = clahe
+    return clahe
+
+
+@functools.lru_cache(maxsize=None)
+def gaussian_kernel(ksize):
+    """ksize ごとの 1 次元ガウシアンカーネル（分離フィルタ用）。"""
+    return cv2.getGaussianKernel(ksize, 0)
+
+
+def base_gray(image, resize_ratio):
+    """
+    リサイズ・背景除去・グレースケール化までを行う。
+    contrast / threshold / blur に依存しない段階で、同じ resize_ratio なら使い回せる。
+    """
+    img = image
+    if resize_ratio != 1.0:
+        img = cv2.resize(
+            img, None, fx=resize_ratio, fy=resize_ratio, interpolation=cv2.INTER_LINEAR
+        )
+    hsv_image = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    combined_mask = cv2.inRange(hsv_image, *BG_RANGES[0])
+    cv2.bitwise_or(combined_mask, cv2.inRange(hsv_image, *BG_RANGES[1]), combined_mask)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # 背景は白 (255) にする。白のグレー値は 255 なので OR で塗れる
+    cv2.bitwise_or(gray, combined_mask, gray)
+    return gray
+
+
+def apply_gray_filters(gray, gaussian_blur_ksize=0, use_clahe=False):
+    """
+    二値化前のグレー画像に CLAHE（局所コントラスト補正）とガウシアン平滑化をかける。
+    gaussian_blur_ksize が 1 以下なら平滑化しない。
+    """
+    if use_clahe:
+        gray = get_clahe().apply(gray)
+    if gaussian_blur_ksize > 1:
+        kernel = gaussian_kernel(int(gaussian_blur_ksize))
+        gray = cv2.sepFilter2D(gray, -1, kernel, kernel)
+    return gray
+
+
+def threshold_luts(contrasts, thresholds):
+    """
+    convertScaleAbs(alpha=contrast) → THRESH_BINARY_INV(threshold) を
+    画素値ごとの 256 要素 LUT にまとめたもの（パラメータ数 × 256）。
+    """
+    alphas = np.asarray(contrasts, dtype=np.float32)[:, None]
+    scaled = np.clip(np.rint(np.abs(_GRAY_LEVELS[None, :] * alphas)), 0, 255)
+    thresh = np.asarray(thresholds, dtype=np.float32)[:, None]
+    return np.where(scaled > thresh, 0, 255).astype(np.uint8)
+
+
+class CropPreprocessor:
+    """
+    1 つの切り抜き画像から、複数の前処理パラメータの結果をまとめて作る。
+    (resize_ratio, gaussian_blur_ksize, use_clahe) ごとの二値化前のグレー画像は
+    キャッシュし、contrast と threshold は
+    パラメータ分の LUT を 1 回の NumPy 演算で作ってから適用する。
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self._bases = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def filter_key(params):
+        """
+        二値化前の段階（resize・CLAHE・平滑化）が同じになるパラメータのキー。
+        resize_ratio は丸めずに比べる（近い比率でも cv2.resize の結果は変わるため）。
+        """
+        gaussian_blur_ksize = int(params.get("gaussian_blur_ksize") or 0)
+        return (
+            float(params["resize_ratio"]),
+            gaussian_blur_ksize if gaussian_blur_ksize > 1 else 0,
+            bool(params.get("use_clahe", False)),
+        )
+
+    def base(self, resize_ratio, gaussian_blur_ksize=0, use_clahe=False):
+        key = (
+            float(resize_ratio),
+            gaussian_blur_ksize if gaussian_blur_ksize > 1 else 0,
+            use_clahe,
+        )
+        gray = self._bases.get(key)
+        if gray is None:
+            if key[1:] == (0, False):
+                gray = base_gray(self.image, resize_ratio)
+            else:
+                gray = apply_gray_filters(
+                    self.base(resize_ratio), gaussian_blur_ksize, use_clahe
+                )
+            with self._lock:
+                self._bases[key] = gray
+        return gray
+
+    def variants(self, param_list):
+        """
+        param_list は preprocess_image_for_ocr と同じキーを持つ dict のリスト。
+        入力と同じ順で前処理済み画像（失敗時は None）を返す。
+        """
+        if self.image is None or self.image.size == 0:
+            return [None] * len(param_list)
+        outputs = [None] * len(param_list)
+        groups = {}
+        for i, params in enumerate(param_list):
+            groups.setdefault(self.filter_key(params), []).append(i)
+
+        for (ratio, gaussian_blur_ksize, use_clahe), indices in groups.items():
+            gray = self.base(ratio, gaussian_blur_ksize, use_clahe)
+            luts = threshold_luts(
+                [param_list[i]["contrast"] for i in indices],
+                [param_list[i]["threshold"] for i in indices],
+            )
+            # LUT は段差 1 つの関数なので、contrast と threshold が違っても同じ
+            # 二値画像になる組が多い。同じ LUT・同じ blur の組は 1 回だけ計算する
+            binaries = {}
+            blurred = {}
+            for row, i in enumerate(indices):
+                lut_key = luts[row].tobytes()
+                binary = binaries.get(lut_key)
+                if binary is None:
+                    binary = cv2.LUT(gray, luts[row])
+                    binaries[lut_key] = binary
+                blur_ksize = int(param_list[i]["blur_ksize"])
+                if blur_ksize > 1:
+                    key = (lut_key, blur_ksize)
+                    if key not in blurred:
+                        blurred[key] = cv2.GaussianBlur(
+                            binary, (blur_ksize, blur_ksize), 0
+                        )
+                    outputs[i] = blurred[key]
+                else:
+                    outputs[i] = binary
+        return outputs
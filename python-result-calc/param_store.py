@@ -0,0 +1,548 @@
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+PARAM_DB_PATH = "/app/data/warmup_success_params.sqlite"
+
+PARAM_COLUMNS = (
+    "threshold",
+    "blur",
+    "contrast_scaled",
+    "resize_ratio_scaled",
+    "gaussian_blur",
+    "use_clahe",
+)
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS warmup_params (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        threshold INTEGER,
+        blur INTEGER,
+        contrast_scaled INTEGER,
+        resize_ratio_scaled INTEGER,
+        gaussian_blur INTEGER,
+        use_clahe INTEGER,
+        success_count INTEGER DEFAULT 0,
+        total_count INTEGER DEFAULT 0,
+        UNIQUE(threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe)
+    )
+"""
+
+
+UPSERT_SQL = """
+    INSERT INTO warmup_params (
+        threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe, success_count, total_count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe) DO UPDATE SET
+        success_count = success_count + excluded.success_count,
+        total_count = total_count + excluded.total_count
+"""
+
+
+def _is_lock_error(e):
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+
+# PRAGMA user_version で管理するスキーマ／データのバージョン
+#   1: gaussian_blur / use_clahe が前処理に効いていなかった時期の行を統合
+#   2: スコア列・インデックス・集計テーブル (warmup_stats) とそれを保つトリガー
+SCHEMA_VERSION = 2
+
+# count_successful の既定値。warmup_stats.successful_rows はこの値で集計する
+SUCCESSFUL_MIN_COUNT = 2
+
+# 成功率 × success/(success+5)。/ocr の候補パラメータの並び順
+WEIGHTED_SCORE_SQL = """
+    CASE WHEN {p}total_count = 0 THEN 0
+    ELSE (CAST({p}success_count AS REAL) / {p}total_count) *
+        (CAST({p}success_count AS REAL) / ({p}success_count + 5))
+    END
+"""
+SUCCESS_RATE_SQL = """
+    CASE WHEN {p}total_count = 0 THEN 0
+    ELSE CAST({p}success_count AS REAL) / {p}total_count
+    END
+"""
+
+SCHEMA_V2_STATEMENTS = (
+    """
+    CREATE INDEX IF NOT EXISTS idx_warmup_params_weighted_score
+        ON warmup_params (weighted_score DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_warmup_params_success_rate
+        ON warmup_params (success_rate DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_warmup_params_counts
+        ON warmup_params (success_count, total_count)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS warmup_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        row_count INTEGER NOT NULL DEFAULT 0,
+        successful_rows INTEGER NOT NULL DEFAULT 0,
+        total_trials INTEGER NOT NULL DEFAULT 0,
+        pruned_rows INTEGER NOT NULL DEFAULT 0,
+        compacted_at REAL NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS warmup_params_insert AFTER INSERT ON warmup_params
+    BEGIN
+        UPDATE warmup_params SET
+            weighted_score = {WEIGHTED_SCORE_SQL.format(p="NEW.")},
+            success_rate = {SUCCESS_RATE_SQL.format(p="NEW.")}
+        WHERE id = NEW.id;
+        UPDATE warmup_stats SET
+            row_count = row_count + 1,
+            successful_rows = successful_rows
+                + (NEW.success_count >= {SUCCESSFUL_MIN_COUNT}),
+            total_trials = total_trials + NEW.total_count
+        WHERE id = 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS warmup_params_update
+    AFTER UPDATE OF success_count, total_count ON warmup_params
+    BEGIN
+        UPDATE warmup_params SET
+            weighted_score = {WEIGHTED_SCORE_SQL.format(p="NEW.")},
+            success_rate = {SUCCESS_RATE_SQL.format(p="NEW.")}
+        WHERE id = NEW.id;
+        UPDATE warmup_stats SET
+            successful_rows = successful_rows
+                + (NEW.success_count >= {SUCCESSFUL_MIN_COUNT})
+                - (OLD.success_count >= {SUCCESSFUL_MIN_COUNT}),
+            total_trials = total_trials + NEW.total_count - OLD.total_count
+        WHERE id = 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS warmup_params_delete AFTER DELETE ON warmup_params
+    BEGIN
+        UPDATE warmup_stats SET
+            row_count = row_count - 1,
+            successful_rows = successful_rows
+                - (OLD.success_count >= {SUCCESSFUL_MIN_COUNT}),
+            total_trials = total_trials - OLD.total_count
+        WHERE id = 1;
+    END
+    """,
+)
+
+
+def _to_db_int(val):
+    # numpy の整数型はそのまま渡すと BLOB で保存されてしまうため int に揃える
+    return int(val)
+
+
+def decode_db_int(val):
+    """過去に BLOB (8 バイトリトルエンディアン) で保存された整数も int に戻す。"""
+    if isinstance(val, bytes):
+        if len(val) == 8:
+            return struct.unpack("<q", val)[0]
+        return int.from_bytes(val, byteorder="little")
+    return int(val or 0)
+
+
+def _migrate_merge_ignored_filters(conn):
+    """
+    gaussian_blur / use_clahe は以前は前処理で無視されていたため、既存の試行は
+    すべて (gaussian_blur=0, use_clahe=0) で行われたのと同じ。これらの列だけが
+    異なる行を 1 行に統合し、成功数・試行数を合算する。
+    """
+    rows = conn.execute(
+        "SELECT threshold, blur, contrast_scaled, resize_ratio_scaled, success_count, total_count FROM warmup_params"
+    ).fetchall()
+    merged = {}
+    for row in rows:
+        key = tuple(decode_db_int(v) for v in row[:4])
+        counts = merged.setdefault(key, [0, 0])
+        counts[0] += decode_db_int(row[4])
+        counts[1] += decode_db_int(row[5])
+    conn.execute("DELETE FROM warmup_params")
+    conn.executemany(
+        """
+        INSERT INTO warmup_params (
+            threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe, success_count, total_count
+        ) VALUES (?, ?, ?, ?, 0, 0, ?, ?)
+        """,
+        [key + tuple(counts) for key, counts in merged.items()],
+    )
+    logging.info(
+        f"[ParamStore] 無効だった前処理パラメータの行を統合: {len(rows)} → {len(merged)} 行"
+    )
+
+
+def _migrate_add_scores_and_stats(conn):
+    """
+    weighted_score / success_rate を保存列にしてインデックスを張り、行数・成功行数を
+    warmup_stats の 1 行に集計する。以降はトリガーが書き込みのたびに更新する。
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(warmup_params)")}
+    for column in ("weighted_score", "success_rate"):
+        if column not in columns:
+            conn.execute(
+                f"ALTER TABLE warmup_params ADD COLUMN {column} REAL NOT NULL DEFAULT 0"
+            )
+    conn.execute(
+        f"""
+        UPDATE warmup_params SET
+            weighted_score = {WEIGHTED_SCORE_SQL.format(p="")},
+            success_rate = {SUCCESS_RATE_SQL.format(p="")}
+        """
+    )
+    for statement in SCHEMA_V2_STATEMENTS:
+        conn.execute(statement)
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO warmup_stats (
+            id, row_count, successful_rows, total_trials, pruned_rows, compacted_at
+        )
+        SELECT 1, COUNT(*),
+            COALESCE(SUM(success_count >= {SUCCESSFUL_MIN_COUNT}), 0),
+            COALESCE(SUM(total_count), 0), 0, 0
+        FROM warmup_params
+        """
+    )
+
+
+class ParamStore:
+    """
+    warmup_params テーブルへのアクセスをまとめたストア。
+    接続はスレッドごとに使い回し (WAL モード)、/ocr が参照する上位パラメータは
+    メモリにキャッシュする。キャッシュは自プロセスの書き込みで即時に、
+    他プロセスの書き込みは refresh_interval 秒ごとの再読込で反映される。
+
+    試行結果の書き込みはメモリ上に集計しておき (queue_trial)、flush() で
+    1 トランザクションにまとめて書き出す。書き出しは 1 スレッドずつ行い、
+    他ワーカーとのロック競合で再試行した回数を lock_retries として数える。
+    """
+
+    def __init__(
+        self,
+        db_path=PARAM_DB_PATH,
+        refresh_interval=60.0,
+        timeout=10,
+        flush_interval=30.0,
+        lock_retry_wait=0.05,
+        max_lock_retries=50,
+    ):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self.lock_retry_wait = lock_retry_wait
+        self.max_lock_retries = max_lock_retries
+        self._local = threading.local()
+        self._cache_lock = threading.Lock()
+        self._cache = {}
+        self._generation = 0
+        self._pending_lock = threading.Lock()
+        self._pending = {}
+        self._pending_since = None
+        self._writer_lock = threading.Lock()
+        self._writer_conn = None
+        self._writer_pid = None
+        self._write_stats = {
+            "flushes": 0,
+            "rows_flushed": 0,
+            "trials_flushed": 0,
+            "lock_retries": 0,
+            "failed_flushes": 0,
+        }
+
+    # --- 接続管理 ---
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        # fork 前（gunicorn マスター）に開いた接続は子プロセスで使わない
+        if conn is not None and getattr(self._local, "pid", None) != os.getpid():
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.Error as e:
+                logging.warning(f"[ParamStore] PRAGMA 設定失敗: {e}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init_schema(self):
+        conn = self._connect()
+        conn.execute(CREATE_TABLE_SQL)
+        conn.commit()
+        self._migrate(conn)
+        self.invalidate()
+
+    def _migrate(self, conn):
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        try:
+            # 複数ワーカーが同時に起動しても移行は 1 回だけ行う
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                _migrate_merge_ignored_filters(conn)
+            if version < 2:
+                _migrate_add_scores_and_stats(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    # --- キャッシュ ---
+
+    def invalidate(self):
+        with self._cache_lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def _cached(self, key, loader):
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None and now - entry[0] < self.refresh_interval:
+            return entry[1]
+        generation = self._generation
+        value = loader()
+        with self._cache_lock:
+            # 読み込み中に書き込みがあった場合は古い結果をキャッシュしない
+            if generation == self._generation:
+                self._cache[key] = (now, value)
+        return value
+
+    # --- 読み取り ---
+
+    def count_successful(self, min_success=SUCCESSFUL_MIN_COUNT):
+        def load():
+            conn = self._connect()
+            if min_success == SUCCESSFUL_MIN_COUNT:
+                # トリガーで保っている集計行を読むだけにする
+                row = conn.execute(
+                    "SELECT successful_rows FROM warmup_stats WHERE id = 1"
+                ).fetchone()
+                if row is not None:
+                    return row[0]
+            cur = conn.execute(
+                "SELECT COUNT(*) FROM warmup_params WHERE success_count >= ?",
+                (min_success,),
+            )
+            return cur.fetchone()[0]
+
+        return self._cached(("count_successful", min_success), load)
+
+    def top_weighted(self, limit=10, min_total=5):
+        """success_rate × success/(success+5) の上位（/ocr の候補パラメータ）。"""
+
+        def load():
+            cur = self._connect().execute(
+                """
+                SELECT * FROM warmup_params
+                WHERE total_count > ?
+                ORDER BY weighted_score DESC
+                LIMIT ?
+                """,
+                (min_total, limit),
+            )
+            return tuple(dict(row) for row in cur.fetchall())
+
+        return [dict(r) for r in self._cached(("top_weighted", limit, min_total), load)]
+
+    def top_success_rate(self, limit=10):
+        """単純な成功率の上位（ラベル検出の再試行用）。"""
+
+        def load():
+            cur = self._connect().execute(
+                """
+                SELECT * FROM warmup_params
+                WHERE total_count > 0
+                ORDER BY success_rate DESC
+                LIMIT ?
+                """,
+                (limit,),
+            )
+            return tuple(dict(row) for row in cur.fetchall())
+
+        return [dict(r) for r in self._cached(("top_success_rate", limit), load)]
+
+    def stats(self):
+        """warmup_stats の集計行（行数・成功行数・総試行数・圧縮の記録）。"""
+        row = (
+            self._connect()
+            .execute("SELECT * FROM warmup_stats WHERE id = 1")
+            .fetchone()
+        )
+        return dict(row) if row is not None else {}
+
+    def all_rows(self):
+        """探索用に全行をタプルで返す（id, 各パラメータ, success_count, total_count）。"""
+        cur = self._connect().execute(
+            "SELECT id, threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe, success_count, total_count FROM warmup_params"
+        )
+        return [tuple(row) for row in cur.fetchall()]
+
+    # --- 書き込み ---
+
+    def queue_trial(self, params, success):
+        """
+        1 回の試行結果をメモリ上に集計する。params は PARAM_COLUMNS 順のタプル。
+        最初の未書き出し結果から flush_interval 秒経っていれば書き出す。
+        """
+        key = tuple(_to_db_int(v) for v in params)
+        with self._pending_lock:
+            counts = self._pending.setdefault(key, [0, 0])
+            if success:
+                counts[0] += 1
+            counts[1] += 1
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            due = time.monotonic() - self._pending_since >= self.flush_interval
+        if due:
+            self.flush()
+
+    def record_trial(self, params, success):
+        """1 回の試行結果を即座に書き出す。"""
+        self.queue_trial(params, success)
+        self.flush()
+
+    def pending_count(self):
+        with self._pending_lock:
+            return sum(c[1] for c in self._pending.values())
+
+    def _writer(self):
+        # 書き込み専用の接続。待ち時間は自前の再試行で数えるため busy timeout は 0
+        if self._writer_conn is None or self._writer_pid != os.getpid():
+            conn = sqlite3.connect(
+                self.db_path, timeout=0, isolation_level=None, check_same_thread=False
+            )
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.Error as e:
+                logging.warning(f"[ParamStore] PRAGMA 設定失敗: {e}")
+            self._writer_conn = conn
+            self._writer_pid = os.getpid()
+        return self._writer_conn
+
+    def _write_transaction(self, work):
+        """
+        書き込み専用の接続で work(conn) を BEGIN IMMEDIATE のトランザクション内で
+        実行する。ロック競合は待ち時間を延ばしながら再試行し、再試行回数を返す。
+        _writer_lock を持った状態で呼ぶ。
+        """
+        conn = self._writer()
+        retries = 0
+        try:
+            while True:
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        work(conn)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                    break
+                except sqlite3.OperationalError as e:
+                    if not _is_lock_error(e) or retries >= self.max_lock_retries:
+                        raise
+                    retries += 1
+                    time.sleep(min(self.lock_retry_wait * retries, 1.0))
+        finally:
+            self._write_stats["lock_retries"] += retries
+        if retries:
+            logging.info(f"[ParamStore] 書き込みロック待ちで {retries} 回再試行しました")
+        return retries
+
+    def flush(self):
+        """集計済みの試行結果を 1 トランザクションで書き出す。書き出した行数を返す。"""
+        with self._writer_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                self._pending_since = None
+            if not pending:
+                return 0
+            rows = [key + (counts[0], counts[1]) for key, counts in pending.items()]
+            try:
+                self._write_transaction(lambda conn: conn.executemany(UPSERT_SQL, rows))
+            except Exception:
+                self._write_stats["failed_flushes"] += 1
+                self._requeue(pending)
+                raise
+            self._write_stats["flushes"] += 1
+            self._write_stats["rows_flushed"] += len(rows)
+            self._write_stats["trials_flushed"] += sum(r[-1] for r in rows)
+        self.invalidate()
+        return len(rows)
+
+    def compact(self, min_trials=20, interval=3600.0):
+        """
+        min_trials 回以上試して 1 度も成功していないパラメータの行を削除する。
+        複数ワーカーから呼ばれても interval 秒に 1 回だけ実行し、
+        削除した行数を返す（実行しなかった場合は None）。
+        """
+        pruned = []
+
+        def work(conn):
+            now = time.time()
+            # 集計行の compacted_at を先に更新できたプロセスだけが削除を行う
+            claimed = conn.execute(
+                "UPDATE warmup_stats SET compacted_at = ? "
+                "WHERE id = 1 AND compacted_at <= ?",
+                (now, now - interval),
+            ).rowcount
+            if not claimed:
+                return
+            cur = conn.execute(
+                "DELETE FROM warmup_params WHERE success_count = 0 AND total_count >= ?",
+                (min_trials,),
+            )
+            conn.execute(
+                "UPDATE warmup_stats SET pruned_rows = pruned_rows + ? WHERE id = 1",
+                (cur.rowcount,),
+            )
+            pruned.append(cur.rowcount)
+
+        with self._writer_lock:
+            self._write_transaction(work)
+        if not pruned:
+            return None
+        self.invalidate()
+        logging.info(
+            f"[ParamStore] 成功のないパラメータを {pruned[0]} 行削除しました"
+            f"（{min_trials} 回以上試行）"
+        )
+        return pruned[0]
+
+    def _requeue(self, pending):
+        # 書き出しに失敗した集計は次回の flush に持ち越す
+        with self._pending_lock:
+            for key, counts in pending.items():
+                merged = self._pending.setdefault(key, [0, 0])
+                merged[0] += counts[0]
+                merged[1] += counts[1]
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+
+    def write_stats(self):
+        stats = dict(self._write_stats)
+        stats["pending_trials"] = self.pending_count()
+        return stats
+
+
+store = ParamStore()
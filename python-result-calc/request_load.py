@@ -0,0 +1,139 @@
+import functools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 各プロセスの負荷を公開するディレクトリ。ウォームアップ用の別プロセス（別コンテナ）
+# からも読めるよう、共有ボリューム上に置く
+LOAD_DIR = os.environ.get("OCR_LOAD_DIR", "/app/data/ocr_load")
+# 直近のリクエスト数を数える時間幅（秒）
+RATE_WINDOW = 60.0
+# gunicorn のタイムアウトより長く更新のないファイルは、終了したプロセスの残りとみなす
+STALE_AFTER = 180.0
+
+
+class RequestLoad:
+    """
+    このプロセスで処理中の /ocr リクエスト数と、直近 RATE_WINDOW 秒の開始時刻を数える。
+    リクエストの開始・終了のたびに LOAD_DIR/<ホスト名>-<pid>.json に書き出し、
+    read_load() で全プロセス分を集計できるようにする。
+    """
+
+    def __init__(self, load_dir=LOAD_DIR, window=RATE_WINDOW, publish=True):
+        self.load_dir = load_dir
+        self.window = window
+        self.publish = publish
+        self.inflight = 0
+        self.total = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._publish_failed = False
+
+    def _file_path(self):
+        # gunicorn のプリロードでは fork 後に pid が変わるので毎回求める
+        return os.path.join(self.load_dir, f"{socket.gethostname()}-{os.getpid()}.json")
+
+    def _snapshot(self, now):
+        while self._recent and now - self._recent[0] > self.window:
+            self._recent.popleft()
+        return {
+            "inflight": self.inflight,
+            "total": self.total,
+            "recent_starts": list(self._recent),
+            "updated_at": now,
+        }
+
+    def _write(self, snapshot):
+        if not self.publish:
+            return
+        path = self._file_path()
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.load_dir, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if not self._publish_failed:
+                logging.warning(f"[Load] 負荷情報の書き出し失敗: {e}")
+                self._publish_failed = True
+
+    def begin(self):
+        now = time.time()
+        with self._lock:
+            self.inflight += 1
+            self.total += 1
+            self._recent.append(now)
+            self._write(self._snapshot(now))
+
+    def end(self):
+        now = time.time()
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+            self._write(self._snapshot(now))
+
+    @contextmanager
+    def track(self):
+        self.begin()
+        try:
+            yield
+        finally:
+            self.end()
+
+
+def read_load(load_dir=LOAD_DIR, window=RATE_WINDOW, stale_after=STALE_AFTER):
+    """
+    全プロセスの公開ファイルを集計し、処理中のリクエスト数と直近 window 秒の
+    リクエスト数を返す。古いファイルは集計から外して削除する。
+    """
+    now = time.time()
+    inflight = 0
+    recent = 0
+    processes = 0
+    try:
+        names = os.listdir(load_dir)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(load_dir, name)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - snapshot.get("updated_at", 0) > stale_after:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        processes += 1
+        inflight += snapshot.get("inflight", 0)
+        recent += sum(1 for t in snapshot.get("recent_starts", []) if now - t <= window)
+    return {
+        "inflight": inflight,
+        "recent_requests": recent,
+        "window_seconds": window,
+        "processes": processes,
+    }
+
+
+request_load = RequestLoad()
+
+
+def track_load(func):
+    """Flask のルート関数を処理中リクエストとして数えるデコレーター。"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with request_load.track():
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -1,6 +1,5 @@
+import argparse
 import base64
-import glob
-import json
 import logging
 import math
 import os
@@ -10,16 +9,37 @@ import sqlite3
 import struct
 import threading
 import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from pathlib import Path
 
 import cv2
-import easyocr
 import numpy as np
-import pytesseract
-from flask import Flask, jsonify, request, send_file
-from rapidfuzz.distance import Levenshtein
+from flask import Flask, Response, jsonify, request, send_file
+
+from header_cache import HeaderCache
+from label_detection import LabelDetector
+from ocr_metrics import (
+    StageTimer,
+    images_total,
+    player_attempts,
+    players_total,
+    requests_total,
+    timed,
+    warmup_trials_total,
+)
+from ocr_metrics import registry as metrics_registry
+from ocr_models import registry as ocr_registry
+from ocr_preprocess import CropPreprocessor
+from param_store import PARAM_DB_PATH, ParamStore
+from param_store import store as param_store
+from request_load import read_load, track_load
+from song_catalog import catalog as song_catalog
+from warmup_bandit import WarmupBandit
+from warmup_corpus import CorpusEntry, WarmupCorpus, parse_expected
+from warmup_scheduler import WarmupScheduler, read_status_file
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,15 +47,23 @@ logging.basicConfig(
 )
 
 app = Flask(__name__)
-for _ in range(3):
-    try:
-        reader = easyocr.Reader(["en"], gpu=False)
-        break
-    except Exception as e:
-        print("Retrying due to:", e)
-        time.sleep(5)
-else:
-    raise RuntimeError("EasyOCR initialization failed after multiple attempts")
+
+# EasyOCR モデルは ocr_models のレジストリで (言語, GPU) ごとに一度だけ生成して共有する
+OCR_LANGS_EN = ["en"]
+OCR_LANGS_JA_EN = ["ja", "en"]
+
+
+def preload_models(lang_sets=None):
+    """
+    /ocr が使う EasyOCR モデルを事前にロードする。
+    gunicorn のプリロードモードではマスタープロセスで呼ばれ、fork 後の各ワーカーが
+    重みのページを copy-on-write で共有する。
+    """
+    if lang_sets is None:
+        lang_sets = [OCR_LANGS_EN, OCR_LANGS_JA_EN]
+    for langs in lang_sets:
+        ocr_registry.get(langs, gpu=False)
+    return ocr_registry.stats()
 
 
 def convert_numpy(obj):
@@ -48,96 +76,97 @@ def convert_numpy(obj):
     return obj
 
 
+# 成功のないパラメータの削除（試行回数の下限と実行間隔）
+WARMUP_PRUNE_TRIALS = int(os.environ.get("WARMUP_PRUNE_TRIALS", "20"))
+WARMUP_COMPACT_INTERVAL = float(os.environ.get("WARMUP_COMPACT_INTERVAL", "3600"))
+
+
+def compact_warmup_params():
+    try:
+        param_store.compact(
+            min_trials=WARMUP_PRUNE_TRIALS, interval=WARMUP_COMPACT_INTERVAL
+        )
+    except sqlite3.Error as e:
+        logging.warning(f"[Warmup] SQLite 圧縮失敗: {e}")
+
+
+def warmup_interval():
+    """学習の進み具合（成功パラメータ数）に応じた次のラウンドまでの秒数（最大5分）。"""
+    try:
+        success_count = param_store.count_successful()
+    except Exception:
+        success_count = 0
+
+    min_interval = 60  # 秒
+    max_interval = 300  # 秒（＝5分）
+    max_success = 20000
+
+    ratio = min(success_count / max_success, 1.0)
+    return min_interval + int((max_interval - min_interval) * ratio)
+
+
 def warmup_loop():
-    base_interval = 5  # 初期は5秒間隔でチェック（必要に応じて）
-    while True:
-        now = datetime.now(timezone(timedelta(hours=9)))
+    last_compact = [0.0]
 
-        # 成功レコードの数を確認して間隔を調整
-        try:
-            conn = sqlite3.connect("/app/data/warmup_success_params.sqlite")
-            c = conn.cursor()
-            c.execute("SELECT COUNT(*) FROM warmup_params WHERE success_count >= 2")
-            success_count = c.fetchone()[0]
-            conn.close()
-        except Exception:
-            success_count = 0
-
-        # 学習の進み具合に応じて sleep 間隔を変化させる（最大5分まで）
-        min_interval = 60  # 秒
-        max_interval = 300  # 秒（＝5分）
-        max_success = 20000
-
-        # Swap the order so that the condition for max_interval==300 is checked first if needed
-        ratio = min(success_count / max_success, 1.0)
-        sleep_interval = min_interval + int((max_interval - min_interval) * ratio)
-
-        # 新しい条件ブロック: sleep_interval >= 300 の場合のみ5分ごとのタイミングを厳密にする
-        if sleep_interval >= 300:
-            if now.minute % 5 == 0 and now.second == 0:
-                warmup_and_check_all_images()
-                time.sleep(1)  # 秒ずれ防止
-        else:
-            warmup_and_check_all_images()
+    def maybe_compact():
+        if time.monotonic() - last_compact[0] >= WARMUP_COMPACT_INTERVAL:
+            compact_warmup_params()
+            last_compact[0] = time.monotonic()
 
-        time.sleep(sleep_interval)
+    # /ocr の負荷を見て、実行・縮小・見送りを決めながらラウンドを回す
+    warmup_scheduler.run_forever(before_step=maybe_compact)
 
 
 def start_warmup_thread():
+    # ウォームアップでも /ocr と同じ Reader を使うため、先にロードしておく
+    get_easyocr_reader()
     thread = threading.Thread(target=warmup_loop, daemon=True)
     thread.start()
 
 
-def init_warmup_db(db_path="/app/data/warmup_success_params.sqlite"):
-    need_create = not os.path.exists(db_path)
+# ウォームアップ（パラメータ探索）をどこで動かすか
+#   worker: 従来どおり各ワーカーのスレッドで行う（既定）
+#   tuner : 別プロセス（python -m result_calc tune）が行い、サーバーのワーカーは
+#           パラメータストアの上位候補を読むだけにする。tuner プロセスを一緒に
+#           起動する構成（docker-compose の python-result-calc-tuner）でだけ指定する
+WARMUP_MODE = os.environ.get("WARMUP_MODE", "worker").lower()
+TUNER_NICE = int(os.environ.get("TUNER_NICE", "10"))
+
+
+def warmup_runs_in_workers():
+    return WARMUP_MODE == "worker"
+
+
+def run_tuner(once=False, nice=TUNER_NICE):
+    """
+    ウォームアップ専用プロセスの本体。/ocr を処理するワーカーと CPU を取り合わない
+    よう優先度を下げてから、結果をパラメータストアに書き込み続ける。
+    """
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError as e:
+            logging.warning(f"[Tuner] 優先度を下げられませんでした: {e}")
+    logging.info(f"[Tuner] 開始 (pid={os.getpid()}, nice={os.nice(0)})")
+    init_warmup_db()
+    if once:
+        warmup_and_check_all_images()
+        compact_warmup_params()
+        return
+    warmup_loop()
+
+
+def _store_for(db_path):
+    if db_path == param_store.db_path:
+        return param_store
+    return ParamStore(db_path)
 
-    # タイムアウトを設定して接続
-    conn = sqlite3.connect(db_path, timeout=10)  # 10秒のタイムアウト
-    try:
-        cursor = conn.cursor()
-
-        if need_create:
-            cursor.execute("""
-                CREATE TABLE warmup_params (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    threshold INTEGER,
-                    blur INTEGER,
-                    contrast_scaled INTEGER,
-                    resize_ratio_scaled INTEGER,
-                    gaussian_blur INTEGER,
-                    use_clahe INTEGER,
-                    success_count INTEGER DEFAULT 0,
-                    total_count INTEGER DEFAULT 0,
-                    UNIQUE(threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe)
-                )
-            """)
-            conn.commit()
-        else:
-            cursor.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='warmup_params'"
-            )
-            if cursor.fetchone() is None:
-                cursor.execute("""
-                    CREATE TABLE warmup_params (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        threshold INTEGER,
-                        blur INTEGER,
-                        contrast_scaled INTEGER,
-                        resize_ratio_scaled INTEGER,
-                        gaussian_blur INTEGER,
-                        use_clahe INTEGER,
-                        success_count INTEGER DEFAULT 0,
-                        total_count INTEGER DEFAULT 0,
-                        UNIQUE(threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe)
-                    )
-                """)
-                conn.commit()
 
+def init_warmup_db(db_path=PARAM_DB_PATH):
+    try:
+        _store_for(db_path).init_schema()
     except sqlite3.Error as e:
         print(f"SQLite error: {e}")
-    finally:
-        cursor.close()  # 明示的にカーソルを閉じる
-        conn.close()  # 明示的にコネクションを閉じる
 
 
 def decode_sqlite_int(val):
@@ -148,14 +177,10 @@ def decode_sqlite_int(val):
     return int(val)
 
 
-def get_random_prob(param_db_path="/app/data/warmup_success_params.sqlite"):
+def get_random_prob(param_db_path=PARAM_DB_PATH):
     try:
-        conn = sqlite3.connect(param_db_path)
-        c = conn.cursor()
         # 成功回数2回以上のレコード数を取得
-        c.execute("SELECT COUNT(*) FROM warmup_params WHERE success_count >= 2")
-        count = c.fetchone()[0]
-        conn.close()
+        count = _store_for(param_db_path).count_successful()
     except Exception:
         return 1.0
     max_count = 20000
@@ -180,284 +205,184 @@ def stored_int_to_float(stored: int) -> float:
     return whole + decimal / 10
 
 
-def warmup_and_check_all_images():
-    warmup_dir = "/app/data/warmup"
-    param_db_path = "/app/data/warmup_success_params.sqlite"
+def label_regions_from_positions(perfect_positions, miss_positions):
+    """PERFECT / MISS の位置の組から判定数の領域を求め、左から順に並べる。"""
+    label_regions = []
+    for perfect_pos, miss_pos in zip(perfect_positions, miss_positions):
+        x_perfect, y_perfect, _, _ = perfect_pos
+        _, y_miss, _, h_miss = miss_pos
+        base_length = (y_miss + h_miss) - y_perfect
+        square_width = int(base_length * 1.3)
+        square_height = int(base_length * 1.2)
+        x_label = max(0, x_perfect - int(base_length * 0.1))
+        y_label = max(0, y_perfect - int(base_length * 0.1))
+        label_regions.append((x_label, y_label, square_width, square_height))
+    label_regions.sort(key=lambda r: r[0])
+    return label_regions
+
+
+def prepare_warmup_image(img_path):
+    """
+    ウォームアップ画像 1 枚分の、パラメータに依存しない処理（読み込み・縮小・
+    ラベル検出・判定数の右半分の切り抜き）を行う。結果は warmup_corpus でキャッシュする。
+    """
+    fname = os.path.basename(img_path)
+    try:
+        expected = parse_expected(img_path)
+    except Exception as e:
+        return CorpusEntry(None, None, [], [], f"ファイル名解析失敗: {fname} → {e}")
+
+    img = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    if img is None:
+        return CorpusEntry(expected, None, [], [], f"読み込み失敗: {fname}")
+
+    # 解像度を下げてメモリ使用量を削減
+    img = cv2.resize(img, (900, 540), interpolation=cv2.INTER_AREA)
+
+    detector = LabelDetector()
+    all_perfect_positions, all_miss_positions = find_perfect_miss_positions(
+        img, detector
+    )
+    detector.finish()
+    label_regions = label_regions_from_positions(
+        all_perfect_positions, all_miss_positions
+    )
+    if not label_regions:
+        return CorpusEntry(
+            expected, img, [], [], f"ラベル領域が0件のためスキップ: {fname}"
+        )
+
+    right_halves = []
+    for x, y, w_, h_ in label_regions:
+        crop = img[y : y + h_, x : x + w_]
+        if crop.size == 0:
+            continue
+        right_halves.append(crop[:, crop.shape[1] // 2 :])
+    if not right_halves:
+        return CorpusEntry(
+            expected, img, label_regions, [], f"切り抜きが空のためスキップ: {fname}"
+        )
+    return CorpusEntry(expected, img, label_regions, right_halves, None)
+
+
+warmup_corpus = WarmupCorpus(prepare_warmup_image)
+
+
+def warmup_and_check_all_images(max_images=10, should_stop=None):
+    """
+    ウォームアップ画像からランダムに max_images 枚選んでパラメータを 1 回ずつ試し、
+    試した枚数を返す。should_stop() が True を返したら（/ocr のリクエストが来たら）
+    画像の合間で打ち切る。
+    """
+    warmup_dir = warmup_corpus.directory
     if not os.path.isdir(warmup_dir):
         logging.warning(f"[Warmup] フォルダが存在しません: {warmup_dir}")
-        return
+        return 0
 
-    extensions = ["*.png", "*.PNG", "*.jpg", "*.JPG", "*.jpeg", "*.JPEG"]
-    png_files = []
-    for ext in extensions:
-        png_files.extend(glob.glob(os.path.join(warmup_dir, ext)))
-    png_files = sorted(png_files)
+    png_files = warmup_corpus.list_files()
     if not png_files:
         logging.warning(f"[Warmup] ファイルが見つかりません: {warmup_dir}")
-        return
+        return 0
 
-    # ランダムに10枚の画像を選択
+    # ランダムに max_images 枚の画像を選択
     np.random.shuffle(png_files)
-    png_files = png_files[:10]
+    png_files = png_files[:max_images]
 
     jst = timezone(timedelta(hours=9))
     now = datetime.now(jst).strftime("%Y-%m-%d %H:%M:%S")
 
     mistake_count = 0
+    timer = StageTimer("warmup")
+    round_start = time.perf_counter()
 
-    for img_path in png_files:
-        label_regions = []
-        fname = os.path.basename(img_path)
-        name, _ = os.path.splitext(fname)
+    # SQLiteからパラメータ候補を取得（ラウンド内はメモリ上の集計を更新して使う）
+    with timer.stage("param_read"):
         try:
-            expected = list(map(int, name.split("-")))
-            if len(expected) != 5:
-                logging.warning(f"[Warmup] 無効なファイル名形式: {fname}")
-                mistake_count += 1
-                continue
-        except Exception as e:
-            logging.warning(f"[Warmup] ファイル名解析失敗: {fname} → {e}")
-            mistake_count += 1
-            continue
-
-        img = cv2.imread(img_path, cv2.IMREAD_COLOR)
-        if img is None:
-            logging.warning(f"[Warmup] 読み込み失敗: {fname}")
-            mistake_count += 1
-            continue
-
-        # 解像度を下げてメモリ使用量を削減
-        img = cv2.resize(img, (900, 540), interpolation=cv2.INTER_AREA)
+            rows = param_store.all_rows()
+        except sqlite3.Error as e:
+            logging.warning(f"[Warmup] SQLite パラメータ読み込み失敗: {e}")
+            rows = []
+        bandit = WarmupBandit.from_rows(rows)
+    if bandit.expanded:
+        logging.info(f"[Warmup] 近傍パラメータを {bandit.expanded} 件追加")
 
-        processed_img = img.copy()
-        all_perfect_positions, all_miss_positions = [], []
-        for _ in range(5):
-            perfect_positions, miss_positions = extract_perfect_miss_positions(
-                processed_img
-            )
-            all_perfect_positions.extend(perfect_positions)
-            all_miss_positions.extend(miss_positions)
-            if perfect_positions and miss_positions:
-                break
-            processed_img = blackout_positions(processed_img, perfect_positions)
-            processed_img = blackout_positions(processed_img, miss_positions)
-        for perfect_pos, miss_pos in zip(all_perfect_positions, all_miss_positions):
-            x_perfect, y_perfect, _, _ = perfect_pos
-            _, y_miss, _, h_miss = miss_pos
-            base_length = (y_miss + h_miss) - y_perfect
-            square_width = int(base_length * 1.3)
-            square_height = int(base_length * 1.2)
-            x_label = max(0, x_perfect - int(base_length * 0.1))
-            y_label = max(0, y_perfect - int(base_length * 0.1))
-            label_regions.append((x_label, y_label, square_width, square_height))
-        label_regions.sort(key=lambda r: r[0])
-
-        if not label_regions:
-            logging.warning(f"[Warmup] ラベル領域が0件のためスキップ: {fname}")
+    tried = 0
+    for img_path in png_files:
+        if should_stop is not None and should_stop():
+            logging.info(f"[Warmup] リクエスト処理中のため {tried} 枚で打ち切り")
+            break
+        tried += 1
+        # 読み込み・ラベル検出・切り抜きは (パス, mtime) ごとにキャッシュ済みのものを使う
+        with timer.stage("corpus"):
+            entry = warmup_corpus.get(img_path)
+        if entry.error:
+            logging.warning(f"[Warmup] {entry.error}")
             mistake_count += 1
             continue
-        for region in label_regions:
-            x, y, w_, h_ = region
-            crop = img[y : y + h_, x : x + w_]
-            if crop.size == 0:
-                continue
-            right_half = crop[:, crop.shape[1] // 2 :]
+        expected = entry.expected
+        # 従来どおり一番右のプレイヤーの判定数で試す
+        right_half = entry.right_halves[-1]
 
         success = False
 
-        # SQLiteからパラメータ候補を取得
-        if os.path.exists(param_db_path):
-            conn = sqlite3.connect(param_db_path)
-            c = conn.cursor()
-            c.execute(
-                "SELECT id, threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe, success_count, total_count FROM warmup_params"
-            )
-            rows = c.fetchall()
-            conn.close()
-        else:
-            rows = []
-
-        # 既存パラメータを元に探索精度を段階的に広げる
-        expanded_rows = []
-        # 定数の定義
-        MAX_SUCCESS_COUNT = 30  # 実績の十分な基準値
-
-        # 成功率計算式の修正
-        for row in rows:
+        with timer.stage("select"):
+            chosen_row = bandit.choose(np.random.rand())
+        if chosen_row:
+            # 選んだ腕の保存値はそのまま使う（小数から変換し直すと丸めで別の腕になる）
             (
-                row_id,
-                th,
-                bl,
+                threshold,
+                blur_ksize,
                 contrast_scaled,
                 resize_ratio_scaled,
-                gb,
+                gaussian_blur_ksize,
                 uc,
-                success_count,
-                total_count,
-            ) = row
-            if total_count == 0:
-                continue
-
-            effective_success = min(success_count, MAX_SUCCESS_COUNT)
-            success_rate = (success_count / total_count) * (
-                success_count / (success_count + 5)
-            )
-
-            # 0.1単位の基本行は常に含める
-            expanded_rows.append(row)
-
-            # 条件に応じて精度を上げて追加
-            if total_count >= 10 and success_rate > 0.6:
-                for delta_c in [-5, 0, 5]:
-                    for delta_r in [-5, 0, 5]:
-                        new_contrast_scaled = (
-                            contrast_scaled + delta_c
-                        )  # 0.01単位で調整（×100）
-                        new_resize_ratio_scaled = resize_ratio_scaled + delta_r
-                        if delta_c != 0 or delta_r != 0:
-                            expanded_rows.append(
-                                (
-                                    row_id,
-                                    th,
-                                    bl,
-                                    new_contrast_scaled,
-                                    new_resize_ratio_scaled,
-                                    gb,
-                                    uc,
-                                    success_count,
-                                    total_count,
-                                )
-                            )
-        rows = expanded_rows
-
-        chosen_row = None
-
-        rand_val = np.random.rand()
-        use_ucb = rand_val < 0.2 and rows  # 20%の確率でUCBを使用
-        use_low_count = (
-            0.2 <= rand_val < 0.6 and rows
-        )  # 40%の確率で低カウント優先、残りはランダム
-
-        if use_ucb:
-            total_trials = sum(row[-1] for row in rows) or 1
-            best_score = -float("inf")
-            best_rows = []
-
-            for row in rows:
-                (
-                    _,
-                    th,
-                    bl,
-                    contrast_scaled,
-                    resize_ratio_scaled,
-                    gb,
-                    uc,
-                    success_count,
-                    total_count,
-                ) = row
-                if total_count == 0 or (success_count == 0 and total_count > 10):
-                    continue
-
-                average = success_count / total_count
-                weight = success_count / (success_count + 5)
-                weighted_average = average * weight
-
-                ucb_score = (
-                    weighted_average
-                    + 1.0 / (1 + total_count)
-                    + math.sqrt(2 * math.log(total_trials) / total_count)
-                )
-
-                if ucb_score > best_score:
-                    best_score = ucb_score
-                    best_rows = [row]
-                elif ucb_score == best_score:
-                    best_rows.append(row)
-
-            if best_rows:
-                chosen_row = best_rows[np.random.randint(len(best_rows))]
-
-        elif use_low_count:
-            # トータルカウントが少ない順にソートして上位100個からランダム選択
-            sorted_rows = sorted(rows, key=lambda r: r[8])  # total_countがインデックス8
-            top_100 = sorted_rows[:100]
-            if top_100:
-                chosen_row = top_100[np.random.randint(len(top_100))]
-
-        if chosen_row:
-            _, th, bl, contrast_scaled, resize_ratio_scaled, gb, uc, _, _ = chosen_row
+            ) = chosen_row
             contrast = stored_int_to_float(contrast_scaled)
             resize_ratio = stored_int_to_float(resize_ratio_scaled)
-            threshold = decode_sqlite_int(th)
-            blur_ksize = decode_sqlite_int(bl)
-            gaussian_blur_ksize = decode_sqlite_int(gb)
-            use_clahe = bool(decode_sqlite_int(uc))
+            use_clahe = bool(uc)
         else:
             threshold = np.random.randint(100, 220)
             blur_ksize = np.random.choice([1, 3, 5, 7, 9])
             contrast = np.random.uniform(0.6, 2.0)
             resize_ratio = np.random.uniform(0.6, 1.6)
-            gaussian_blur_ksize = np.random.choice([0, 1, 3, 5, 7, 9])
+            # 1 は平滑化なし (0) と同じ結果になるため候補から外す
+            gaussian_blur_ksize = np.random.choice([0, 3, 5, 7, 9])
             use_clahe = np.random.rand() < 0.5
+            contrast_scaled = float_to_stored_int(contrast)
+            resize_ratio_scaled = float_to_stored_int(resize_ratio)
 
-        contrast_scaled = float_to_stored_int(contrast)
-        resize_ratio_scaled = float_to_stored_int(resize_ratio)
-
-        # OCR処理
-        preprocessed = preprocess_image_for_ocr(
-            right_half,
+        trial_params = (
             threshold,
             blur_ksize,
-            contrast,
-            resize_ratio,
-            gaussian_blur_ksize=gaussian_blur_ksize,
-            use_clahe=use_clahe,
+            contrast_scaled,
+            resize_ratio_scaled,
+            gaussian_blur_ksize,
+            int(use_clahe),
         )
-        ocr_result = extract_score_with_easyocr(preprocessed)
+
+        # OCR処理
+        with timer.stage("trial"):
+            preprocessed = preprocess_image_for_ocr(
+                right_half,
+                threshold,
+                blur_ksize,
+                contrast,
+                resize_ratio,
+                gaussian_blur_ksize=gaussian_blur_ksize,
+                use_clahe=use_clahe,
+            )
+            ocr_result = extract_score_with_easyocr(preprocessed)
         # 結果確認
         if len(ocr_result) >= 5:
             try:
                 ocr_nums = list(map(int, ocr_result[:5]))
                 if ocr_nums == expected:
                     success = True
-                    # 成功パラメータの挿入（存在しなければ）
+                    warmup_trials_total.inc(result="success")
+                    # 成功パラメータの挿入（存在しなければ）と成功回数の加算
                     try:
-                        conn = sqlite3.connect(param_db_path)
-                        c = conn.cursor()
-                        c.execute(
-                            """
-                            INSERT OR IGNORE INTO warmup_params (
-                                threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe, success_count, total_count
-                            ) VALUES (?, ?, ?, ?, ?, ?, 0, 0)
-                        """,
-                            (
-                                threshold,
-                                blur_ksize,
-                                contrast_scaled,
-                                resize_ratio_scaled,
-                                gaussian_blur_ksize,
-                                int(use_clahe),
-                            ),
-                        )
-                        c.execute(
-                            """
-                            UPDATE warmup_params
-                            SET success_count = success_count + 1,
-                                total_count = total_count + 1
-                            WHERE threshold = ? AND blur = ? AND contrast_scaled = ? AND resize_ratio_scaled = ?
-                            AND gaussian_blur = ? AND use_clahe = ?
-                        """,
-                            (
-                                threshold,
-                                blur_ksize,
-                                contrast_scaled,
-                                resize_ratio_scaled,
-                                gaussian_blur_ksize,
-                                int(use_clahe),
-                            ),
-                        )
-                        conn.commit()
-                        conn.close()
+                        param_store.queue_trial(trial_params, success=True)
+                        bandit.record(trial_params, success=True)
                     except Exception as e:
                         logging.warning(f"[Warmup] SQLite成功統計保存失敗: {e}")
             except Exception as e:
@@ -465,104 +390,54 @@ def warmup_and_check_all_images():
 
         if not success:
             mistake_count += 1
+            warmup_trials_total.inc(result="failure")
 
             try:
-                conn = sqlite3.connect(param_db_path)
-                c = conn.cursor()
-
-                if chosen_row:
-                    # 既存の行を更新
-                    c.execute(
-                        """
-                        INSERT OR IGNORE INTO warmup_params (
-                            threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe, success_count, total_count
-                        ) VALUES (?, ?, ?, ?, ?, ?, 0, 0)
-                    """,
-                        (
-                            threshold,
-                            blur_ksize,
-                            contrast_scaled,
-                            resize_ratio_scaled,
-                            gaussian_blur_ksize,
-                            int(use_clahe),
-                        ),
-                    )
-
-                    c.execute(
-                        """
-                        UPDATE warmup_params
-                        SET total_count = total_count + 1
-                        WHERE threshold = ? AND blur = ? AND contrast_scaled = ? AND resize_ratio_scaled = ?
-                        AND gaussian_blur = ? AND use_clahe = ?
-                    """,
-                        (
-                            threshold,
-                            blur_ksize,
-                            contrast_scaled,
-                            resize_ratio_scaled,
-                            gaussian_blur_ksize,
-                            int(use_clahe),
-                        ),
-                    )
-                else:
-                    # 新規ランダム生成パラメータとしてINSERTまたはUPDATE
-                    c.execute(
-                        """
-                        INSERT INTO warmup_params (
-                            threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe, success_count, total_count
-                        ) VALUES (?, ?, ?, ?, ?, ?, 0, 1)
-                        ON CONFLICT(threshold, blur, contrast_scaled, resize_ratio_scaled, gaussian_blur, use_clahe) DO UPDATE SET
-                            total_count = total_count + 1
-                    """,
-                        (
-                            threshold,
-                            blur_ksize,
-                            contrast_scaled,
-                            resize_ratio_scaled,
-                            gaussian_blur_ksize,
-                            int(use_clahe),
-                        ),
-                    )
-
-                conn.commit()
-                conn.close()
+                # 既存の行・新規ランダム生成パラメータとも試行回数のみ加算
+                param_store.queue_trial(trial_params, success=False)
+                bandit.record(trial_params, success=False)
             except Exception as e:
                 logging.warning(f"[Warmup] SQLite失敗統計更新失敗: {e}")
 
+    # ラウンド内の試行結果は 1 トランザクションでまとめて書き出す
+    with timer.stage("flush"):
+        try:
+            param_store.flush()
+            logging.info(f"[Warmup] 書き込み統計: {param_store.write_stats()}")
+        except Exception as e:
+            logging.warning(f"[Warmup] SQLite統計の書き出し失敗: {e}")
+    timer.record("round", time.perf_counter() - round_start)
+    logging.info(f"[Warmup] 段階ごとの所要時間(ms): {timer.breakdown()}")
+    warmup_corpus.log_stats()
+    metrics_registry.publish()
+    return tried
+
+
+warmup_scheduler = WarmupScheduler(warmup_and_check_all_images, warmup_interval)
+
 
 def preprocess_image_for_ocr(
     image, threshold, blur_ksize, contrast, resize_ratio, gaussian_blur_ksize, use_clahe
 ):
-    img = image.copy()
-    if img is None:
+    if image is None:
         print("画像読み込みに失敗しました")
         return None
-    if img.size == 0:
+    if image.size == 0:
         print("画像サイズが0です")
         return None
-    if resize_ratio != 1.0:
-        img = cv2.resize(
-            img, None, fx=resize_ratio, fy=resize_ratio, interpolation=cv2.INTER_LINEAR
-        )
-    hsv_image = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    lower_bg1 = np.array([100, 20, 90])
-    upper_bg1 = np.array([140, 50, 140])
-    lower_bg2 = np.array([130, 20, 70])
-    upper_bg2 = np.array([180, 50, 120])
-    mask_bg1 = cv2.inRange(hsv_image, lower_bg1, upper_bg1)
-    mask_bg2 = cv2.inRange(hsv_image, lower_bg2, upper_bg2)
-    combined_mask = cv2.bitwise_or(mask_bg1, mask_bg2)
-    result = cv2.bitwise_and(img, img, mask=cv2.bitwise_not(combined_mask))
-    result[combined_mask != 0] = [255, 255, 255]
-    gray_result = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
-    gray_result = cv2.convertScaleAbs(gray_result, alpha=contrast, beta=0)
-    _, thresh = cv2.threshold(gray_result, threshold, 255, cv2.THRESH_BINARY_INV)
-    if blur_ksize > 1:
-        blurred = cv2.GaussianBlur(thresh, (blur_ksize, blur_ksize), 0)
-    else:
-        blurred = thresh
-    del hsv_image, mask_bg1, mask_bg2, combined_mask  # メモリ解放
-    return blurred
+    # 同じ切り抜きに複数のパラメータを試す場合は CropPreprocessor.variants を直接使う
+    return CropPreprocessor(image).variants(
+        [
+            {
+                "threshold": threshold,
+                "blur_ksize": blur_ksize,
+                "contrast": contrast,
+                "resize_ratio": resize_ratio,
+                "gaussian_blur_ksize": gaussian_blur_ksize,
+                "use_clahe": use_clahe,
+            }
+        ]
+    )[0]
 
 
 def preprocess_image_for_ocr_simple(image):
@@ -572,83 +447,34 @@ def preprocess_image_for_ocr_simple(image):
     return blurred
 
 
-def extract_perfect_miss_positions(image):
+def extract_perfect_miss_positions(image, detector=None):
     def get_saved_params():
         saved_params = []
-        db_path = "/app/data/warmup_success_params.sqlite"
         try:
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT *,
-                    CASE WHEN total_count = 0 THEN 0 ELSE CAST(success_count AS FLOAT)/total_count END AS success_rate
-                FROM warmup_params
-                WHERE total_count > 0
-                ORDER BY success_rate DESC
-                LIMIT 10
-            """)
-            saved_params = [dict(row) for row in cur.fetchall()]
-            conn.close()
+            saved_params = param_store.top_success_rate(10)
         except Exception as e:
             logging.warning(f"[extract] SQLite 読み込み失敗: {e}")
         return saved_params
 
-    def detect_positions(img):
-        details = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-        perfect_positions = []
-        miss_positions = []
-        perfect_text_positions = []
-
-        for i, word in enumerate(details["text"]):
-            if "ALL" in word.upper():
-                if (
-                    i + 1 < len(details["text"])
-                    and "PERFECT" in details["text"][i + 1].upper()
-                ):
-                    x = details["left"][i]
-                    y = details["top"][i]
-                    w = details["width"][i] + details["width"][i + 1]
-                    h = max(details["height"][i], details["height"][i + 1])
-                    perfect_text_positions.append((x, y, w, h))
-
-        blackout_img = img.copy()
-        for x, y, w, h in perfect_text_positions:
-            cv2.rectangle(blackout_img, (x, y), (x + w, y + h), (0, 0, 0), -1)
-
-        details2 = pytesseract.image_to_data(
-            blackout_img, output_type=pytesseract.Output.DICT
-        )
-        for i, word in enumerate(details2["text"]):
-            if "PERFECT" in word.upper():
-                (x, y, w, h) = (
-                    details2["left"][i],
-                    details2["top"][i],
-                    details2["width"][i],
-                    details2["height"][i],
-                )
-                perfect_positions.append((x, y, w, h))
-            if "MISS" in word.upper():
-                (x, y, w, h) = (
-                    details2["left"][i],
-                    details2["top"][i],
-                    details2["width"][i],
-                    details2["height"][i],
-                )
-                miss_positions.append((x, y, w, h))
-        return perfect_positions, miss_positions
+    if detector is None:
+        detector = LabelDetector()
 
     # 1回目（簡易前処理）
-    if len(image.shape) == 2:
-        preprocessed_img = image.copy()
-    else:
-        preprocessed_img = preprocess_image_for_ocr_simple(image)
-    perfects, misses = detect_positions(preprocessed_img)
+    with timed("label", "first_pass"):
+        perfects, misses = detector.detect(
+            "simple",
+            lambda: (
+                image.copy()
+                if len(image.shape) == 2
+                else preprocess_image_for_ocr_simple(image)
+            ),
+        )
     if perfects or misses:
         return perfects, misses
 
     # 2回目（SQLiteからパラメータ取得して再前処理）
-    saved_params = get_saved_params()
+    with timed("label", "param_read"):
+        saved_params = get_saved_params()
 
     def to_int_safe(val):
         if isinstance(val, bytes):
@@ -666,16 +492,27 @@ def extract_perfect_miss_positions(image):
             gaussian_blur = to_int_safe(params.get("gaussian_blur", 0))
             use_clahe = bool(params.get("use_clahe", False))
 
-            processed = preprocess_image_for_ocr(
-                image,
+            variant = (
                 threshold,
                 blur_ksize,
-                contrast,
-                resize_ratio,
-                gaussian_blur_ksize=gaussian_blur,
-                use_clahe=use_clahe,
+                contrast_scaled,
+                resize_ratio_scaled,
+                gaussian_blur,
+                use_clahe,
             )
-            perfects, misses = detect_positions(processed)
+            with timed("label", "param_retry"):
+                perfects, misses = detector.detect(
+                    variant,
+                    lambda: preprocess_image_for_ocr(
+                        image,
+                        threshold,
+                        blur_ksize,
+                        contrast,
+                        resize_ratio,
+                        gaussian_blur_ksize=gaussian_blur,
+                        use_clahe=use_clahe,
+                    ),
+                )
             if perfects or misses:
                 return perfects, misses
         except Exception as e:
@@ -684,19 +521,101 @@ def extract_perfect_miss_positions(image):
     return [], []
 
 
-def blackout_positions(image, positions):
-    for x, y, w, h in positions:
-        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 0, 0), -1)
-    return image
+def find_perfect_miss_positions(image, detector=None, max_iterations=5):
+    """
+    PERFECT / MISS の位置を検出する。まずテンプレートマッチングを試し、
+    確信度が低ければ Tesseract で検出する。見つかったものを除外しながら最大
+    max_iterations 回探し直すが、レイアウト解析は前処理の種類ごとに 1 回だけで、
+    2 回目以降は解析済みの結果から除外した位置を除くだけ（画像の黒塗りはしない）。
+    """
+    if detector is None:
+        detector = LabelDetector()
+    # 固定グリフのテンプレートで確実に見つかれば Tesseract は使わない
+    matched = detector.match_templates(image)
+    if matched is not None:
+        return matched
+    all_perfect_positions, all_miss_positions = [], []
+    for _ in range(max_iterations):
+        perfect_positions, miss_positions = extract_perfect_miss_positions(
+            image, detector
+        )
+        all_perfect_positions.extend(perfect_positions)
+        all_miss_positions.extend(miss_positions)
+        if all_perfect_positions and all_miss_positions:
+            break
+        if not perfect_positions and not miss_positions:
+            break
+        detector.exclude(perfect_positions + miss_positions)
+    return all_perfect_positions, all_miss_positions
+
+
+def normalize_result_image(img):
+    """リザルト画像を 5:3 に中央切り抜きし、1800x1080 にリサイズする。"""
+    # 画像のアスペクト比を調整して中央切り抜き
+    h, w = img.shape[:2]
+    target_w = int(5 / 3 * h)
+    target_h = int(3 / 5 * w)
+    if w > target_w:
+        # 幅が広すぎる場合、中央から target_w の幅で切り抜き
+        x_start = (w - target_w) // 2
+        img = img[:, x_start : x_start + target_w]
+        w = target_w
+    if h > target_h:
+        # 高さが高すぎる場合、中央から target_h の高さで切り抜き
+        y_start = (h - target_h) // 2
+        img = img[y_start : y_start + target_h, :]
+        h = target_h
+    # 1800x1080にリサイズ
+    return cv2.resize(img, (1800, 1080), interpolation=cv2.INTER_AREA)
 
 
 def extract_score_with_easyocr(image):
+    reader = ocr_registry.get(OCR_LANGS_EN, gpu=False)
     results = reader.readtext(image, detail=0)
     numbers = [re.sub(r"\D", "", text) for text in results]
     numbers = [num for num in numbers if num]
     return numbers
 
 
+def _pad_to_common_size(images):
+    # readtext_batched は同じサイズの画像しか受け付けないため右下を背景(0)で埋める
+    max_h = max(img.shape[0] for img in images)
+    max_w = max(img.shape[1] for img in images)
+    return [
+        cv2.copyMakeBorder(
+            img,
+            0,
+            max_h - img.shape[0],
+            0,
+            max_w - img.shape[1],
+            cv2.BORDER_CONSTANT,
+            value=0,
+        )
+        for img in images
+    ]
+
+
+def extract_scores_with_easyocr_batched(images):
+    """複数の前処理済み画像を 1 回の readtext_batched で読み、画像ごとの数字列を返す。"""
+    if not images:
+        return []
+    if len(images) == 1:
+        return [extract_score_with_easyocr(images[0])]
+    reader = ocr_registry.get(OCR_LANGS_EN, gpu=False)
+    try:
+        batch_results = reader.readtext_batched(
+            _pad_to_common_size(images), detail=0, batch_size=len(images)
+        )
+    except Exception as e:
+        logging.warning(f"[OCR] バッチ認識に失敗したため 1 枚ずつ処理します: {e}")
+        return [extract_score_with_easyocr(img) for img in images]
+    outputs = []
+    for results in batch_results:
+        numbers = [re.sub(r"\D", "", text) for text in results]
+        outputs.append([num for num in numbers if num])
+    return outputs
+
+
 def draw_labels(image, perfect_positions, miss_positions, labels=None):
     labeled_image = image.copy()
     for idx, (perfect_pos, miss_pos) in enumerate(
@@ -742,33 +661,76 @@ def to_float_safe(value, scale=1.0):
     return float(value) / scale
 
 
-def get_easyocr_reader():
+def get_easyocr_reader(langs=None):
     try:
-        return easyocr.Reader(["en"], gpu=False)
+        return ocr_registry.get(langs or OCR_LANGS_EN, gpu=False)
     except Exception as e:
         logging.error(f"EasyOCRの初期化に失敗しました: {e}")
         raise
 
 
-@app.route("/ocr", methods=["POST"])
-def ocr_endpoint():
-    if "image" not in request.files:
-        logging.error("No image uploaded")
-        return jsonify({"error": "No image uploaded"}), 400
+@app.route("/models", methods=["GET"])
+def models_endpoint():
+    return jsonify({**ocr_registry.stats(), "header_cache": header_cache.stats()})
+
 
-    file = request.files["image"]
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus 形式のメトリクス（全ワーカーと tuner プロセスの合算）。"""
+    return Response(metrics_registry.collect(), mimetype="text/plain; version=0.0.4")
 
+
+@app.after_request
+def publish_metrics(response):
+    # OCR のリクエストが終わったら、まとめてこのプロセスの値を共有ディレクトリへ書き出す
+    if request.path.startswith("/ocr"):
+        metrics_registry.request_done()
+    return response
+
+
+@app.route("/warmup/status", methods=["GET"])
+def warmup_status_endpoint():
+    """ウォームアップスケジューラーの状態（負荷の段階・次回の実行予定）と現在の負荷。"""
+    if warmup_runs_in_workers():
+        status = warmup_scheduler.status()
+    else:
+        # tuner プロセスが書き出した状態を返す
+        status = read_status_file() or {"state": "unknown"}
+    status["mode"] = WARMUP_MODE
+    status["current_load"] = read_load()
+    return jsonify(status)
+
+
+DIFFICULTY_LABELS = ["EASY", "NORMAL", "HARD", "EXPERT", "MASTER", "APPEND"]
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# /ocr/batch の 1 リクエストの画像数の上限。画像は 1 スレッドで順に処理するので、
+# 多くすると gunicorn の timeout（既定 120 秒）を超えてワーカーごと失われる
+MAX_BATCH_IMAGES = max(1, int(os.environ.get("OCR_MAX_BATCH_IMAGES", "3")))
+# 判定数 OCR の 1 ラウンドで各プレイヤーに試す候補パラメータ数
+OCR_BATCH_CANDIDATES = max(1, int(os.environ.get("OCR_BATCH_CANDIDATES", "1")))
+# 0 より大きければ、上位 K 件の候補をスレッドプールで同時に試す（レースモード）
+OCR_RACE_CANDIDATES = max(0, int(os.environ.get("OCR_RACE_CANDIDATES", "0")))
+# first: 最初に妥当な結果を採用 / majority: K 件の妥当な結果の多数決
+OCR_RACE_STRATEGY = os.environ.get("OCR_RACE_STRATEGY", "first")
+OCR_RACE_WORKERS = max(1, int(os.environ.get("OCR_RACE_WORKERS", "4")))
+_race_executor = None
+_race_executor_lock = threading.Lock()
+
+
+def decode_uploaded_image(file):
+    """
+    アップロードされたファイルを検証してデコードする。
+    (img, None) または (None, (エラーメッセージ, ステータスコード)) を返す。
+    """
     # MIMEタイプチェック
     if file.mimetype not in ["image/png", "image/jpeg"]:
         logging.error("Invalid file type")
-        return jsonify(
-            {"error": "Invalid file type. Only PNG and JPEG are allowed."}
-        ), 400
+        return None, ("Invalid file type. Only PNG and JPEG are allowed.", 400)
 
     # 最大ファイルサイズのチェック
-    if file.content_length > 10 * 1024 * 1024:
+    if file.content_length > MAX_UPLOAD_BYTES:
         logging.error("File too large")
-        return jsonify({"error": "File too large. Maximum size is 10MB."}), 400
+        return None, ("File too large. Maximum size is 10MB.", 400)
 
     try:
         in_memory_file = BytesIO()
@@ -778,35 +740,83 @@ def ocr_endpoint():
 
         if img is None:
             logging.error("Image could not be decoded")
-            return jsonify({"error": "Could not decode the image."}), 400
+            return None, ("Could not decode the image.", 400)
 
         logging.info(f"Image loaded successfully: img.shape={img.shape}")
     except Exception as e:
         logging.error(f"Error processing image: {str(e)}")
-        return jsonify({"error": "An error occurred while processing the image."}), 500
+        return None, ("An error occurred while processing the image.", 500)
+    return img, None
 
-    logging.info(
-        f"画像読み込み成功: img.shape={img.shape if img is not None else 'None'}"
-    )
-    # debug フラグはクエリ引数またはフォームから受け取れる（例: ?debug=1）
-    debug_param = request.args.get("debug", request.form.get("debug", "0"))
-    debug = str(debug_param).lower() in ("1")
+
+def load_ocr_context(debug=False):
+    """
+    1 リクエスト（バッチなら全画像）で共有する準備をまとめて行う。
+    Reader の取得と候補パラメータの読み込みはここで 1 回だけ。
+    """
+    # SQLiteから最も安定しているパラメータを取得（成功率＝success_count/total_countが最大）
+    # 上位候補は ParamStore のメモリキャッシュから取得する（毎回のディスク読み込みなし）
+    try:
+        saved_params = param_store.top_weighted(10, min_total=5)
+        if not saved_params:
+            raise ValueError("安定したパラメータが見つかりません")
+    except Exception as e:
+        logging.warning(f"[Retry-OCR] 成功パラメータDB読み込み失敗または未取得: {e}")
+        saved_params = []
+    return {
+        "debug": debug,
+        "reader_en": ocr_registry.get(OCR_LANGS_EN, gpu=False),
+        "reader_ja_en": ocr_registry.get(OCR_LANGS_JA_EN, gpu=False),
+        "saved_params": saved_params,
+        "batch_candidates": OCR_BATCH_CANDIDATES,
+        "race_candidates": OCR_RACE_CANDIDATES,
+        "race_strategy": OCR_RACE_STRATEGY,
+    }
+
+
+# 曲情報ブロックの認識結果のキャッシュ（musics.json が変わったら破棄）
+header_cache = HeaderCache(song_catalog.current_version)
+
+
+def recognize_song_header(img, ctx):
+    """
+    画像左上の曲情報ブロックから (難易度, レベル, 曲名の OCR 文字列) を読み取る。
+    曲名のカタログ照合は呼び出し側でまとめて行う。
+    同じ見た目のブロックは header_cache から返し、EasyOCR を呼ばない。
+    """
     song_h, song_w = img.shape[:2]
     song_1left = img[:, : song_w // 2]
     song_2h_left = song_1left.shape[0]
     song_3top_block = song_1left[: song_2h_left // 6, :]
+    cache_key, cached = header_cache.get(song_3top_block)
+    if cached is not None:
+        return cached
+    header, boxes = read_song_header(song_3top_block, ctx)
+    # 難易度かレベルが読めなかった結果はキャッシュしない（次は読めるかもしれない）。
+    # ヒット時に難易度とレベルの領域を照合するため、その位置も一緒に渡す
+    if header[0] and header[1]:
+        header_cache.put(cache_key, song_3top_block, header, boxes)
+    return header
+
+
+def read_song_header(song_3top_block, ctx):
+    """
+    曲情報ブロックを EasyOCR（英語・日本語の 2 パス）で読む。
+    ((難易度, レベル, 曲名の OCR 文字列), (難易度のラベル, レベルの数字) の領域) を
+    返す。領域は song_3top_block のサイズに対する割合 (x0, y0, x1, y1) で、
+    どちらかが読めなければ None。
+    """
+    block_h, block_w = song_3top_block.shape[:2]
+    x_offset = 0
     song_4h_top_block = song_3top_block.shape[0]
     song_5top_under_block = song_3top_block[song_4h_top_block // 2 :, :]
 
-    labels = ["EASY", "NORMAL", "HARD", "EXPERT", "MASTER", "APPEND"]
-    reader = easyocr.Reader(["en"])
-
-    results = reader.readtext(song_5top_under_block)
+    results = ctx["reader_en"].readtext(song_5top_under_block)
 
     found = []
     for bbox, text, conf in results:
         text_up = text.upper()
-        if text_up in labels:
+        if text_up in DIFFICULTY_LABELS:
             # bbox = [ [x1,y1], [x2,y2], [x3,y3], [x4,y4] ]
             x_left = min(p[0] for p in bbox)
             found.append((text_up, x_left, conf))
@@ -823,12 +833,10 @@ def ocr_endpoint():
 
         # x_local を基準に song_3top_block を右端まで切り抜く
         song_3top_block = song_3top_block[:, x_global:]
+        x_offset = block_w - song_3top_block.shape[1]
 
     # 日本語 + 英語モードで song_3top_block を OCR し、3つのラベル（難易度・レベル値・曲名）を抽出
-    reader_jp_en = easyocr.Reader(["ja", "en"])
-    results_full = reader_jp_en.readtext(song_3top_block)
-
-    target_labels = ["EASY", "NORMAL", "HARD", "EXPERT", "MASTER", "APPEND"]
+    results_full = ctx["reader_ja_en"].readtext(song_3top_block)
 
     difficulty_info = None
     numeric_candidates = []
@@ -838,7 +846,7 @@ def ocr_endpoint():
         y_center = sum(p[1] for p in bbox) / 4
         text_up = text.upper()
 
-        if text_up in target_labels:
+        if text_up in DIFFICULTY_LABELS:
             difficulty_info = (text_up, y_center, bbox)
         else:
             # 数字ラベル候補
@@ -849,240 +857,320 @@ def ocr_endpoint():
 
     song_difficulty = None
     song_level = None
-    song_title = None
+    title_text = None
+    boxes = None
+
+    def to_fraction(bbox):
+        # bbox は切り抜き後の song_3top_block の座標なので x_offset を戻す
+        return (
+            (x_offset + min(p[0] for p in bbox)) / block_w,
+            min(p[1] for p in bbox) / block_h,
+            (x_offset + max(p[0] for p in bbox)) / block_w,
+            max(p[1] for p in bbox) / block_h,
+        )
 
     if difficulty_info:
-        _, diff_y, _ = difficulty_info
-        song_difficulty = difficulty_info[0]
+        song_difficulty, diff_y, diff_bbox = difficulty_info
 
         # レベル（数字）は難易度と最も y が近いもの
         if numeric_candidates:
             numeric_candidates.sort(key=lambda x: abs(x[1] - diff_y))
-            numeric_text = numeric_candidates[0][0]
+            numeric_text, _, level_bbox = numeric_candidates[0]
             numbers = re.findall(r"\d+", numeric_text)
             song_level = numbers[-1] if numbers else None
+            boxes = (to_fraction(diff_bbox), to_fraction(level_bbox))
 
         # 曲名は難易度と最も y が遠いもの
         if other_texts:
             other_texts.sort(key=lambda x: abs(x[1] - diff_y), reverse=True)
-            target = other_texts[0][0]
-
-        titles = []
-        json_file_path = "/app/assets/musics.json"
-
-        # JSONファイルを読み込む
-        with open(json_file_path, encoding="utf-8") as f:
-            data = json.load(f)
-            titles = [song["title"] for song in data]
+            title_text = other_texts[0][0]
 
-        best_title = None
-        best_distance = float("inf")
+    return (song_difficulty, song_level, title_text), boxes
 
-        for title in titles:
-            dist = Levenshtein.distance(target, title)  # 通常のレーベンシュタイン距離
-            if dist < best_distance:
-                best_distance = dist
-                best_title = title
-        song_title = best_title
-        logging.info("曲名: {} (精度: {})".format(song_title, best_distance))
 
-    else:
-        label, x_local, x_global = None, None, None
-        song_difficulty = None
-        song_level = None
-        song_title = None
-
-    # 画像のアスペクト比を調整して中央切り抜き
-    h, w = img.shape[:2]
-    target_w = int(5 / 3 * h)
-    target_h = int(3 / 5 * w)
-    if w > target_w:
-        # 幅が広すぎる場合、中央から target_w の幅で切り抜き
-        x_start = (w - target_w) // 2
-        img = img[:, x_start : x_start + target_w]
-        w = target_w
-    if h > target_h:
-        # 高さが高すぎる場合、中央から target_h の高さで切り抜き
-        y_start = (h - target_h) // 2
-        img = img[y_start : y_start + target_h, :]
-        h = target_h
-    # 1800x1080にリサイズ
-    img = cv2.resize(img, (1800, 1080), interpolation=cv2.INTER_AREA)
-    processed_img = img.copy()
-    all_perfect_positions, all_miss_positions = [], []
-    label_regions = []
+def detect_label_regions(img):
+    """
+    正規化済み画像からプレイヤーごとのスコア領域を求める。
+    (label_regions, perfect_positions, miss_positions, tesseract_calls) を返す。
+    """
     logging.info("perfect/miss 抽出処理開始")
-    for _ in range(5):
-        perfect_positions, miss_positions = extract_perfect_miss_positions(
-            processed_img
-        )
-        all_perfect_positions.extend(perfect_positions)
-        all_miss_positions.extend(miss_positions)
-        if perfect_positions and miss_positions:
-            break
-        processed_img = blackout_positions(processed_img, perfect_positions)
-        processed_img = blackout_positions(processed_img, miss_positions)
-    for perfect_pos, miss_pos in zip(all_perfect_positions, all_miss_positions):
-        x_perfect, y_perfect, _, _ = perfect_pos
-        _, y_miss, _, h_miss = miss_pos
-        base_length = (y_miss + h_miss) - y_perfect
-        square_width = int(base_length * 1.3)
-        square_height = int(base_length * 1.2)
-        x_label = max(0, x_perfect - int(base_length * 0.1))
-        y_label = max(0, y_perfect - int(base_length * 0.1))
-        label_regions.append((x_label, y_label, square_width, square_height))
-    label_regions.sort(key=lambda r: r[0])
+    detector = LabelDetector()
+    all_perfect_positions, all_miss_positions = find_perfect_miss_positions(
+        img, detector
+    )
+    tesseract_calls = detector.finish()
+    logging.info(
+        f"Tesseract 呼び出し回数: {tesseract_calls} (キャッシュヒット: {detector.cache_hits})"
+    )
+    label_regions = label_regions_from_positions(
+        all_perfect_positions, all_miss_positions
+    )
     logging.info(
         f"抽出された perfect/miss の数: {len(all_perfect_positions)} / {len(all_miss_positions)}"
     )
     logging.info(f"生成されたラベル領域数: {len(label_regions)}")
     if not label_regions:
         logging.warning("ラベル領域が 0 件だったためスコア認識処理をスキップします")
-    all_player_scores = []
-    player_number = 1
-    summary_lines = []
+    return label_regions, all_perfect_positions, all_miss_positions, tesseract_calls
+
+
+def params_from_row(chosen):
+    """warmup_params の行を preprocess_image_for_ocr の引数に変換する。"""
+    return {
+        "threshold": to_int_safe(chosen["threshold"]),
+        "blur_ksize": to_int_safe(chosen["blur"]),
+        "contrast": stored_int_to_float(chosen["contrast_scaled"]),
+        "resize_ratio": stored_int_to_float(chosen["resize_ratio_scaled"]),
+        "gaussian_blur_ksize": to_int_safe(chosen.get("gaussian_blur", 0)),
+        "use_clahe": bool(chosen.get("use_clahe", False)),
+    }
+
+
+def parse_score_text(ocr_text_list):
+    """
+    OCR で得た数字列から判定数とスコアを組み立てる。
+    5 つ揃わない、または PERFECT=0 / GREAT が PERFECT の 1.5 倍以上なら None。
+    """
+    if len(ocr_text_list) < 5:
+        return None
+    perfect_val = int(ocr_text_list[0])
+    great_val = int(ocr_text_list[1])
+    good_val = int(ocr_text_list[2])
+    bad_val = int(ocr_text_list[3])
+    miss_val = int(ocr_text_list[4])
 
-    # SQLiteから最も安定しているパラメータを取得（成功率＝success_count/total_countが最大）
-    saved_params = []
-    db_path = "/app/data/warmup_success_params.sqlite"
-    try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        # 成功率でソート（total_count=0防止にCASE文）、上位10件取得
-        cur.execute("""
-            SELECT *,
-                CASE
-                    WHEN total_count = 0 THEN 0
-                    ELSE (CAST(success_count AS FLOAT) / total_count) *
-                        (CAST(success_count AS FLOAT) / (success_count + 5))
-                END AS weighted_score
-            FROM warmup_params
-            WHERE total_count > 5
-            ORDER BY weighted_score DESC
-            LIMIT 10
-        """)
-        saved_params = [dict(row) for row in cur.fetchall()]
-        conn.close()
-        if not saved_params:
-            raise ValueError("安定したパラメータが見つかりません")
-    except Exception as e:
-        logging.warning(f"[Retry-OCR] 成功パラメータDB読み込み失敗または未取得: {e}")
-        saved_params = []
+    if perfect_val == 0 or (perfect_val > 0 and great_val >= perfect_val * 1.5):
+        return None
 
-    # パラメータがある場合はそれらを順に使う（最大10件）
-    for region in label_regions:
-        logging.info(f"Player_{player_number} の領域開始: {region}")
-        x_label, y_label, square_width, square_height = region
-        crop = img[y_label : y_label + square_height, x_label : x_label + square_width]
-        if crop.size == 0:
-            logging.warning(
-                f"Player_{player_number}: crop.size == 0 でスキップされました"
-            )
-            player_number += 1
-            continue
-        half = crop.shape[1] // 2
-        right_half = crop[:, half : crop.shape[1]]
-
-        ocr_success = False
-        debug_crop_b64 = None
-        debug_pre_b64 = None
-        # ループ外で ocr_text_list を初期化して未定義参照を防ぐ
-        ocr_text_list = []
-
-        for attempt, chosen in enumerate(saved_params):
-            threshold = to_int_safe(chosen["threshold"])
-            blur_ksize = to_int_safe(chosen["blur"])
-            contrast = stored_int_to_float(chosen["contrast_scaled"])
-            resize_ratio = stored_int_to_float(chosen["resize_ratio_scaled"])
-            gaussian_blur_ksize = to_int_safe(chosen.get("gaussian_blur", 0))
-            use_clahe = bool(chosen.get("use_clahe", False))
-
-            preprocessed_right = preprocess_image_for_ocr(
-                right_half,
-                threshold,
-                blur_ksize,
-                contrast,
-                resize_ratio,
-                gaussian_blur_ksize=gaussian_blur_ksize,
-                use_clahe=use_clahe,
+    score_raw = (
+        perfect_val * 3 + great_val * 2 + good_val * 1 + bad_val * 0 + miss_val * 0
+    )
+    return {
+        "perfect": perfect_val,
+        "great": great_val,
+        "good": good_val,
+        "bad": bad_val,
+        "miss": miss_val,
+        "score": math.floor(score_raw),
+    }
+
+
+def _encode_png_b64(image):
+    if image is None:
+        return None
+    _, buf = cv2.imencode(".png", image)
+    return base64.b64encode(buf.tobytes()).decode("utf-8")
+
+
+def _get_race_executor():
+    global _race_executor
+    with _race_executor_lock:
+        if _race_executor is None:
+            _race_executor = ThreadPoolExecutor(
+                max_workers=OCR_RACE_WORKERS, thread_name_prefix="ocr-race"
             )
-            ocr_text_list = extract_score_with_easyocr(preprocessed_right)
+    return _race_executor
 
-            if len(ocr_text_list) >= 5:
-                try:
-                    perfect_val = int(ocr_text_list[0])
-                    great_val = int(ocr_text_list[1])
-                    good_val = int(ocr_text_list[2])
-                    bad_val = int(ocr_text_list[3])
-                    miss_val = int(ocr_text_list[4])
-
-                    if perfect_val == 0 or (
-                        perfect_val > 0 and great_val >= perfect_val * 1.5
-                    ):
-                        continue
-
-                    score_raw = (
-                        perfect_val * 3
-                        + great_val * 2
-                        + good_val * 1
-                        + bad_val * 0
-                        + miss_val * 0
-                    )
-                    score = math.floor(score_raw)
-                    ocr_success = True
-
-                    if debug:
-                        _, crop_buf = cv2.imencode(".png", right_half)
-                        debug_crop_b64 = base64.b64encode(crop_buf.tobytes()).decode(
-                            "utf-8"
-                        )
-                        _, pre_buf = cv2.imencode(".png", preprocessed_right)
-                        debug_pre_b64 = base64.b64encode(pre_buf.tobytes()).decode(
-                            "utf-8"
-                        )
-                        debug_params = {
-                            "threshold": threshold,
-                            "blur_ksize": blur_ksize,
-                            "contrast": round(contrast, 3),
-                            "resize_ratio": round(resize_ratio, 3),
-                            "gaussian_blur": gaussian_blur_ksize,
-                            "use_clahe": use_clahe,
-                        }
 
-                    all_player_scores.append(
-                        {
-                            "song_difficulty": song_difficulty,
-                            "song_title": song_title,
-                            "player": player_number,
-                            "perfect": perfect_val,
-                            "great": great_val,
-                            "good": good_val,
-                            "bad": bad_val,
-                            "miss": miss_val,
-                            "score": score,
-                        }
-                    )
-                    summary_lines.append(
-                        f"Player_{player_number}: 状態=正常 \n-# PERFECT={perfect_val}, GREAT={great_val}, GOOD={good_val}, BAD={bad_val}, MISS={miss_val}, スコア={score}"
-                    )
-                    break
+def _run_candidate(preprocessed):
+    # torch の推論は GIL を解放するため、候補ごとに別スレッドで回せる
+    if preprocessed is None:
+        return [], None, None
+    ocr_text_list = extract_score_with_easyocr(preprocessed)
+    try:
+        parsed = parse_score_text(ocr_text_list)
+    except Exception:
+        parsed = None
+    return ocr_text_list, preprocessed, parsed
+
+
+def race_player_candidates(player, saved_params, k, strategy="first"):
+    """
+    1 プレイヤーの候補パラメータを上位 k 件ずつ同時に試す。
+    first は最初に妥当と判定された結果を採用して残りをキャンセルし、
+    majority は k 件の妥当な結果のうち最も多い判定数の組を採用する。
+    """
+    executor = _get_race_executor()
+    for start in range(0, len(saved_params), k):
+        chosen_rows = saved_params[start : start + k]
+        # 前処理は CropPreprocessor でまとめて行い、OCR だけを並行させる
+        preprocessed_list = player["preprocessor"].variants(
+            [params_from_row(chosen) for chosen in chosen_rows]
+        )
+        futures = {
+            executor.submit(_run_candidate, preprocessed): start + offset
+            for offset, preprocessed in enumerate(preprocessed_list)
+        }
+        finished = []
+        not_done = set(futures)
+        while not_done:
+            done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    ocr_text_list, preprocessed, parsed = future.result()
                 except Exception as e:
                     logging.warning(
-                        f"[Player_{player_number}] OCR試行中に例外が発生（attempt={attempt}）: {e}"
+                        f"[Player_{player['player']}] OCR試行中に例外が発生（attempt={futures[future]}）: {e}"
                     )
                     continue
+                finished.append((futures[future], ocr_text_list, preprocessed, parsed))
+            if strategy != "majority" and any(f[3] is not None for f in finished):
+                break
+        for future in not_done:
+            future.cancel()
+
+        finished.sort(key=lambda f: f[0])
+        plausible = [f for f in finished if f[3] is not None]
+        if finished:
+            _, player["ocr_text_list"], player["preprocessed"], _ = finished[-1]
+        if not plausible:
+            continue
+        if strategy == "majority":
+            votes = Counter(tuple(sorted(f[3].items())) for f in plausible)
+            best_key, _ = votes.most_common(1)[0]
+            winner = next(
+                f for f in plausible if tuple(sorted(f[3].items())) == best_key
+            )
+        else:
+            winner = plausible[0]
+        attempt, player["ocr_text_list"], player["preprocessed"], player["result"] = (
+            winner
+        )
+        player["attempt"] = attempt
+        logging.info(
+            f"[Player_{player['player']}] レースで採用した候補: attempt={attempt} "
+            f"(strategy={strategy}, k={k}, 完了={len(finished)})"
+        )
+        return
+
 
-        if not ocr_success:
+def recognize_players(jobs, ctx):
+    """
+    複数画像・複数プレイヤーの判定数をまとめて読み取る。
+    jobs は (正規化済み画像, ラベル領域, 難易度, 曲名) のリストで、
+    画像ごとに (結果リスト, サマリ行) を返す。
+
+    候補パラメータを上位から順に試すのは従来どおりだが、1 ラウンドで
+    未確定の全プレイヤーの切り抜き（と OCR_BATCH_CANDIDATES 件の候補）を
+    まとめて前処理し、EasyOCR にも 1 回で渡す。
+    OCR_RACE_CANDIDATES を指定した場合はプレイヤーごとに候補を並行して試す
+    (race_player_candidates)。
+    """
+    debug = ctx["debug"]
+    saved_params = ctx["saved_params"]
+    per_round = max(1, ctx.get("batch_candidates", 1))
+
+    players = []
+    for job_index, (img, label_regions, _, _) in enumerate(jobs):
+        for player_number, region in enumerate(label_regions, start=1):
+            logging.info(f"Player_{player_number} の領域開始: {region}")
+            x_label, y_label, square_width, square_height = region
+            crop = img[
+                y_label : y_label + square_height, x_label : x_label + square_width
+            ]
+            if crop.size == 0:
+                logging.warning(
+                    f"Player_{player_number}: crop.size == 0 でスキップされました"
+                )
+                continue
+            half = crop.shape[1] // 2
+            players.append(
+                {
+                    "job": job_index,
+                    "player": player_number,
+                    "right_half": crop[:, half : crop.shape[1]],
+                    "preprocessor": CropPreprocessor(crop[:, half : crop.shape[1]]),
+                    "result": None,
+                    "ocr_text_list": [],
+                    "preprocessed": None,
+                }
+            )
+
+    # パラメータがある場合はそれらを順に使う（最大10件）
+    pending = list(players)
+    if ctx.get("race_candidates"):
+        for player in pending:
+            race_player_candidates(
+                player, saved_params, ctx["race_candidates"], ctx["race_strategy"]
+            )
+        pending = []
+    for start in range(0, len(saved_params), per_round):
+        if not pending:
+            break
+        candidates = [
+            (start + offset, params_from_row(chosen))
+            for offset, chosen in enumerate(saved_params[start : start + per_round])
+        ]
+        batch_inputs = []
+        owners = []
+        for player in pending:
+            # 1 つの切り抜きに対する候補パラメータ分の前処理は 1 回でまとめて作る
+            variants = player["preprocessor"].variants(
+                [params for _, params in candidates]
+            )
+            for (attempt, _), preprocessed in zip(candidates, variants):
+                if preprocessed is None:
+                    continue
+                batch_inputs.append(preprocessed)
+                owners.append((player, attempt, preprocessed))
+
+        batch_texts = extract_scores_with_easyocr_batched(batch_inputs)
+
+        # 同じプレイヤーでは attempt の小さい候補を優先する（owners はその順）
+        for (player, attempt, preprocessed), ocr_text_list in zip(owners, batch_texts):
+            if player["result"] is not None:
+                continue
+            player["ocr_text_list"] = ocr_text_list
+            player["preprocessed"] = preprocessed
+            try:
+                parsed = parse_score_text(ocr_text_list)
+            except Exception as e:
+                logging.warning(
+                    f"[Player_{player['player']}] OCR試行中に例外が発生（attempt={attempt}）: {e}"
+                )
+                continue
+            if parsed is not None:
+                player["result"] = parsed
+                player["attempt"] = attempt
+                logging.info(
+                    f"[Player_{player['player']}] 採用した候補: attempt={attempt}"
+                )
+        pending = [p for p in pending if p["result"] is None]
+
+    outputs = [([], []) for _ in jobs]
+    for player in players:
+        all_player_scores, summary_lines = outputs[player["job"]]
+        _, _, song_difficulty, song_title = jobs[player["job"]]
+        player_number = player["player"]
+        result = player["result"]
+        players_total.inc(result="ok" if result is not None else "failed")
+        player_attempts.observe(
+            player["attempt"] + 1 if result is not None else len(saved_params)
+        )
+        if result is not None:
+            all_player_scores.append(
+                {
+                    "song_difficulty": song_difficulty,
+                    "song_title": song_title,
+                    "player": player_number,
+                    **result,
+                }
+            )
+            summary_lines.append(
+                f"Player_{player_number}: 状態=正常 \n-# PERFECT={result['perfect']}, GREAT={result['great']}, GOOD={result['good']}, BAD={result['bad']}, MISS={result['miss']}, スコア={result['score']}"
+            )
+        else:
             all_player_scores.append(
                 {
                     "player": player_number,
                     "error": "スコア認識に失敗（すべての候補でNG）",
-                    "ocr_result": ocr_text_list,
+                    "ocr_result": player["ocr_text_list"],
                     **(
                         {
-                            "crop_image_base64": debug_crop_b64,
-                            "preprocessed_image_base64": debug_pre_b64,
+                            "crop_image_base64": _encode_png_b64(player["right_half"]),
+                            "preprocessed_image_base64": _encode_png_b64(
+                                player["preprocessed"]
+                            ),
                         }
                         if debug
                         else {}
@@ -1090,8 +1178,27 @@ def ocr_endpoint():
                 }
             )
             summary_lines.append(f"Player_{player_number}: 状態=認識失敗")
-        player_number += 1
+    return outputs
+
+
+def recognize_player_scores(img, label_regions, ctx, song_difficulty, song_title):
+    """各プレイヤー領域の判定数を読み取り、(結果リスト, サマリ行) を返す。"""
+    return recognize_players([(img, label_regions, song_difficulty, song_title)], ctx)[
+        0
+    ]
+
 
+def build_ocr_response(
+    img,
+    ctx,
+    all_player_scores,
+    summary_lines,
+    label_regions,
+    all_perfect_positions,
+    all_miss_positions,
+    tesseract_calls,
+):
+    debug = ctx["debug"]
     response = {"results": all_player_scores}
     if debug and label_regions:
         # 通常処理で認識できた場合のみラベル画像を返す
@@ -1106,6 +1213,7 @@ def ocr_endpoint():
         img_b64 = base64.b64encode(img_bytes).decode("utf-8")
         response["debug_image_base64"] = img_b64
         response["debug_summary"] = "\n".join(summary_lines)
+        response["debug_tesseract_calls"] = tesseract_calls
     elif (
         debug
         and len(response.get("results", [])) > 0
@@ -1113,16 +1221,183 @@ def ocr_endpoint():
     ):
         # シンプル下処理で認識できた場合は上記で枠線画像を返す（summaryは空）
         response["debug_summary"] = "simple preprocess fallback"
-    return jsonify(response)
+    return response
+
+
+def run_ocr_pipeline(images, debug=False, timer=None):
+    """
+    デコード済み画像のリストを処理し、画像ごとに /ocr と同じ形式のレスポンスを返す。
+    共有の準備は 1 回だけ行い、各段階を画像全体に対してまとめて実行する。
+    段階ごとの所要時間は timer (StageTimer) に記録し、debug 時はレスポンスに付ける。
+    """
+    if timer is None:
+        timer = StageTimer("ocr")
+    images_total.inc(len(images))
+
+    with timer.stage("context"):
+        ctx = load_ocr_context(debug)
+
+    # 1. 曲情報（難易度・レベル・曲名文字列）
+    with timer.stage("song_header"):
+        headers = [recognize_song_header(img, ctx) for img in images]
+
+    # 2. 曲名はカタログと一括照合する（難易度が読めた画像のみ）
+    with timer.stage("title_match"):
+        title_queries = [
+            title_text if difficulty else None for difficulty, _, title_text in headers
+        ]
+        title_matches = song_catalog.match_many(title_queries)
+    song_titles = []
+    for (difficulty, _, _), (song_title, best_distance) in zip(headers, title_matches):
+        if difficulty:
+            logging.info("曲名: {} (精度: {})".format(song_title, best_distance))
+        song_titles.append(song_title if difficulty else None)
+
+    # 3. 正規化とラベル領域の検出
+    with timer.stage("normalize"):
+        normalized = [normalize_result_image(img) for img in images]
+    with timer.stage("label_detection"):
+        detections = [detect_label_regions(img) for img in normalized]
+
+    # 4. プレイヤーごとの判定数認識（全画像のプレイヤーをまとめて OCR）
+    jobs = [
+        (img, detection[0], difficulty, song_title)
+        for img, (difficulty, _, _), song_title, detection in zip(
+            normalized, headers, song_titles, detections
+        )
+    ]
+    with timer.stage("player_ocr"):
+        recognized = recognize_players(jobs, ctx)
+
+    responses = []
+    with timer.stage("response"):
+        for img, detection, (all_player_scores, summary_lines) in zip(
+            normalized, detections, recognized
+        ):
+            label_regions, perfects, misses, tesseract_calls = detection
+            responses.append(
+                build_ocr_response(
+                    img,
+                    ctx,
+                    all_player_scores,
+                    summary_lines,
+                    label_regions,
+                    perfects,
+                    misses,
+                    tesseract_calls,
+                )
+            )
+    if debug:
+        # バッチでは各段階の時間は全画像分の合計
+        breakdown = timer.breakdown()
+        for response in responses:
+            response["debug_timings_ms"] = breakdown
+    return responses
 
 
-if __name__ == "__main__":
+def _debug_requested():
+    # debug フラグはクエリ引数またはフォームから受け取れる（例: ?debug=1）
+    debug_param = request.args.get("debug", request.form.get("debug", "0"))
+    return str(debug_param).lower() in ("1")
+
+
+@app.route("/ocr", methods=["POST"])
+@track_load
+def ocr_endpoint():
+    requests_total.inc(endpoint="ocr")
+    if "image" not in request.files:
+        logging.error("No image uploaded")
+        return jsonify({"error": "No image uploaded"}), 400
+
+    timer = StageTimer("ocr")
+    with timer.stage("total"):
+        with timer.stage("decode"):
+            img, error = decode_uploaded_image(request.files["image"])
+        if error:
+            message, status = error
+            return jsonify({"error": message}), status
+
+        logging.info(
+            f"画像読み込み成功: img.shape={img.shape if img is not None else 'None'}"
+        )
+        debug = _debug_requested()
+        return jsonify(run_ocr_pipeline([img], debug=debug, timer=timer)[0])
+
+
+@app.route("/ocr/batch", methods=["POST"])
+@track_load
+def ocr_batch_endpoint():
+    """
+    複数のスクリーンショットを 1 回の multipart で受け取る（フィールド名 images、
+    image も可）。レスポンスは {"images": [...]} で、各要素は /ocr と同じ形式。
+    デコードに失敗した画像はその位置に {"error": ...} を返す。
+    """
+    requests_total.inc(endpoint="ocr_batch")
+    files = request.files.getlist("images") + request.files.getlist("image")
+    if not files:
+        logging.error("No image uploaded")
+        return jsonify({"error": "No image uploaded"}), 400
+    if len(files) > MAX_BATCH_IMAGES:
+        return jsonify(
+            {"error": f"Too many images. Maximum is {MAX_BATCH_IMAGES}."}
+        ), 400
+
+    timer = StageTimer("ocr")
+    with timer.stage("total"):
+        slots = []
+        images = []
+        with timer.stage("decode"):
+            for file in files:
+                img, error = decode_uploaded_image(file)
+                if error:
+                    slots.append({"error": error[0]})
+                else:
+                    slots.append(None)
+                    images.append(img)
+        logging.info(f"バッチOCR: {len(images)} / {len(files)} 枚を処理します")
+
+        responses = iter(
+            run_ocr_pipeline(images, debug=_debug_requested(), timer=timer)
+        )
+        return jsonify(
+            {
+                "images": [
+                    slot if slot is not None else next(responses) for slot in slots
+                ]
+            }
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR API サーバー / ウォームアップ")
+    parser.add_argument(
+        "command", nargs="?", default="serve", choices=["serve", "tune"]
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="tune: 1 ラウンドだけ実行して終了する"
+    )
+    parser.add_argument("--nice", type=int, default=TUNER_NICE)
+    args = parser.parse_args(argv)
+
+    if args.command == "tune":
+        run_tuner(once=args.once, nice=args.nice)
+        return
+
     # EasyOCRモデルの初期化を遅延実行に変更
     logging.info("[Startup] OCR APIサーバー起動")
     init_warmup_db()
     logging.info("[Startup] ウォームアップDB初期化完了")
-    warmup_and_check_all_images()
-    logging.info("[Startup] ウォームアップ処理完了")
-    start_warmup_thread()
-    logging.info("[Startup] ウォームアップスレッド開始")
+    if warmup_runs_in_workers():
+        warmup_and_check_all_images()
+        logging.info("[Startup] ウォームアップ処理完了")
+        start_warmup_thread()
+        logging.info("[Startup] ウォームアップスレッド開始")
+    else:
+        logging.info(
+            "[Startup] ウォームアップは別プロセスで実行します (python -m result_calc tune)"
+        )
     app.run(host="0.0.0.0", port=53744)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+import unicodedata
+
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+MUSICS_JSON_PATH = "/app/assets/musics.json"
+
+
+def normalize_title(text):
+    """照合用に曲名を正規化する（全角半角の統一・大文字小文字無視・空白除去）。"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(text.split())
+
+
+class SongCatalog:
+    """
+    musics.json の曲名をメモリに保持し、OCR 結果から最も近い曲名を引く。
+    ファイルの mtime が変わったときだけ再読み込みする。
+    """
+
+    def __init__(self, path=MUSICS_JSON_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._titles = []
+        self._normalized = []
+
+    @property
+    def version(self):
+        """読み込み済みデータの識別子（musics.json の mtime）。未読み込みなら None。"""
+        return self._mtime
+
+    def current_version(self):
+        """musics.json が更新されていれば読み直したうえで version を返す。"""
+        self._reload_if_changed()
+        return self._mtime
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self._mtime is None:
+                logging.warning(f"[SongCatalog] {self.path} を読み込めません: {e}")
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            titles = [song["title"] for song in data if song.get("title")]
+            # 参照の差し替えは一括で行い、読み取り側はロック不要にする
+            self._titles, self._normalized = (
+                titles,
+                [normalize_title(t) for t in titles],
+            )
+            self._mtime = mtime
+            logging.info(f"[SongCatalog] {len(titles)} 曲を読み込みました")
+
+    def titles(self):
+        self._reload_if_changed()
+        return list(self._titles)
+
+    def match(self, text):
+        """最も編集距離の小さい曲名と距離を返す。候補がなければ (None, None)。"""
+        self._reload_if_changed()
+        titles, normalized = self._titles, self._normalized
+        if not text or not titles:
+            return None, None
+        result = process.extractOne(
+            normalize_title(text), normalized, scorer=Levenshtein.distance
+        )
+        if result is None:
+            return None, None
+        _, distance, index = result
+        return titles[index], distance
+
+    def match_many(self, texts):
+        """複数の OCR 結果をまとめて照合する（cdist による一括スコアリング）。"""
+        self._reload_if_changed()
+        titles, normalized = self._titles, self._normalized
+        if not texts or not titles:
+            return [(None, None) for _ in texts]
+        queries = [normalize_title(t) for t in texts]
+        matrix = process.cdist(
+            queries, normalized, scorer=Levenshtein.distance, workers=1
+        )
+        best = matrix.argmin(axis=1)
+        return [
+            (titles[int(i)], int(matrix[row, i])) if texts[row] else (None, None)
+            for row, i in enumerate(best)
+        ]
+
+
+catalog = SongCatalog()
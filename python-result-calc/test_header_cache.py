@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+from header_cache import HeaderCache, _popcount, perceptual_hash
+
+BLOCK_SIZE = (900, 150)
+DIFFICULTY_ORIGIN = (20, 60)
+LEVEL_ORIGIN = (230, 60)
+
+
+def render_header(level, difficulty="MASTER", size=BLOCK_SIZE):
+    """難易度・レベル・曲名を描いた曲情報ブロック。"""
+    img = np.full((BLOCK_SIZE[1], BLOCK_SIZE[0], 3), (70, 40, 60), dtype=np.uint8)
+    cv2.putText(img, "Tell Your World", (20, 120), 0, 1.2, (255, 255, 255), 2)
+    cv2.putText(img, difficulty, DIFFICULTY_ORIGIN, 0, 0.6, (255, 255, 255), 1)
+    cv2.putText(img, str(level), LEVEL_ORIGIN, 0, 1.2, (255, 255, 255), 2)
+    if size != BLOCK_SIZE:
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def text_box(text, origin, scale, thickness):
+    (w, h), _ = cv2.getTextSize(text, 0, scale, thickness)
+    x, y = origin
+    bw, bh = BLOCK_SIZE
+    return ((x - 4) / bw, (y - h - 4) / bh, (x + w + 4) / bw, (y + 8) / bh)
+
+
+def boxes(difficulty="MASTER"):
+    """read_song_header が返す (難易度のラベル, レベルの数字) の領域。"""
+    return (
+        text_box(difficulty, DIFFICULTY_ORIGIN, 0.6, 1),
+        text_box("30", LEVEL_ORIGIN, 1.2, 2),
+    )
+
+
+def make_cache():
+    return HeaderCache(lambda: 1, max_entries=8, max_distance=4)
+
+
+def test_headers_differing_only_in_level_do_not_share_a_result():
+    header_30, header_32 = render_header(30), render_header(32)
+    # 全体のハッシュだけでは同じヘッダーとみなされる距離しか離れていない
+    distances = _popcount(perceptual_hash(header_30) ^ perceptual_hash(header_32))
+    assert distances.max() <= 4
+
+    cache = make_cache()
+    key, cached = cache.get(header_30)
+    assert cached is None
+    cache.put(key, header_30, ("MASTER", "30", "Tell Your World"), boxes())
+
+    key, cached = cache.get(header_32)
+    assert cached is None
+    assert cache.stats()["hits"] == 0
+
+    # 両方のレベルを別々に保持し、それぞれ正しい結果を返す
+    cache.put(key, header_32, ("MASTER", "32", "Tell Your World"), boxes())
+    assert cache.get(header_30)[1][1] == "30"
+    assert cache.get(header_32)[1][1] == "32"
+
+
+def test_same_header_at_another_scale_hits():
+    cache = make_cache()
+    key, _ = cache.get(render_header(30))
+    header = ("MASTER", "30", "Tell Your World")
+    cache.put(key, render_header(30), header, boxes())
+
+    rescaled = cv2.resize(
+        render_header(30, size=(873, 146)), BLOCK_SIZE, interpolation=cv2.INTER_LINEAR
+    )
+    _, cached = cache.get(rescaled)
+    assert cached == header
+
+
+def test_headers_differing_only_in_difficulty_do_not_share_a_result():
+    expert, master = render_header(30, "EXPERT"), render_header(30, "MASTER")
+    distances = _popcount(perceptual_hash(expert) ^ perceptual_hash(master))
+    assert distances.max() <= 4
+
+    cache = make_cache()
+    key, _ = cache.get(expert)
+    cache.put(key, expert, ("EXPERT", "30", "Tell Your World"), boxes("EXPERT"))
+
+    key, cached = cache.get(master)
+    assert cached is None
+    cache.put(key, master, ("MASTER", "30", "Tell Your World"), boxes("MASTER"))
+    assert cache.get(expert)[1][0] == "EXPERT"
+    assert cache.get(master)[1][0] == "MASTER"
+
+
+def test_result_without_boxes_is_not_cached():
+    cache = make_cache()
+    key, _ = cache.get(render_header(30))
+    cache.put(key, render_header(30), ("MASTER", None, "Tell Your World"), None)
+    assert cache.stats()["entries"] == 0
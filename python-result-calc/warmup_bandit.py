@@ -0,0 +1,206 @@
+import heapq
+import os
+
+import numpy as np
+
+from param_store import PARAM_COLUMNS, decode_db_int
+
+BANDIT_STRATEGY = os.environ.get("WARMUP_BANDIT_STRATEGY", "ucb").lower()
+
+# PARAM_COLUMNS の中での contrast_scaled / resize_ratio_scaled の位置
+_CONTRAST = PARAM_COLUMNS.index("contrast_scaled")
+_RESIZE = PARAM_COLUMNS.index("resize_ratio_scaled")
+
+# 近傍展開で作る contrast / resize_ratio の範囲（ランダム探索と同じ範囲、0.1 単位）
+CONTRAST_RANGE_TENTHS = (6, 20)
+RESIZE_RANGE_TENTHS = (6, 16)
+NEIGHBOR_DELTAS = tuple(
+    (dc, dr) for dc in (-1, 0, 1) for dr in (-1, 0, 1) if dc != 0 or dr != 0
+)
+
+
+def stored_to_tenths(stored):
+    """逆順保存の整数（21 → 1.2）を 0.1 単位の整数（12）に変換する。配列も可。"""
+    return (stored % 10) * 10 + stored // 10
+
+
+def tenths_to_stored(tenths):
+    """0.1 単位の整数（12）を逆順保存の整数（21）に戻す。配列も可。"""
+    return (tenths % 10) * 10 + tenths // 10
+
+
+class WarmupBandit:
+    """
+    ウォームアップのパラメータ探索を多腕バンディットとして扱う。
+    腕（パラメータの組）ごとの成功数・試行数を NumPy 配列で持ち、UCB または
+    Thompson sampling の選択は配列演算 1 回、試行の少ない腕の選択はヒープで行う。
+    成績の良い腕は contrast / resize_ratio を 0.1 ずつずらした近傍を
+    未試行の腕として追加する（既存の腕と同じ組は追加しない）。
+    """
+
+    def __init__(
+        self,
+        params,
+        success,
+        total,
+        strategy=BANDIT_STRATEGY,
+        expand_min_total=10,
+        expand_min_score=0.6,
+        low_count_pool=100,
+        rng=None,
+    ):
+        self.params = np.asarray(params, dtype=np.int64).reshape(-1, len(PARAM_COLUMNS))
+        self.success = np.asarray(success, dtype=np.int64)
+        self.total = np.asarray(total, dtype=np.int64)
+        self.strategy = strategy
+        self.expand_min_total = expand_min_total
+        self.expand_min_score = expand_min_score
+        self.low_count_pool = low_count_pool
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.expanded = self._expand_neighbors()
+        self._index = {tuple(p): i for i, p in enumerate(self.params.tolist())}
+        self._heap = [(t, i) for i, t in enumerate(self.total.tolist())]
+        heapq.heapify(self._heap)
+
+    @classmethod
+    def from_rows(cls, rows, **kwargs):
+        """ParamStore.all_rows() の結果から作る。"""
+        width = len(PARAM_COLUMNS)
+        try:
+            values = np.array([row[1:] for row in rows], dtype=np.int64)
+        except (TypeError, ValueError):
+            # 過去に BLOB で保存された値が混ざっている場合だけ 1 つずつ変換する
+            values = np.array(
+                [[decode_db_int(v) for v in row[1:]] for row in rows], dtype=np.int64
+            )
+        values = values.reshape(-1, width + 2)
+        return cls(values[:, :width], values[:, width], values[:, width + 1], **kwargs)
+
+    def __len__(self):
+        return len(self.total)
+
+    def weighted_scores(self):
+        """成功率 × success/(success+5)（top_weighted と同じ重み付け）。"""
+        success = self.success.astype(np.float64)
+        total = np.maximum(self.total, 1)
+        return (success / total) * (success / (success + 5))
+
+    def _expand_neighbors(self):
+        good = (self.total >= self.expand_min_total) & (
+            self.weighted_scores() > self.expand_min_score
+        )
+        if not good.any():
+            return 0
+        base = self.params[good]
+        contrast = stored_to_tenths(base[:, _CONTRAST])
+        resize = stored_to_tenths(base[:, _RESIZE])
+        candidates = []
+        for dc, dr in NEIGHBOR_DELTAS:
+            c = contrast + dc
+            r = resize + dr
+            ok = (
+                (c >= CONTRAST_RANGE_TENTHS[0])
+                & (c <= CONTRAST_RANGE_TENTHS[1])
+                & (r >= RESIZE_RANGE_TENTHS[0])
+                & (r <= RESIZE_RANGE_TENTHS[1])
+            )
+            neighbor = base[ok].copy()
+            neighbor[:, _CONTRAST] = tenths_to_stored(c[ok])
+            neighbor[:, _RESIZE] = tenths_to_stored(r[ok])
+            candidates.append(neighbor)
+        candidates = np.unique(np.concatenate(candidates), axis=0)
+
+        # 既存の腕と同じ組は除く（行をバイト列として比較）
+        row_view = np.dtype(
+            (np.void, self.params.dtype.itemsize * self.params.shape[1])
+        )
+        existing = np.ascontiguousarray(self.params).view(row_view).ravel()
+        cand_view = np.ascontiguousarray(candidates).view(row_view).ravel()
+        new = candidates[~np.isin(cand_view, existing)]
+        if len(new) == 0:
+            return 0
+        self.params = np.concatenate([self.params, new])
+        self.success = np.concatenate([self.success, np.zeros(len(new), np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(len(new), np.int64)])
+        return len(new)
+
+    # --- 選択 ---
+
+    def select_ucb(self):
+        """
+        UCB スコア最大の腕。未試行の腕と、10 回を超えて 1 度も成功していない腕は除く。
+        同点の場合はランダムに選ぶ。
+        """
+        total = self.total
+        eligible = (total > 0) & ~((self.success == 0) & (total > 10))
+        if not eligible.any():
+            return None
+        total_trials = max(int(total.sum()), 1)
+        t = total[eligible].astype(np.float64)
+        scores = (
+            self.weighted_scores()[eligible]
+            + 1.0 / (1 + t)
+            + np.sqrt(2 * np.log(total_trials) / t)
+        )
+        best = np.flatnonzero(eligible)[np.flatnonzero(scores == scores.max())]
+        return int(self.rng.choice(best))
+
+    def select_thompson(self):
+        """Beta(success+1, failure+1) からのサンプルが最大の腕。"""
+        if len(self) == 0:
+            return None
+        failures = self.total - self.success
+        samples = self.rng.beta(self.success + 1, failures + 1)
+        return int(np.argmax(samples))
+
+    def select_least_tried(self):
+        """試行回数の少ない順に low_count_pool 個の腕からランダムに選ぶ。"""
+        heap = self._heap
+        pool = []
+        while heap and len(pool) < self.low_count_pool:
+            entry = heapq.heappop(heap)
+            # record() で試行回数が変わった腕の古いエントリは捨てる
+            if entry[0] == self.total[entry[1]]:
+                pool.append(entry)
+        for entry in pool:
+            heapq.heappush(heap, entry)
+        if not pool:
+            return None
+        return pool[int(self.rng.integers(len(pool)))][1]
+
+    def choose(self, rand_val=None):
+        """
+        20% で UCB（または Thompson sampling）、40% で試行の少ない腕を選び、
+        残りは None（呼び出し側でランダムなパラメータを作る）を返す。
+        """
+        if len(self) == 0:
+            return None
+        if rand_val is None:
+            rand_val = self.rng.random()
+        if rand_val < 0.2:
+            if self.strategy == "thompson":
+                idx = self.select_thompson()
+            else:
+                idx = self.select_ucb()
+        elif rand_val < 0.6:
+            idx = self.select_least_tried()
+        else:
+            idx = None
+        if idx is None:
+            return None
+        return tuple(int(v) for v in self.params[idx])
+
+    # --- 更新 ---
+
+    def record(self, params, success):
+        """
+        試行結果をメモリ上の集計に反映する（DB へは ParamStore.queue_trial で書く）。
+        まだ腕として持っていない組は次回の from_rows で読み込まれる。
+        """
+        idx = self._index.get(tuple(int(v) for v in params))
+        if idx is None:
+            return
+        if success:
+            self.success[idx] += 1
+        self.total[idx] += 1
+        heapq.heappush(self._heap, (int(self.total[idx]), idx))
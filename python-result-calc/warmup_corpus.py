@@ -0,0 +1,114 @@
+import glob
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from ocr_metrics import warmup_corpus_total
+
+WARMUP_DIR = "/app/data/warmup"
+IMAGE_PATTERNS = ("*.png", "*.PNG", "*.jpg", "*.JPG", "*.jpeg", "*.JPEG")
+
+# 1 件あたり 900x540 の画像 1 枚分（約 1.4MB）。切り抜きは画像のビューなので追加の領域は使わない。
+# ウォームアップは毎回コーパス全体から無作為に選ぶので、件数ではなくメモリ量で上限を決め、
+# 上限内ならコーパス全体を保持する（既定の 512MB で約 370 枚）
+CORPUS_CACHE_MB = float(os.environ.get("WARMUP_CORPUS_CACHE_MB", "512"))
+
+# error が None でなければ、その画像はウォームアップに使えない（理由を記録しておく）
+CorpusEntry = namedtuple(
+    "CorpusEntry", ["expected", "image", "label_regions", "right_halves", "error"]
+)
+
+
+def list_corpus_files(directory=WARMUP_DIR):
+    files = []
+    for pattern in IMAGE_PATTERNS:
+        files.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(files)
+
+
+def entry_bytes(entry):
+    """キャッシュ 1 件が保持している画像のバイト数。"""
+    return entry.image.nbytes if entry.image is not None else 0
+
+
+def parse_expected(path):
+    """ファイル名 perfect-great-good-bad-miss.png から正解の判定数を取り出す。"""
+    name, _ = os.path.splitext(os.path.basename(path))
+    expected = list(map(int, name.split("-")))
+    if len(expected) != 5:
+        raise ValueError(f"判定数が 5 つではありません: {name}")
+    return expected
+
+
+class WarmupCorpus:
+    """
+    ウォームアップ用画像の読み込み・縮小・ラベル検出・切り抜きの結果をキャッシュする。
+    これらはファイルごとに決まった結果になるため、(パス, mtime, サイズ) をキーに
+    画像の合計が max_bytes 以下の範囲で LRU で保持する。ファイルが更新されればキーが
+    変わって作り直す。
+    使えなかった画像（ファイル名不正・ラベル未検出など）も理由ごとキャッシュする。
+    """
+
+    def __init__(
+        self,
+        prepare,
+        directory=WARMUP_DIR,
+        max_bytes=int(CORPUS_CACHE_MB * 1024 * 1024),
+    ):
+        self.prepare = prepare
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def list_files(self):
+        return list_corpus_files(self.directory)
+
+    def get(self, path):
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            return CorpusEntry(None, None, [], [], f"ファイルを参照できません: {e}")
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                warmup_corpus_total.inc(result="hit")
+                return entry
+            self._stats["misses"] += 1
+        warmup_corpus_total.inc(result="miss")
+
+        entry = self.prepare(path)
+        with self._lock:
+            # 同じパスの古い版は捨てる
+            for old_key in [k for k in self._entries if k[0] == path]:
+                self._bytes -= entry_bytes(self._entries.pop(old_key))
+            self._entries[key] = entry
+            self._bytes += entry_bytes(entry)
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= entry_bytes(evicted)
+                self._stats["evictions"] += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["mb"] = round(self._bytes / (1024 * 1024), 1)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 3) if total else None
+        return stats
+
+    def log_stats(self):
+        logging.info(f"[Warmup] 画像キャッシュ: {self.stats()}")
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from request_load import read_load
+
+WARMUP_STATUS_PATH = os.environ.get(
+    "WARMUP_STATUS_PATH", "/app/data/warmup_status.json"
+)
+# 1 ラウンドで試す画像数（アイドル時 / 通常時 / リクエストが多いとき）
+WARMUP_IDLE_BATCH = int(os.environ.get("WARMUP_IDLE_BATCH", "20"))
+WARMUP_BASE_BATCH = int(os.environ.get("WARMUP_BASE_BATCH", "10"))
+WARMUP_BUSY_BATCH = int(os.environ.get("WARMUP_BUSY_BATCH", "3"))
+# 直近 1 分のリクエスト数がこれ以上なら busy とみなして小さなバッチにする
+WARMUP_BUSY_REQUESTS = int(os.environ.get("WARMUP_BUSY_REQUESTS", "6"))
+# 処理中のリクエストがあるときに、次に負荷を確認するまでの秒数
+WARMUP_PAUSE_POLL = float(os.environ.get("WARMUP_PAUSE_POLL", "5"))
+
+JST = timezone(timedelta(hours=9))
+
+
+def _format_time(ts):
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, JST).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class WarmupScheduler:
+    """
+    /ocr の負荷を見ながらウォームアップのラウンドを実行する。負荷の段階 (load_level) は
+      paused: 処理中のリクエストがある → 実行せず WARMUP_PAUSE_POLL 秒後に再確認
+      busy  : 直近のリクエストが多い → WARMUP_BUSY_BATCH 枚だけ試す
+      normal: WARMUP_BASE_BATCH 枚
+      idle  : 直近のリクエストがない → WARMUP_IDLE_BATCH 枚
+    ラウンド中もリクエストが来たら画像の合間で打ち切る。状態 (running / paused /
+    waiting) と次回の実行予定は status() と WARMUP_STATUS_PATH の JSON で公開する
+    （別プロセスの tuner の状態を /warmup/status で返すため）。
+    """
+
+    def __init__(
+        self,
+        run_round,
+        interval_for,
+        load_reader=read_load,
+        status_path=WARMUP_STATUS_PATH,
+    ):
+        # run_round(max_images, should_stop) → 試した画像数
+        # interval_for() → 次のラウンドまでの秒数
+        self.run_round = run_round
+        self.interval_for = interval_for
+        self.load_reader = load_reader
+        self.status_path = status_path
+        self._lock = threading.Lock()
+        self._status = {
+            "state": "starting",
+            "load_level": None,
+            "batch_size": 0,
+            "next_run_at": None,
+            "last_round": None,
+            "rounds": 0,
+            "paused_checks": 0,
+        }
+
+    def decide(self, load):
+        if load["inflight"] > 0:
+            return "paused", 0
+        if load["recent_requests"] >= WARMUP_BUSY_REQUESTS:
+            return "busy", WARMUP_BUSY_BATCH
+        if load["recent_requests"] == 0:
+            return "idle", WARMUP_IDLE_BATCH
+        return "normal", WARMUP_BASE_BATCH
+
+    def should_yield(self):
+        """ラウンドの途中で /ocr のリクエストが来ていれば True。"""
+        return self.load_reader()["inflight"] > 0
+
+    def step(self):
+        """負荷に応じて 1 ラウンド実行（または見送り）し、次に呼ぶまでの秒数を返す。"""
+        load = self.load_reader()
+        level, batch_size = self.decide(load)
+        if level == "paused":
+            wait = WARMUP_PAUSE_POLL
+            with self._lock:
+                self._status["paused_checks"] += 1
+            self._update("paused", level, batch_size, load, wait)
+            return wait
+
+        self._update("running", level, batch_size, load, None)
+        started = time.time()
+        yielded = []
+
+        def should_stop():
+            if self.should_yield():
+                yielded.append(True)
+                return True
+            return False
+
+        images = self.run_round(max_images=batch_size, should_stop=should_stop)
+        wait = self.interval_for()
+        with self._lock:
+            self._status["rounds"] += 1
+            self._status["last_round"] = {
+                "started_at": _format_time(started),
+                "load_level": level,
+                "batch_size": batch_size,
+                "images": images,
+                "stopped_early": bool(yielded),
+                "duration_seconds": round(time.time() - started, 2),
+            }
+        self._update("waiting", level, 0, self.load_reader(), wait)
+        return wait
+
+    def run_forever(self, before_step=None):
+        while True:
+            if before_step is not None:
+                before_step()
+            try:
+                wait = self.step()
+            except Exception as e:
+                logging.warning(f"[Warmup] ラウンド失敗: {e}")
+                wait = WARMUP_PAUSE_POLL
+            time.sleep(wait)
+
+    def _update(self, state, level, batch_size, load, wait):
+        now = time.time()
+        with self._lock:
+            self._status.update(
+                {
+                    "state": state,
+                    "load_level": level,
+                    "batch_size": batch_size,
+                    "load": load,
+                    "next_run_at": _format_time(now + wait) if wait else None,
+                    "next_run_in_seconds": round(wait, 1) if wait else None,
+                    "updated_at": _format_time(now),
+                    "pid": os.getpid(),
+                }
+            )
+            status = dict(self._status)
+        self._write_status(status)
+
+    def _write_status(self, status):
+        # worker モードでは複数のワーカーが書くため、一時ファイルはプロセスごとに分ける
+        tmp_path = f"{self.status_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f, ensure_ascii=False)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            logging.debug(f"[Warmup] 状態ファイルの書き出し失敗: {e}")
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+
+def read_status_file(status_path=WARMUP_STATUS_PATH):
+    """別プロセスのスケジューラーが書き出した状態を読む（なければ None）。"""
+    try:
+        with open(status_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
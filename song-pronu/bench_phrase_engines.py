@@ -0,0 +1,111 @@
+"""
+一意なフレーズ探索のベンチマーク（Counter 方式 vs 接尾辞オートマトン vs NumPy）。
+
+    python bench_phrase_engines.py --sizes 500 1000 2000
+    python bench_phrase_engines.py --musics /app/assets/musics.json \\
+        --artists /app/assets/musicArtists.json
+
+合成した曲データ（または実際の musics.json / musicArtists.json）に対して各
+エンジンで search_phrases / phrases_count を求め、処理時間とピークメモリ
+（tracemalloc）、結果が Counter 方式と一致するかを JSON で出力する。
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import random
+import time
+import tracemalloc
+
+import pronunciation
+from catalog_loader import load_artists, load_musics
+
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんがぎぐげござじずぜぞだぢづでどばびぶべぼぱぴぷぺぽー"
+SMALL_KANA = "ぁぃぅぇぉっゃゅょ"
+
+
+def random_pronunciation(rng, low, high):
+    chars = []
+    for _ in range(rng.randint(low, high)):
+        chars.append(rng.choice(SMALL_KANA if rng.random() < 0.08 else KANA))
+    # カタカナ表記や記号も混ぜる
+    text = "".join(chars)
+    if rng.random() < 0.3:
+        text = text.translate(str.maketrans("あいうえお", "アイウエオ"))
+    if rng.random() < 0.1:
+        text += "・" + "".join(rng.choice(KANA) for _ in range(3))
+    return text
+
+
+def synthetic_catalog(n, seed=0):
+    rng = random.Random(seed)
+    artists = [random_pronunciation(rng, 3, 10) for _ in range(max(10, n // 5))]
+    songs = []
+    for i in range(n):
+        songs.append(
+            {
+                "id": i + 1,
+                "title": f"song{i + 1}",
+                "songPronunciation": random_pronunciation(rng, 3, 14),
+                "creatorArtistPronunciation": rng.choice(artists),
+                "lyricistPronunciation": rng.choice(artists),
+                "composerPronunciation": rng.choice(artists),
+                "arrangerPronunciation": rng.choice(artists),
+            }
+        )
+    # 読みが同じ曲（別バージョンなど）も混ぜる
+    for i in range(0, n, 50):
+        songs[i]["songPronunciation"] = songs[(i + 7) % n]["songPronunciation"]
+    return songs
+
+
+def run_engine(songs, engine, max_n):
+    data = copy.deepcopy(songs)
+    tracemalloc.start()
+    start = time.perf_counter()
+    # 進行状況のログは JSON の出力と混ざるので捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        pronunciation.run_hash_generation_system(data, engine=engine, max_n=max_n)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    output = [(s["id"], s["search_phrases"], s["phrases_count"]) for s in data]
+    return output, {
+        "seconds": round(elapsed, 3),
+        "peak_mb": round(peak / (1024 * 1024), 1),
+    }
+
+
+def bench(songs, max_n):
+    counter_output, counter_stats = run_engine(songs, "counter", max_n)
+    report = {"songs": len(songs), "max_n": max_n, "counter": counter_stats}
+    for engine in ("automaton", "numpy"):
+        output, stats = run_engine(songs, engine, max_n)
+        report[engine] = {**stats, "identical": output == counter_output}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--musics", default="")
+    parser.add_argument("--artists", default="")
+    parser.add_argument("--max-n", type=int, default=pronunciation.PHRASE_MAX_N)
+    args = parser.parse_args()
+
+    report = []
+    if args.musics:
+        songs = pronunciation.build_intermediate_data(
+            load_musics(args.musics), load_artists(args.artists)
+        )
+        report.append(bench(songs, args.max_n))
+    else:
+        for n in args.sizes:
+            report.append(bench(synthetic_catalog(n), args.max_n))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+musics.json / musicArtists.json を省メモリで読み込む。
+
+json.load はマスターデータ全体を dict の木として保持するため、配列の要素を 1 件ずつ
+デコードし、必要な項目だけを __slots__ のレコードに移してすぐに捨てる。
+アーティストの読みは曲の間で何度も共有されるので sys.intern でまとめる。
+"""
+
+import json
+import sys
+
+READ_CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(path, chunk_size=READ_CHUNK_SIZE):
+    """トップレベルが配列の JSON ファイルから、要素を 1 件ずつ返す。"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        started = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        while True:
+            # 空白と区切り（最初は "["）を読み飛ばす
+            while True:
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    break
+            if pos >= len(buf):
+                raise ValueError(f"{path}: 配列の途中でファイルが終わっています")
+            char = buf[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError(f"{path}: トップレベルが配列ではありません")
+                started = True
+                pos += 1
+                continue
+            if char == "]":
+                return
+            if char == ",":
+                pos += 1
+                continue
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if fill():
+                    continue
+                raise
+            # 数値などはバッファの末尾で切れていても成功するので、続きを読んでから確定する
+            if end == len(buf) and not eof and fill():
+                continue
+            pos = end
+            yield obj
+
+
+class MusicRecord:
+    """発音データの生成に使う曲の項目だけを持つレコード。"""
+
+    __slots__ = (
+        "id",
+        "title",
+        "pronunciation",
+        "creator_artist_id",
+        "lyricist",
+        "composer",
+        "arranger",
+    )
+
+    def __init__(
+        self, id, title, pronunciation, creator_artist_id, lyricist, composer, arranger
+    ):
+        self.id = id
+        self.title = title
+        self.pronunciation = pronunciation
+        self.creator_artist_id = creator_artist_id
+        self.lyricist = lyricist
+        self.composer = composer
+        self.arranger = arranger
+
+    @classmethod
+    def from_json(cls, music):
+        return cls(
+            music.get("id"),
+            music.get("title"),
+            music.get("pronunciation", ""),
+            music.get("creatorArtistId"),
+            _intern(music.get("lyricist")),
+            _intern(music.get("composer")),
+            _intern(music.get("arranger")),
+        )
+
+
+class ArtistIndex:
+    """アーティストの ID / 名前 → 読み。読みの文字列は intern して共有する。"""
+
+    __slots__ = ("by_id", "by_name")
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_name = {}
+
+    def add(self, artist):
+        pronunciation = _intern(artist["pronunciation"])
+        self.by_id[artist["id"]] = pronunciation
+        self.by_name[_intern(artist["name"])] = pronunciation
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def load_musics(path):
+    return [MusicRecord.from_json(music) for music in iter_json_array(path)]
+
+
+def load_artists(path):
+    index = ArtistIndex()
+    for artist in iter_json_array(path):
+        index.add(artist)
+    return index
+
+
+def peak_rss_mb():
+    """このプロセスのピーク RSS（MB）。取得できなければ None。"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux では KB 単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
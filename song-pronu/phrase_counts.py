@@ -0,0 +1,133 @@
+"""
+NumPy による n-gram の一括集計（整数にパックした n 文字のフレーズ）。
+
+正規化したかなを 1〜127 の整数コードに写し（使えない文字は 0）、全曲の全項目を 0 で
+区切った 1 本の配列にする。n 文字の窓は 7 ビットずつ int64 に詰め、n = min_n..max_n の
+全ての窓を 1 回のソートで (フレーズ, 曲) ごとに数える。コードは 1 以上なので、
+長さの違う窓が同じ値になることはない。
+"""
+
+import numpy as np
+
+CODE_BITS = 7
+# int64 に詰められる最大の長さ
+MAX_PACKED_LEN = 63 // CODE_BITS
+
+
+def build_code_table(allowed_chars):
+    """コードポイント → コードの表。allowed_chars の文字だけに 1 以上を割り当てる。"""
+    alphabet = sorted(allowed_chars)
+    if len(alphabet) >= 1 << CODE_BITS:
+        raise ValueError("文字の種類が多すぎて 7 ビットに収まりません")
+    table = np.zeros(max(ord(char) for char in alphabet) + 1, dtype=np.int64)
+    for i, char in enumerate(alphabet):
+        table[ord(char)] = i + 1
+    return table
+
+
+def encode_documents(documents, table, normalize):
+    """
+    documents[i] は i 番目の曲の項目（文字列）のリスト。normalize で正規化してから
+    (文字列全体, コード配列, 位置ごとの曲番号) を返す。項目の間には区切り（コード 0）を置く。
+    """
+    parts = []
+    doc_lengths = []
+    for fields in documents:
+        doc_text = "".join(normalize(field or "") + "\0" for field in fields)
+        parts.append(doc_text)
+        doc_lengths.append(len(doc_text))
+    text = "".join(parts)
+    points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    codes = table[np.minimum(points, len(table) - 1)]
+    codes[points >= len(table)] = 0
+    doc_of = np.repeat(np.arange(len(documents), dtype=np.int32), doc_lengths)
+    return text, codes, doc_of
+
+
+def count_windows(codes, doc_of, min_n, max_n):
+    """
+    全ての有効な窓（区切りや使えない文字を含まない n 文字）について
+    (長さ, 開始位置, 曲番号, そのフレーズを含む曲の数) を返す。
+    """
+    keys_list, lengths, starts = [], [], []
+    # packed[i] / valid[i] は位置 i から始まる n 文字の窓の値と有効性（n を 1 ずつ伸ばす）
+    packed = codes
+    valid = codes > 0
+    for n in range(1, max_n + 1):
+        if n > 1:
+            packed = (packed[:-1] << CODE_BITS) | codes[n - 1 :]
+            valid = valid[:-1] & (codes[n - 1 :] > 0)
+        if n < min_n:
+            continue
+        idx = np.flatnonzero(valid).astype(np.int32)
+        keys_list.append(packed[idx])
+        lengths.append(np.full(len(idx), n, dtype=np.int8))
+        starts.append(idx)
+    keys = np.concatenate(keys_list) if keys_list else np.zeros(0, dtype=np.int64)
+    if not len(keys):
+        # 有効な窓が 1 つもない（使える文字が min_n 文字続く項目がない）
+        empty = np.zeros(0, dtype=np.int32)
+        return empty.astype(np.int8), empty, empty, empty
+    del keys_list, packed, valid
+    lengths = np.concatenate(lengths)
+    starts = np.concatenate(starts)
+    docs = doc_of[starts]
+
+    # (フレーズ, 曲) の組を数え、フレーズごとの曲数にする
+    doc_bits = max(1, int(len(doc_of) and doc_of[-1]).bit_length())
+    if max_n * CODE_BITS + doc_bits <= 63:
+        # 1 つの int64 に (フレーズ, 曲) を詰めてその場でソートする（追加の配列は 1 本）
+        pairs = (keys << doc_bits) | docs
+        pairs.sort()
+        new_pair = np.ones(len(pairs), dtype=bool)
+        new_pair[1:] = pairs[1:] != pairs[:-1]
+        pair_keys = pairs[new_pair] >> doc_bits
+        del pairs
+    else:
+        order = np.lexsort((docs, keys))
+        sorted_keys, sorted_docs = keys[order], docs[order]
+        new_pair = np.ones(len(order), dtype=bool)
+        new_pair[1:] = (sorted_keys[1:] != sorted_keys[:-1]) | (
+            sorted_docs[1:] != sorted_docs[:-1]
+        )
+        pair_keys = sorted_keys[new_pair]
+        del order, sorted_keys, sorted_docs
+    del new_pair
+    # pair_keys はソート済みなので、境界の位置から曲数を求める
+    starts_of_key = np.flatnonzero(np.r_[True, pair_keys[1:] != pair_keys[:-1]])
+    unique_keys = pair_keys[starts_of_key]
+    doc_counts = np.diff(np.r_[starts_of_key, len(pair_keys)]).astype(np.int32)
+    del pair_keys, starts_of_key
+    df = doc_counts[np.searchsorted(unique_keys, keys)]
+    return lengths, starts, docs, df
+
+
+def shortest_unique_phrases(documents, table, normalize, min_n=2, max_n=6):
+    """
+    phrase_index.shortest_unique_phrases と同じ結果（曲ごとの (n, フレーズ) か None）を
+    NumPy の一括集計で求める。max_n は MAX_PACKED_LEN まで。
+    """
+    if not max_n or max_n > MAX_PACKED_LEN:
+        raise ValueError(f"max_n は 1〜{MAX_PACKED_LEN} で指定してください")
+    text, codes, doc_of = encode_documents(documents, table, normalize)
+    lengths, starts, docs, df = count_windows(codes, doc_of, min_n, max_n)
+
+    unique = df == 1
+    u_lengths, u_starts, u_docs = lengths[unique], starts[unique], docs[unique]
+    best = np.full(len(documents), max_n + 1, dtype=np.int8)
+    np.minimum.at(best, u_docs, u_lengths)
+
+    # 曲ごとの最短の長さの窓だけを、曲・出現位置の順に並べる
+    chosen = u_lengths == best[u_docs]
+    c_starts, c_docs, c_lengths = u_starts[chosen], u_docs[chosen], u_lengths[chosen]
+    order = np.lexsort((c_starts, c_docs))
+
+    phrases = [[] for _ in documents]
+    for start, doc, n in zip(
+        c_starts[order].tolist(), c_docs[order].tolist(), c_lengths[order].tolist()
+    ):
+        phrases[doc].append(text[start : start + n])
+    return [
+        (int(best[i]), list(dict.fromkeys(phrases[i]))) if phrases[i] else None
+        for i in range(len(documents))
+    ]
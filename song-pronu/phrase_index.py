@@ -0,0 +1,144 @@
+"""
+全曲の読みをまとめた一般化接尾辞オートマトン（generalized suffix automaton）。
+
+各曲を「文字列（区間）のリスト」として渡すと、他のどの曲にも現れない最短の部分文字列を
+曲ごとに求める。区間は有効な文字だけが続く範囲で、区間をまたぐ部分文字列は作らない。
+構築・曲数の集計・検索はいずれも全文字数に対してほぼ線形で、長さの上限もない。
+"""
+
+
+class SuffixAutomaton:
+    """
+    複数の文字列を受け付ける接尾辞オートマトン。状態ごとに、その状態の部分文字列を
+    含む文書（曲）の数を doc_count に持つ。
+    """
+
+    def __init__(self):
+        self.length = [0]
+        self.link = [-1]
+        self.next = [{}]
+        self.doc_count = [0]
+        self._last_doc = [-1]
+
+    def _new_state(self, length, link=-1, transitions=None):
+        self.length.append(length)
+        self.link.append(link)
+        self.next.append(dict(transitions) if transitions else {})
+        self.doc_count.append(0)
+        self._last_doc.append(-1)
+        return len(self.length) - 1
+
+    def _clone(self, p, q, c):
+        length, link, nxt = self.length, self.link, self.next
+        clone = self._new_state(length[p] + 1, link[q], nxt[q])
+        while p != -1 and nxt[p].get(c) == q:
+            nxt[p][c] = clone
+            p = link[p]
+        link[q] = clone
+        return clone
+
+    def _extend(self, last, c):
+        length, link, nxt = self.length, self.link, self.next
+        # 別の文字列で既に同じ遷移がある場合（一般化 SAM 特有の分岐）
+        q = nxt[last].get(c)
+        if q is not None:
+            if length[last] + 1 == length[q]:
+                return q
+            return self._clone(last, q, c)
+
+        cur = self._new_state(length[last] + 1)
+        p = last
+        while p != -1 and c not in nxt[p]:
+            nxt[p][c] = cur
+            p = link[p]
+        if p == -1:
+            link[cur] = 0
+        else:
+            q = nxt[p][c]
+            if length[p] + 1 == length[q]:
+                link[cur] = q
+            else:
+                link[cur] = self._clone(p, q, c)
+        return cur
+
+    def add(self, text):
+        last = 0
+        for c in text:
+            last = self._extend(last, c)
+
+    def prefix_states(self, text):
+        """text の各位置で終わる接頭辞を含む状態のリスト（text は登録済みであること）。"""
+        states = []
+        state = 0
+        nxt = self.next
+        for c in text:
+            state = nxt[state][c]
+            states.append(state)
+        return states
+
+    def count_document(self, doc_id, segments):
+        """文書 doc_id の部分文字列を含む状態の doc_count を 1 ずつ増やす。"""
+        link, last_doc, doc_count = self.link, self._last_doc, self.doc_count
+        for segment in segments:
+            for state in self.prefix_states(segment):
+                # 接尾辞リンクをたどり、この文書で既に数えた状態に着いたら止める
+                while state > 0 and last_doc[state] != doc_id:
+                    last_doc[state] = doc_id
+                    doc_count[state] += 1
+                    state = link[state]
+
+    def shortest_unique_suffix(self, state):
+        """
+        state の状態で終わる文字列のうち、1 文書にしか現れない最短の長さ。
+        最長のものも複数文書に現れる場合は None。
+        """
+        link, doc_count, length = self.link, self.doc_count, self.length
+        if doc_count[state] != 1:
+            return None
+        while link[state] > 0 and doc_count[link[state]] == 1:
+            state = link[state]
+        return length[link[state]] + 1
+
+
+def shortest_unique_phrases(documents, min_len=2, max_len=None):
+    """
+    documents[i] は i 番目の曲の区間（文字列）のリスト。
+    各曲について (n, フレーズのリスト) を返す。n は他の曲に現れない長さ min_len 以上
+    （max_len 以下）の部分文字列の最短の長さ、フレーズはその長さの一意な部分文字列を
+    出現順に重複なく並べたもの。見つからなければ None。
+    """
+    automaton = SuffixAutomaton()
+    for segments in documents:
+        for segment in segments:
+            automaton.add(segment)
+    for doc_id, segments in enumerate(documents):
+        automaton.count_document(doc_id, segments)
+
+    results = []
+    for segments in documents:
+        # 区間ごとに、各終了位置 i での (一意になる最短の長さ, 接頭辞の長さ)
+        spans = []
+        best = None
+        for segment in segments:
+            ends = []
+            for i, state in enumerate(automaton.prefix_states(segment)):
+                shortest = automaton.shortest_unique_suffix(state)
+                if shortest is None:
+                    ends.append(None)
+                    continue
+                n = max(shortest, min_len)
+                if n <= i + 1 and (max_len is None or n <= max_len):
+                    best = n if best is None else min(best, n)
+                ends.append(shortest)
+            spans.append((segment, ends))
+        if best is None:
+            results.append(None)
+            continue
+
+        phrases = []
+        for segment, ends in spans:
+            for i in range(best - 1, len(segment)):
+                if ends[i] is not None and ends[i] <= best:
+                    phrases.append(segment[i - best + 1 : i + 1])
+        results.append((best, list(dict.fromkeys(phrases))))
+    return results
@@ -0,0 +1,247 @@
+"""
+発音データの差分更新のための状態（曲ごとの内容ハッシュとフレーズの出現曲）。
+
+    meta.json  : 入力ファイルの内容のハッシュと設定、前回のアップロードの成否
+                 (last_upload_ok)。一致して送信済みなら何もしない
+    index.json : 曲ごとの {hash, record, result} と、フレーズ → 含む曲 ID のリスト
+
+フレーズの出現曲数（= リストの長さ）が 1 をまたいで変わったときだけ、そのフレーズを
+含む曲の一意性が変わりうる。追加・削除・変更された曲と、そうした曲だけを計算し直す。
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+STATE_FORMAT_VERSION = 1
+FINGERPRINT_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(FINGERPRINT_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def input_fingerprint(paths, params, previous=None):
+    """
+    入力ファイルの内容のハッシュ（blake2b）と設定をまとめた比較用の値。
+    ダウンローダーは毎回ファイルを作り直すので mtime では判定できない。
+    (mtime_ns, サイズ) が previous（前回の値）と同じファイルだけは読み直さない。
+    """
+    old_files = (previous or {}).get("files") or {}
+    files = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stat = [st.st_mtime_ns, st.st_size]
+            old = old_files.get(path)
+            if isinstance(old, dict) and old.get("stat") == stat:
+                digest = old["blake2b"]
+            else:
+                digest = file_digest(path)
+            files[path] = {"stat": stat, "blake2b": digest}
+        except OSError:
+            files[path] = None
+    return {"version": STATE_FORMAT_VERSION, "params": params, "files": files}
+
+
+def same_inputs(meta, fingerprint):
+    """設定と入力ファイルの内容が前回と同じか（mtime だけの変化は無視する）。"""
+    if not meta:
+        return False
+
+    def contents(value):
+        return {
+            path: file["blake2b"] if isinstance(file, dict) else repr(file)
+            for path, file in (value.get("files") or {}).items()
+        }
+
+    return (
+        meta.get("version") == fingerprint["version"]
+        and meta.get("params") == fingerprint["params"]
+        and contents(meta) == contents(fingerprint)
+    )
+
+
+def record_hash(record):
+    data = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def song_key(record):
+    return str(record.get("id"))
+
+
+def segment_phrases(segments, min_n, max_n):
+    """
+    n ごとの、区間内の n 文字の窓を出現順に重複なく並べたリスト {n: [フレーズ]}。
+    max_n が 0 / None なら最長の区間の長さまで。
+    """
+    longest = max((len(seg) for seg in segments), default=0)
+    upper = min(max_n, longest) if max_n else longest
+    phrases = {}
+    for n in range(min_n, upper + 1):
+        windows = [seg[i : i + n] for seg in segments for i in range(len(seg) - n + 1)]
+        phrases[n] = list(dict.fromkeys(windows))
+    return phrases
+
+
+class PhraseState:
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.meta = None
+        self.songs = {}
+        self.postings = {}
+        self.order = []
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.state_dir, "meta.json")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.state_dir, "index.json")
+
+    def load_meta(self):
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError):
+            self.meta = None
+        return self.meta
+
+    def load_index(self):
+        """読めなければ空の状態（全件計算）にする。"""
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            self.songs = index["songs"]
+            self.postings = index["postings"]
+            self.order = index["order"]
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.index_path):
+                logging.warning(f"[PhraseState] 状態を読み込めません: {e}")
+            self.songs, self.postings, self.order = {}, {}, []
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def save(self, fingerprint, index=True):
+        os.makedirs(self.state_dir, exist_ok=True)
+        if index:
+            index_data = {
+                "songs": self.songs,
+                "postings": self.postings,
+                "order": self.order,
+            }
+            self._write(self.index_path, index_data)
+        # meta は最後に書く（index の書き込み途中で止まっても次回は差分を取り直す）
+        self._write(self.meta_path, fingerprint)
+        self.meta = fingerprint
+
+    def _add_postings(self, key, phrases, touched):
+        for phrase_list in phrases.values():
+            for phrase in phrase_list:
+                holders = self.postings.setdefault(phrase, [])
+                touched.setdefault(phrase, len(holders))
+                holders.append(key)
+
+    def _remove_postings(self, key, phrases, touched):
+        for phrase_list in phrases.values():
+            for phrase in phrase_list:
+                holders = self.postings.get(phrase)
+                if not holders:
+                    continue
+                touched.setdefault(phrase, len(holders))
+                holders.remove(key)
+                if not holders:
+                    del self.postings[phrase]
+
+    def find_unique(self, phrases):
+        """find_unique_phrases_counter と同じく (最短の n, 一意なフレーズ) か None。"""
+        for n in sorted(phrases):
+            unique = [p for p in phrases[n] if len(self.postings.get(p, ())) == 1]
+            if unique:
+                return n, unique
+        return None
+
+    def rebuild(self, records, segments_of, min_n, max_n, results):
+        """全件計算の結果 results（records と同じ順）から状態を作り直す。"""
+        self.songs, self.postings = {}, {}
+        self.order = [song_key(r) for r in records]
+        touched = {}
+        for record, result in zip(records, results):
+            key = song_key(record)
+            self._add_postings(
+                key, segment_phrases(segments_of(record), min_n, max_n), touched
+            )
+            self.songs[key] = {
+                "hash": record_hash(record),
+                "record": record,
+                "result": result,
+            }
+
+    def update(self, records, segments_of, min_n, max_n, select):
+        """
+        前回からの差分だけを計算し直し、(計算し直した・削除した曲のキーの集合,
+        曲の並びが変わったか) を返す。
+        select(record, found) は find_unique の結果から曲の result を作る。
+        """
+        current = {song_key(r): r for r in records}
+        order = list(current)
+        removed = [key for key in self.songs if key not in current]
+        changed = [
+            key
+            for key, record in current.items()
+            if self.songs.get(key, {}).get("hash") != record_hash(record)
+        ]
+
+        # 出現曲数が変わる前の値をフレーズごとに覚えておく
+        touched = {}
+        new_phrases = {}
+        for key in removed + changed:
+            old = self.songs.get(key)
+            if old is not None:
+                self._remove_postings(
+                    key,
+                    segment_phrases(segments_of(old["record"]), min_n, max_n),
+                    touched,
+                )
+        for key in removed:
+            del self.songs[key]
+        for key in changed:
+            new_phrases[key] = segment_phrases(segments_of(current[key]), min_n, max_n)
+            self._add_postings(key, new_phrases[key], touched)
+
+        recompute = set(changed)
+        for phrase, old_count in touched.items():
+            holders = self.postings.get(phrase, ())
+            if (old_count == 1) != (len(holders) == 1):
+                recompute.update(holders)
+
+        for key in recompute:
+            record = current[key]
+            phrases = new_phrases.get(key)
+            if phrases is None:
+                phrases = segment_phrases(segments_of(record), min_n, max_n)
+            self.songs[key] = {
+                "hash": record_hash(record),
+                "record": record,
+                "result": select(record, self.find_unique(phrases)),
+            }
+        reordered = order != self.order
+        self.order = order
+        return set(removed) | recompute, reordered
+
+    def output(self, records):
+        """records の順に、元の項目と search_phrases / phrases_count を並べる。"""
+        return [
+            {**record, **self.songs[song_key(record)]["result"]} for record in records
+        ]
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 import re
@@ -7,7 +8,13 @@ from collections import Counter
 
 import requests
 from dotenv import load_dotenv
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
+
+import phrase_counts
+from catalog_loader import load_artists, load_musics, peak_rss_mb
+from phrase_index import shortest_unique_phrases
+from phrase_state import PhraseState, input_fingerprint, same_inputs, song_key
+from spreadsheet_upload import SpreadsheetUploader, UploadError
 
 load_dotenv()
 app = Flask(__name__)
@@ -21,9 +28,50 @@ MUSIC_JSON = os.path.join(BASE_PATH, "musics.json")
 ARTISTS_JSON = os.path.join(BASE_PATH, "musicArtists.json")
 SKIP_JSON = os.path.join(BASE_PATH, "music_skip.json")
 OUTPUT_JSON = os.path.join(BASE_PATH, "song_pronunciation.json")
-
-
-def build_intermediate_data(music_data, artist_data):
+# 差分更新用の状態（曲ごとのハッシュとフレーズの出現曲）
+STATE_DIR = os.getenv(
+    "PRONUNCIATION_STATE_DIR", os.path.join(BASE_PATH, ".pronunciation_state")
+)
+# スプレッドシートへの送信方式（full: 全件を 1 回で送る / delta: 変わった曲だけをチャンクで送る）
+# delta は受け側の Apps Script がチャンク形式（spreadsheet_upload.py 参照）に対応してから使う
+SPREADSHEET_UPLOAD_MODE = os.getenv("SPREADSHEET_UPLOAD_MODE", "full")
+
+# 一意なフレーズの探索エンジン
+# （automaton: 接尾辞オートマトン / numpy: 整数にパックした一括集計 / counter: 従来の Counter）
+PHRASE_ENGINE = os.getenv("PHRASE_ENGINE", "numpy")
+# フレーズ長の範囲。PHRASE_MAX_N=0 なら上限なし（automaton のみ実用的）
+PHRASE_MIN_N = 2
+PHRASE_MAX_N = int(os.getenv("PHRASE_MAX_N", "6"))
+# 一意なフレーズが見つからなかった曲の phrases_count
+FALLBACK_PHRASES_COUNT = 6
+
+TARGET_KEYS = [
+    "songPronunciation",
+    "creatorArtistPronunciation",
+    "lyricistPronunciation",
+    "composerPronunciation",
+    "arrangerPronunciation",
+]
+# 打ちやすいひらがな（清音、濁音、半濁音）と「ー」。小書き文字は含まない
+ALLOWED_KANA = frozenset(
+    "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんがぎぐげござじずぜぞだぢづでどばびぶべぼぱぴぷぺぽー"
+)
+UNWANTED_KANA = frozenset("ぁぃぅぇぉっゃゅょゎゕゖ")
+
+# 基本的なカタカナからひらがなへのマッピング
+# ァ(30A1)〜ヶ(30F6) までの全対応リスト（計算で生成しても良いが、ここでは確実性を重視）
+KATAKANA_TO_HIRAGANA = str.maketrans(
+    "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワヰヱヲンガギグゲゴザジズゼゾダヂヅデドバビブベボパピプペポァィゥェォッャュョヮヴヵヶー",
+    "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわゐゑをんがぎぐげござじずぜぞだぢづでどばびぶべぼぱぴぷぺぽぁぃぅぇぉっゃゅょゎゔゕゖー",
+)
+KANA_CODE_TABLE = phrase_counts.build_code_table(ALLOWED_KANA)
+
+
+def build_intermediate_data(music_data, artists):
+    """
+    music_data は catalog_loader.MusicRecord のリスト、artists は ArtistIndex。
+    スキップリストを適用し、フレーズ生成に使う項目だけの dict にする。
+    """
     # --- スキップリストの読み込み ---
     skip_ids = set()
     if os.path.exists(SKIP_JSON):
@@ -34,25 +82,25 @@ def build_intermediate_data(music_data, artist_data):
             print(f"Warning: Failed to load skip list: {e}")
 
     # アーティスト検索用の辞書
-    artists_by_id = {a["id"]: a["pronunciation"] for a in artist_data}
-    artists_by_name = {a["name"]: a["pronunciation"] for a in artist_data}
+    artists_by_id = artists.by_id
+    artists_by_name = artists.by_name
 
     intermediate_list = []
 
     for music in music_data:
         # --- スキップ判定 ---
-        if music.get("id") in skip_ids:
+        if music.id in skip_ids:
             continue
 
-        creator_pron = artists_by_id.get(music.get("creatorArtistId"), "")
-        lyricist_pron = artists_by_name.get(music.get("lyricist"), "")
-        composer_pron = artists_by_name.get(music.get("composer"), "")
-        arranger_pron = artists_by_name.get(music.get("arranger"), "")
+        creator_pron = artists_by_id.get(music.creator_artist_id, "")
+        lyricist_pron = artists_by_name.get(music.lyricist, "")
+        composer_pron = artists_by_name.get(music.composer, "")
+        arranger_pron = artists_by_name.get(music.arranger, "")
 
         obj = {
-            "id": music.get("id"),
-            "title": music.get("title"),
-            "songPronunciation": music.get("pronunciation", ""),
+            "id": music.id,
+            "title": music.title,
+            "songPronunciation": music.pronunciation,
             "creatorArtistPronunciation": creator_pron,
             "lyricistPronunciation": lyricist_pron,
             "composerPronunciation": composer_pron,
@@ -72,16 +120,9 @@ def katakana_to_hiragana(text: str) -> str:
 
     text = unicodedata.normalize("NFC", text)
 
-    # 基本的なカタカナからひらがなへのマッピング
-    # ァ(30A1)〜ヶ(30F6) までの全対応リスト（計算で生成しても良いが、ここでは確実性を重視）
-    katakana = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワヰヱヲンガギグゲゴザジズゼゾダヂヅデドバビブベボパピプペポァィゥェォッャュョヮヴヵヶー"
-    hiragana = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわゐゑをんがぎぐげござじずぜぞだぢづでどばびぶべぼぱぴぷぺぽぁぃぅぇぉっゃゅょゎゔゕゖー"
-
-    mapping = str.maketrans(katakana, hiragana)
-
     # 濁点・半濁点の結合文字（が、ぱ等）が個別に来るケースも考慮し、
     # 最終的に文字コード計算をフォールバックとして残すか、そのまま返す
-    return text.translate(mapping)
+    return text.translate(KATAKANA_TO_HIRAGANA)
 
 
 def is_valid_phrase(phrase: str) -> bool:
@@ -92,14 +133,9 @@ def is_valid_phrase(phrase: str) -> bool:
     if not phrase:
         return False
 
-    # 許可する文字のホワイトリスト（清音、濁音、半濁音、および「ゔ」、「ー」）
+    # 許可する文字のホワイトリスト（ALLOWED_KANA）
     # ※ 小書き文字はこのリストに入っていないため、ここで最終ガードされる
-    allowed_chars = set(
-        "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんがぎぐげござじずぜぞだぢづでどばびぶべぼぱぴぷぺぽー"
-    )
-
-    # フレーズ内の全文字がホワイトリストに含まれているか確認
-    return all(char in allowed_chars for char in phrase)
+    return all(char in ALLOWED_KANA for char in phrase)
 
 
 def generate_phrases(text: str, n: int) -> list[str]:
@@ -113,8 +149,6 @@ def generate_phrases(text: str, n: int) -> list[str]:
     # ひらがなに正規化
     text = katakana_to_hiragana(text)
 
-    # 排除対象（小書き文字など）
-    unwanted_kana = set("ぁぃぅぇぉっゃゅょゎゕゖ")
     phrases = []
 
     # モーラ結合をせず、単純に1文字ずつスライド
@@ -122,7 +156,7 @@ def generate_phrases(text: str, n: int) -> list[str]:
         window = text[i : i + n]
 
         # 1. 小書き文字が含まれていたらスキップ
-        if any(char in unwanted_kana for char in window):
+        if any(char in UNWANTED_KANA for char in window):
             continue
 
         # 2. 有効な文字種（ひらがな・ー）以外が含まれていたらスキップ
@@ -136,22 +170,85 @@ def generate_phrases(text: str, n: int) -> list[str]:
 
 def get_song_all_hashes(song, n):
     """特定の曲の全項目から指定されたn文字のハッシュを抽出"""
-    target_keys = [
-        "songPronunciation",
-        "creatorArtistPronunciation",
-        "lyricistPronunciation",
-        "composerPronunciation",
-        "arrangerPronunciation",
-    ]
     raw_hashes = []
-    for key in target_keys:
+    for key in TARGET_KEYS:
         # split_into_morae を介さず直接呼ぶ
         raw_hashes.extend(generate_phrases(song.get(key, ""), n))
 
     return list(dict.fromkeys(raw_hashes))
 
 
+def phrase_segments(text):
+    """
+    ひらがなに正規化し、フレーズに使える文字だけが続く区間に分ける。
+    generate_phrases の窓は必ずどれか 1 つの区間に収まる。
+    """
+    segments = []
+    current = []
+    for char in katakana_to_hiragana(text):
+        if char in ALLOWED_KANA:
+            current.append(char)
+        elif current:
+            segments.append("".join(current))
+            current = []
+    if current:
+        segments.append("".join(current))
+    return segments
+
+
+def song_segments(song):
+    return [seg for key in TARGET_KEYS for seg in phrase_segments(song.get(key, ""))]
+
+
+def spreadsheet_uploader():
+    return SpreadsheetUploader(
+        API_URL, API_KEY, os.path.join(STATE_DIR, "upload_manifest.json")
+    )
+
+
+def resume_pending_upload(state, fingerprint, data=None):
+    """
+    前回のアップロードが失敗していれば送り直す。差分アップロードはマニフェストに
+    残った送り残しを、全件アップロードは meta の last_upload_ok が False なら全件を送る。
+    """
+    if SPREADSHEET_UPLOAD_MODE == "delta":
+        if not spreadsheet_uploader().pending():
+            return
+    elif fingerprint.get("last_upload_ok", True):
+        return
+    print("Resuming the previous failed upload...")
+    if data is None:
+        with open(OUTPUT_JSON, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    record_upload(state, fingerprint, upload_to_spreadsheet(data))
+
+
+def record_upload(state, fingerprint, ok):
+    """アップロードの成否を meta に残す（失敗していれば入力が同じでも次回送り直す）。"""
+    fingerprint["last_upload_ok"] = ok
+    save_state(state, fingerprint, index=False)
+
+
 def upload_to_spreadsheet(data):
+    """送信に成功したら True を返す。"""
+    if SPREADSHEET_UPLOAD_MODE == "delta":
+        uploader = spreadsheet_uploader()
+        try:
+            stats = uploader.upload(data)
+            if stats["chunks"]:
+                print(
+                    f"Successfully uploaded to Spreadsheet: {stats['songs']} songs, "
+                    f"{stats['removed']} removed, {stats['chunks']} chunks, "
+                    f"{stats['bytes']} bytes."
+                )
+            return True
+        except UploadError as e:
+            # 送信済みのチャンクはマニフェストに残るので、次回は残りだけを送る
+            print(f"Upload failed: {e}")
+        except Exception as e:
+            print(f"Error during upload: {e}")
+        return False
+
     # トークンとデータをラップする
     payload = {"token": API_KEY, "payload": data}
 
@@ -160,18 +257,54 @@ def upload_to_spreadsheet(data):
         response = requests.post(API_URL, json=payload, timeout=30)
         if response.status_code == 200 and response.text == "Success":
             print("Successfully uploaded to Spreadsheet.")
-        else:
-            print(f"Upload failed: {response.text} (Status: {response.status_code})")
+            return True
+        print(f"Upload failed: {response.text} (Status: {response.status_code})")
     except Exception as e:
         print(f"Error during upload: {e}")
+    return False
+
+
+def log_phase(number, message):
+    """フェーズの見出しに、その時点までのピーク RSS を添えて出す。"""
+    rss = peak_rss_mb()
+    rss_label = f" (peak RSS: {rss:.1f} MB)" if rss is not None else ""
+    print(f"--- [Phase {number}] {message} ---{rss_label}")
 
 
-def main():
-    print(f"--- [Phase 1] Loading JSON files from {BASE_PATH} ---")
+def main(force_full=False):
+    log_phase(1, f"Loading JSON files from {BASE_PATH}")
     if not os.path.exists(MUSIC_JSON):
         print(f"Error: {MUSIC_JSON} not found.")
         return
 
+    # 入力ファイルの内容が前回から変わっていなければ何もしない
+    state = PhraseState(STATE_DIR)
+    params = {"min_n": PHRASE_MIN_N, "max_n": PHRASE_MAX_N}
+    meta = state.load_meta()
+    fingerprint = input_fingerprint(
+        [MUSIC_JSON, ARTISTS_JSON, SKIP_JSON], params, previous=meta
+    )
+    # 前回のアップロードの成否は、次に送るまで引き継ぐ
+    fingerprint["last_upload_ok"] = (meta or {}).get("last_upload_ok", True)
+    if (
+        not force_full
+        and same_inputs(meta, fingerprint)
+        and os.path.exists(OUTPUT_JSON)
+    ):
+        print("No changes in input files since the last run. Skipping update.")
+        # mtime だけ変わった場合に次回ハッシュを取り直さないよう記録しておく
+        if fingerprint != meta:
+            save_state(state, fingerprint, index=False)
+        resume_pending_upload(state, fingerprint)
+        return
+    incremental = (
+        not force_full
+        and meta is not None
+        and meta.get("version") == fingerprint["version"]
+        and meta.get("params") == params
+        and os.path.exists(OUTPUT_JSON)
+    )
+
     try:
         # ファイルサイズを先にチェックしてログに出す
         m_size = os.path.getsize(MUSIC_JSON) / (1024 * 1024)
@@ -179,36 +312,63 @@ def main():
         print(f"DEBUG: MUSIC_JSON size: {m_size:.2f} MB")
         print(f"DEBUG: ARTISTS_JSON size: {a_size:.2f} MB")
 
-        print("DEBUG: Calling json.load(MUSIC_JSON)...")
-        with open(MUSIC_JSON, "r", encoding="utf-8") as f:
-            music_data = json.load(f)
+        # 1 件ずつデコードし、必要な項目だけを残す（マスターデータ全体は保持しない）
+        print("DEBUG: Streaming MUSIC_JSON...")
+        music_data = load_musics(MUSIC_JSON)
 
-        print("DEBUG: Calling json.load(ARTISTS_JSON)...")
-        with open(ARTISTS_JSON, "r", encoding="utf-8") as f:
-            artist_data = json.load(f)
+        print("DEBUG: Streaming ARTISTS_JSON...")
+        artists = load_artists(ARTISTS_JSON)
 
         print(
-            f"Successfully loaded {len(music_data)} musics and {len(artist_data)} artists."
+            f"Successfully loaded {len(music_data)} musics and {len(artists)} artists."
         )
     except Exception as e:
         print(f"Error during JSON loading: {e}")
         return
 
-    print("--- [Phase 2] Building intermediate data (Applying Skip List) ---")
-    intermediate_data = build_intermediate_data(music_data, artist_data)
+    log_phase(2, "Building intermediate data (Applying Skip List)")
+    intermediate_data = build_intermediate_data(music_data, artists)
+    del music_data, artists
     print(f"Intermediate data built. Total songs to process: {len(intermediate_data)}")
 
-    print("--- [Phase 3] Running hash generation system (n=2 to 6) ---")
+    max_label = PHRASE_MAX_N if PHRASE_MAX_N else "any"
+    log_phase(
+        3,
+        f"Running hash generation system "
+        f"(n={PHRASE_MIN_N} to {max_label}, engine={PHRASE_ENGINE})",
+    )
     # 進行状況が見えるように、この関数内でログを出すようにします
-    final_data = run_hash_generation_system(intermediate_data)
+    final_data, changed = update_search_phrases(intermediate_data, state, incremental)
+    if not changed:
+        print("No song records changed. Skipping output and upload.")
+        save_state(state, fingerprint, index=False)
+        resume_pending_upload(state, fingerprint, final_data)
+        return
     print(f"Hash generation completed for {len(final_data)} songs.")
 
-    print(f"--- [Phase 4] Writing output to {OUTPUT_JSON} ---")
+    log_phase(4, f"Writing output to {OUTPUT_JSON}")
     with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
         json.dump(final_data, f, indent=2, ensure_ascii=False)
-
-    print("--- [Phase 5] Uploading to Google Spreadsheet ---")
-    upload_to_spreadsheet(final_data)
+    saved = len(state.songs) == len(final_data)
+    if saved:
+        # 送信が終わるまでは未送信として記録する（途中で止まっても次回送り直す）
+        fingerprint["last_upload_ok"] = False
+        save_state(state, fingerprint)
+
+    log_phase(5, "Uploading to Google Spreadsheet")
+    ok = upload_to_spreadsheet(final_data)
+    if saved:
+        record_upload(state, fingerprint, ok)
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"Peak RSS for this update: {rss:.1f} MB")
+
+
+def save_state(state, fingerprint, index=True):
+    try:
+        state.save(fingerprint, index=index)
+    except OSError as e:
+        print(f"Warning: Failed to save pronunciation state: {e}")
 
 
 def is_pure_hiragana(phrase: str) -> bool:
@@ -220,40 +380,130 @@ def is_pure_hiragana(phrase: str) -> bool:
     return not any(char in impure_chars for char in phrase)
 
 
-def run_hash_generation_system(intermediate_data):
+def find_unique_phrases_counter(intermediate_data, min_n, max_n):
+    """
+    従来方式：全曲の n 文字フレーズを Counter で数え、曲ごとに他の曲に現れない
+    最短の n とそのフレーズを求める（見つからなければ None）。
+    """
+    if not max_n:
+        max_n = max(
+            (len(seg) for song in intermediate_data for seg in song_segments(song)),
+            default=min_n,
+        )
+    lengths = range(min_n, max_n + 1)
+
     print("Step 1: Counting all possible phrases...")
     all_possible_hashes = []
     for song in intermediate_data:
-        for n in [2, 3, 4, 5, 6]:
+        for n in lengths:
             hashes = get_song_all_hashes(song, n)
             all_possible_hashes.extend(hashes)
 
     global_counts = Counter(all_possible_hashes)
 
-    print("Step 2: Determining unique phrases with Pure-Hiragana priority...")
-    for i, song in enumerate(intermediate_data):
-        found = False
-        for n in [2, 3, 4, 5, 6]:
+    results = []
+    for song in intermediate_data:
+        found = None
+        for n in lengths:
             current_hashes = get_song_all_hashes(song, n)
             unique_phrases = [h for h in current_hashes if global_counts[h] == 1]
-
             if unique_phrases:
-                pure_phrases = [h for h in unique_phrases if is_pure_hiragana(h)]
+                found = (n, unique_phrases)
+                break
+        results.append(found)
+    return results
 
-                if pure_phrases:
-                    # 清音のみの候補があるなら、それだけを採用
-                    song["search_phrases"] = pure_phrases
-                else:
-                    # 全候補に濁点があるなら、仕方ないのでそのまま採用
-                    song["search_phrases"] = unique_phrases
 
-                song["phrases_count"] = n
-                found = True
-                break
+def find_unique_phrases_automaton(intermediate_data, min_n, max_n):
+    """全曲の読みの接尾辞オートマトンで、find_unique_phrases_counter と同じ結果を求める。"""
+    print("Step 1: Building suffix automaton over all pronunciations...")
+    documents = [song_segments(song) for song in intermediate_data]
+    return shortest_unique_phrases(documents, min_n, max_n or None)
+
 
-        if not found:
-            song["search_phrases"] = [song.get("songPronunciation", "UNKNOWN")]
-            song["phrases_count"] = 6
+def find_unique_phrases_numpy(intermediate_data, min_n, max_n):
+    """n-gram を int64 に詰めて NumPy で一括集計する（長さの上限は 9 文字）。"""
+    if not max_n or max_n > phrase_counts.MAX_PACKED_LEN:
+        print("Step 1: max_n is too long for packed n-grams; using suffix automaton.")
+        return find_unique_phrases_automaton(intermediate_data, min_n, max_n)
+    print("Step 1: Counting packed n-grams with NumPy...")
+    documents = [
+        [song.get(key, "") for key in TARGET_KEYS] for song in intermediate_data
+    ]
+    return phrase_counts.shortest_unique_phrases(
+        documents, KANA_CODE_TABLE, katakana_to_hiragana, min_n, max_n
+    )
+
+
+PHRASE_ENGINES = {
+    "automaton": find_unique_phrases_automaton,
+    "numpy": find_unique_phrases_numpy,
+    "counter": find_unique_phrases_counter,
+}
+
+
+def select_search_phrases(song, found, max_n=PHRASE_MAX_N):
+    """(n, 一意なフレーズ) から search_phrases / phrases_count を決める。"""
+    if not found:
+        return {
+            "search_phrases": [song.get("songPronunciation", "UNKNOWN")],
+            "phrases_count": max_n or FALLBACK_PHRASES_COUNT,
+        }
+    n, unique_phrases = found
+    pure_phrases = [h for h in unique_phrases if is_pure_hiragana(h)]
+    # 清音のみの候補があるなら、それだけを採用
+    # 全候補に濁点があるなら、仕方ないのでそのまま採用
+    return {
+        "search_phrases": pure_phrases if pure_phrases else unique_phrases,
+        "phrases_count": n,
+    }
+
+
+def update_search_phrases(intermediate_data, state, incremental):
+    """
+    差分更新できるなら変わった曲だけ計算し直し、(出力, 出力が変わったか) を返す。
+    できなければ全件計算して状態を作り直す。
+    """
+    keys = [song_key(song) for song in intermediate_data]
+    if len(set(keys)) != len(keys):
+        print("Warning: Duplicate song ids found. Running full rebuild without state.")
+        return run_hash_generation_system(intermediate_data), True
+
+    if incremental:
+        state.load_index()
+    if incremental and state.songs:
+        updated, reordered = state.update(
+            intermediate_data,
+            song_segments,
+            PHRASE_MIN_N,
+            PHRASE_MAX_N,
+            lambda song, found: select_search_phrases(song, found, PHRASE_MAX_N),
+        )
+        print(f"Incremental update: {len(updated)} songs recomputed or removed.")
+        return state.output(intermediate_data), bool(updated) or reordered
+
+    final_data = run_hash_generation_system(copy.deepcopy(intermediate_data))
+    state.rebuild(
+        intermediate_data,
+        song_segments,
+        PHRASE_MIN_N,
+        PHRASE_MAX_N,
+        [
+            {"search_phrases": s["search_phrases"], "phrases_count": s["phrases_count"]}
+            for s in final_data
+        ],
+    )
+    return final_data, True
+
+
+def run_hash_generation_system(
+    intermediate_data, engine=PHRASE_ENGINE, max_n=PHRASE_MAX_N
+):
+    results = PHRASE_ENGINES[engine](intermediate_data, PHRASE_MIN_N, max_n)
+
+    print("Step 2: Determining unique phrases with Pure-Hiragana priority...")
+    for i, (song, found) in enumerate(zip(intermediate_data, results)):
+        song.update(select_search_phrases(song, found, max_n))
 
         if (i + 1) % 100 == 0:
             print(f"  Finalized {i + 1} songs...")
@@ -268,18 +518,20 @@ def trigger_update():
     if is_processing:
         return jsonify({"status": "error", "message": "Already processing"}), 429
 
-    thread = threading.Thread(target=run_process)
+    # ?full=1 で差分更新をせず全件作り直す
+    force_full = request.args.get("full") in ("1", "true")
+    thread = threading.Thread(target=run_process, args=(force_full,))
     thread.start()
 
     return jsonify({"status": "success", "message": "Update triggered"}), 202
 
 
-def run_process():
+def run_process(force_full=False):
     global is_processing
     is_processing = True
     try:
         print("--- Starting Update Process ---")
-        main()
+        main(force_full)
         print("--- Update Process Completed ---")
     except Exception as e:
         print(f"--- Process Failed: {e} ---")
@@ -0,0 +1,221 @@
+"""
+スプレッドシートへの差分アップロード。
+
+前回までに送信に成功した曲ごとの内容ハッシュをマニフェストに記録し、変わった曲
+（と消えた曲の ID）だけを送る。送信はサイズ上限ごとのチャンクに分けて gzip で圧縮し、
+1 つの Session で順に POST する。チャンクごとにリトライし、成功したチャンクの分だけ
+マニフェストを更新するので、途中で失敗しても次回は残りから送り直す。
+
+チャンクの本文（gzip 圧縮した JSON, Content-Encoding: gzip）:
+    {"token": ..., "mode": "delta", "upload_id": ..., "index": i, "count": n,
+     "payload": [曲, ...], "removed": [曲 ID, ...]}
+受け側は payload を id で upsert し、removed の行を削除して "Success" を返す。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+
+import requests
+
+UPLOAD_CHUNK_BYTES = int(os.getenv("SPREADSHEET_CHUNK_BYTES", str(256 * 1024)))
+UPLOAD_RETRIES = int(os.getenv("SPREADSHEET_UPLOAD_RETRIES", "4"))
+UPLOAD_BACKOFF = float(os.getenv("SPREADSHEET_UPLOAD_BACKOFF", "2"))
+# (接続, 読み取り) のタイムアウト秒数
+UPLOAD_TIMEOUT = (10, 60)
+# リトライする HTTP ステータス（それ以外の失敗はその回の送信を中止する）
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class UploadError(Exception):
+    pass
+
+
+def song_hash(song):
+    data = json.dumps(song, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def _song_key(song):
+    return str(song.get("id"))
+
+
+class UploadManifest:
+    """
+    送信に成功した曲の {ID: 内容ハッシュ}。送信先の URL が変わったら空から始める。
+    incomplete は途中のチャンクで失敗して送り残しがあること。
+    """
+
+    def __init__(self, path, api_url):
+        self.path = path
+        self.api_url = api_url
+        self.songs = {}
+        self.incomplete = False
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("api_url") != self.api_url:
+            data = {}
+        self.songs = data.get("songs", {})
+        self.incomplete = data.get("incomplete", False)
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            data = {
+                "api_url": self.api_url,
+                "incomplete": self.incomplete,
+                "songs": self.songs,
+            }
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+def plan_chunks(changed, removed, max_bytes):
+    """
+    変わった曲を JSON のサイズが max_bytes 以下になるよう分ける（1 曲で超える場合は
+    その曲だけのチャンク）。削除する ID は最後のチャンクにまとめる。
+    """
+    chunks = []
+    current, size = [], 0
+    for song in changed:
+        song_size = len(json.dumps(song, ensure_ascii=False).encode("utf-8")) + 1
+        if current and size + song_size > max_bytes:
+            chunks.append({"payload": current, "removed": []})
+            current, size = [], 0
+        current.append(song)
+        size += song_size
+    if current or removed or not chunks:
+        chunks.append({"payload": current, "removed": list(removed)})
+    else:
+        chunks[-1]["removed"] = list(removed)
+    return chunks
+
+
+class SpreadsheetUploader:
+    def __init__(
+        self,
+        api_url,
+        token,
+        manifest_path,
+        chunk_bytes=UPLOAD_CHUNK_BYTES,
+        retries=UPLOAD_RETRIES,
+        backoff=UPLOAD_BACKOFF,
+        timeout=UPLOAD_TIMEOUT,
+        session=None,
+        sleep=time.sleep,
+    ):
+        self.api_url = api_url
+        self.token = token
+        self.manifest = UploadManifest(manifest_path, api_url)
+        self.chunk_bytes = chunk_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session
+        self.sleep = sleep
+
+    def pending(self):
+        """前回の送信が途中で失敗したままか。"""
+        return self.manifest.load().incomplete
+
+    def diff(self, data):
+        """(送る曲, 削除する ID, 曲ごとのハッシュ) を返す。"""
+        hashes = {_song_key(song): song_hash(song) for song in data}
+        changed = [
+            song
+            for song in data
+            if self.manifest.songs.get(_song_key(song)) != hashes[_song_key(song)]
+        ]
+        removed = [key for key in self.manifest.songs if key not in hashes]
+        return changed, removed, hashes
+
+    def _post(self, body):
+        compressed = gzip.compress(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # 指数バックオフ + ジッター
+                self.sleep(
+                    self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                )
+            try:
+                response = self.session.post(
+                    self.api_url, data=compressed, headers=headers, timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                last_error = f"{type(e).__name__}: {e}"
+                continue
+            if response.status_code == 200 and response.text == "Success":
+                return len(compressed)
+            last_error = f"{response.text[:200]} (Status: {response.status_code})"
+            if response.status_code not in RETRY_STATUSES:
+                break
+        raise UploadError(last_error)
+
+    def upload(self, data):
+        """差分を送信し、送ったチャンク数などの集計を返す。失敗したら UploadError。"""
+        self.manifest.load()
+        changed, removed, hashes = self.diff(data)
+        if not changed and not removed:
+            if self.manifest.incomplete:
+                self.manifest.incomplete = False
+                self.manifest.save()
+            print("Spreadsheet is up to date. Nothing to upload.")
+            return {"chunks": 0, "songs": 0, "removed": 0, "bytes": 0}
+
+        chunks = plan_chunks(changed, removed, self.chunk_bytes)
+        upload_id = uuid.uuid4().hex
+        print(
+            f"Uploading {len(changed)} changed and {len(removed)} removed songs "
+            f"in {len(chunks)} chunks..."
+        )
+        owns_session = self.session is None
+        if owns_session:
+            self.session = requests.Session()
+        sent_bytes = 0
+        try:
+            for index, chunk in enumerate(chunks):
+                body = {
+                    "token": self.token,
+                    "mode": "delta",
+                    "upload_id": upload_id,
+                    "index": index,
+                    "count": len(chunks),
+                    **chunk,
+                }
+                try:
+                    sent_bytes += self._post(body)
+                except UploadError as e:
+                    self.manifest.incomplete = True
+                    self.manifest.save()
+                    raise UploadError(f"chunk {index + 1}/{len(chunks)}: {e}") from None
+                # 成功したチャンクの分だけ記録する（次回はここから再開）
+                for song in chunk["payload"]:
+                    key = _song_key(song)
+                    self.manifest.songs[key] = hashes[key]
+                for key in chunk["removed"]:
+                    self.manifest.songs.pop(key, None)
+                self.manifest.incomplete = index + 1 < len(chunks)
+                self.manifest.save()
+        finally:
+            if owns_session:
+                self.session.close()
+                self.session = None
+        return {
+            "chunks": len(chunks),
+            "songs": len(changed),
+            "removed": len(removed),
+            "bytes": sent_bytes,
+        }
@@ -0,0 +1,106 @@
+"""
+差分アップロードの動作確認用の受け側スタブ（スプレッドシートの代わり）。
+
+    python upload_stub_server.py --port 8765 --fail-every 3
+    SPREADSHEET_UPLOAD_MODE=delta SEKAI_UNIQUE_API_URL=http://127.0.0.1:8765/ \\
+        python pronunciation.py
+
+受け取ったチャンク（gzip も可）を曲 ID ごとに upsert / 削除して保持し、チャンクごとに
+1 行ログを出す。--fail-every N なら N 回目ごとの POST に 503 を返す。--dump には
+受け取った結果の行を JSON で書き出し、起動時にあれば読み込む。
+"""
+
+import argparse
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, token, fail_every, dump_path):
+        self.token = token
+        self.fail_every = fail_every
+        self.dump_path = dump_path
+        self.rows = {}
+        self.requests = 0
+        # 前回の --dump があれば引き継ぐ（再起動しても受け取った行が残る）
+        if dump_path:
+            try:
+                with open(dump_path, encoding="utf-8") as f:
+                    self.rows = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def apply(self, body):
+        if "mode" not in body:
+            # 従来の全件アップロード
+            self.rows = {str(song.get("id")): song for song in body["payload"]}
+        else:
+            for song in body.get("payload", []):
+                self.rows[str(song.get("id"))] = song
+            for key in body.get("removed", []):
+                self.rows.pop(str(key), None)
+        if self.dump_path:
+            with open(self.dump_path, "w", encoding="utf-8") as f:
+                json.dump(self.rows, f, ensure_ascii=False, indent=2)
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            state.requests += 1
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if state.fail_every and state.requests % state.fail_every == 0:
+                self._reply(503, "Injected failure")
+                return
+            try:
+                if self.headers.get("Content-Encoding") == "gzip":
+                    raw = gzip.decompress(raw)
+                body = json.loads(raw)
+            except (OSError, ValueError) as e:
+                self._reply(400, f"Bad request: {e}")
+                return
+            if state.token is not None and body.get("token") != state.token:
+                self._reply(200, "Invalid token")
+                return
+            state.apply(body)
+            print(
+                f"[stub] chunk {body.get('index', 0) + 1}/{body.get('count', 1)}: "
+                f"{len(body.get('payload', []))} songs, "
+                f"{len(body.get('removed', []))} removed, {len(raw)} bytes "
+                f"-> {len(state.rows)} rows",
+                flush=True,
+            )
+            self._reply(200, "Success")
+
+        def _reply(self, status, text):
+            data = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default=None)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--dump", default="")
+    args = parser.parse_args()
+
+    state = StubState(args.token, args.fail_every, args.dump)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Stub spreadsheet listening on http://{args.host}:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()